@@ -0,0 +1,136 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sparse
+
+
+class ImplicitALS:
+    """
+    Alternating least squares for implicit feedback (Hu, Koren & Volinsky 2008).
+
+    Every stored entry of the ratings matrix is a positive preference (p = 1).
+    Its confidence is c = 1 + alpha * w, where w is the rating for explicit
+    ratings (1-10) and implicit_weight for the implicit 0 ratings, so a rated 0
+    counts as a weak "interacted" signal instead of a dislike. Unobserved cells
+    have p = 0 and c = 1.
+
+    Each half-step solves, for every user u (and symmetrically every item),
+        (Y^T Y + Y^T (C_u - I) Y + reg * I) x_u = Y^T C_u p_u
+    with a few conjugate-gradient steps warm-started from the previous factors.
+    A CG step costs O(nnz * factors): the (C_u - I) term is applied through
+    sparse @ dense products and Y^T Y is shared by all rows. Rows are processed
+    in blocks across a thread pool (NumPy/BLAS release the GIL).
+
+    After fit(), user_features is (n_users, factors) and item_features is
+    (factors, n_items), the same layout as the NMF artifacts the app reads.
+    """
+
+    def __init__(self, factors: int = 30, regularization: float = 0.1, alpha: float = 2.0,
+                 implicit_weight: float = 1.0, iterations: int = 15, cg_steps: int = 3,
+                 dtype=np.float32, n_jobs: int = None, block_nnz: int = 1_000_000,
+                 random_state: int = 42, verbose: bool = False):
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.implicit_weight = implicit_weight
+        self.iterations = iterations
+        self.cg_steps = cg_steps
+        self.dtype = np.dtype(dtype)
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.block_nnz = block_nnz
+        self.random_state = random_state
+        self.verbose = verbose
+        self.user_factors = None
+        self.item_factors = None
+
+    @property
+    def user_features(self) -> np.ndarray:
+        return self.user_factors
+
+    @property
+    def item_features(self) -> np.ndarray:
+        return self.item_factors.T
+
+    def get_params(self) -> dict:
+        return {name: getattr(self, name) for name in
+                ('factors', 'regularization', 'alpha', 'implicit_weight', 'iterations', 'cg_steps')}
+
+    def confidence(self, ratings: np.ndarray) -> np.ndarray:
+        """c - 1 for stored ratings (0 = implicit, 1-10 = explicit)."""
+        weight = np.where(ratings > 0, ratings, self.implicit_weight)
+        return (self.alpha * weight).astype(self.dtype)
+
+    def fit(self, user_items: sparse.csr_matrix, user_factors=None, item_factors=None) -> 'ImplicitALS':
+        """
+        user_items holds the raw ratings (users x items). user_factors /
+        item_factors optionally warm-start the solver, e.g. from a previous model.
+        """
+        Cu = sparse.csr_matrix(user_items, dtype=self.dtype, copy=True)
+        Cu.data = self.confidence(Cu.data)
+        Ci = Cu.T.tocsr()
+
+        rng = np.random.default_rng(self.random_state)
+        n_users, n_items = Cu.shape
+        X = self._init(user_factors, (n_users, self.factors), rng)
+        Y = self._init(item_factors, (n_items, self.factors), rng)
+
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+            for it in range(self.iterations):
+                t0 = time.perf_counter()
+                self._solve(Cu, Y, X, pool)
+                self._solve(Ci, X, Y, pool)
+                if self.verbose:
+                    print(f"  ALS iteration {it + 1}/{self.iterations}: {time.perf_counter() - t0:.2f}s")
+
+        self.user_factors, self.item_factors = X, Y
+        return self
+
+    def _init(self, factors, shape, rng) -> np.ndarray:
+        out = (rng.standard_normal(shape) * 0.01).astype(self.dtype)
+        if factors is not None:
+            factors = np.asarray(factors, dtype=self.dtype)
+            out[:factors.shape[0]] = factors
+        return out
+
+    def _blocks(self, C: sparse.csr_matrix):
+        """Row ranges holding roughly block_nnz stored entries each."""
+        n = C.shape[0]
+        ends = np.searchsorted(C.indptr, np.arange(self.block_nnz, C.nnz, self.block_nnz), side='right') - 1
+        bounds = np.unique(np.concatenate([[0], ends, [n]]))
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _solve(self, C: sparse.csr_matrix, Y: np.ndarray, X: np.ndarray, pool):
+        """Updates X in place: X[u] solves the ALS normal equations against fixed Y."""
+        YtY = Y.T @ Y + self.regularization * np.eye(self.factors, dtype=self.dtype)
+        list(pool.map(lambda b: self._solve_block(C[b[0]:b[1]], Y, YtY, X, b[0]), self._blocks(C)))
+
+    def _solve_block(self, C: sparse.csr_matrix, Y: np.ndarray, YtY: np.ndarray, X: np.ndarray, start: int):
+        rows = np.repeat(np.arange(C.shape[0]), np.diff(C.indptr))
+        Yc = Y[C.indices]
+
+        def apply_a(P):
+            # (YtY + reg I) P + sum_i (c_ui - 1) y_i y_i^T p_u, without forming A
+            t = np.einsum('ef,ef->e', Yc, P[rows]) * C.data
+            return P @ YtY + sparse.csr_matrix((t, C.indices, C.indptr), shape=C.shape) @ Y
+
+        # b_u = Y^T C_u p_u = sum_i (1 + (c_ui - 1)) y_i
+        b = sparse.csr_matrix((C.data + 1, C.indices, C.indptr), shape=C.shape) @ Y
+
+        x = X[start:start + C.shape[0]]
+        r = b - apply_a(x)
+        p = r.copy()
+        rs_old = np.einsum('uf,uf->u', r, r)
+        for _ in range(self.cg_steps):
+            active = rs_old > 1e-20
+            if not active.any():
+                break
+            Ap = apply_a(p)
+            alpha = np.where(active, rs_old / np.maximum(np.einsum('uf,uf->u', p, Ap), 1e-20), 0)
+            x += alpha[:, None] * p
+            r -= alpha[:, None] * Ap
+            rs_new = np.einsum('uf,uf->u', r, r)
+            p = r + np.where(active, rs_new / np.maximum(rs_old, 1e-20), 0)[:, None] * p
+            rs_old = rs_new
+
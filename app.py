@@ -1,45 +1,145 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import pickle
 import os
 import sqlite3
-from PIL import Image, ImageDraw
+import threading
+import time
+import db
+import metrics
+import components
+from cache import LRUCache
 
 # Page Config
 st.set_page_config(page_title="Readora Online Bookshop", page_icon="📚", layout="wide")
+render_start = time.perf_counter()
+
+# User-IDs allowed to see the Performance page (comma-separated)
+ADMIN_USERS = {int(u) for u in os.environ.get('READORA_ADMIN_USERS', '').split(',') if u.strip()}
+
+# Load the remaining subsystems in a background thread after the first render (READORA_PREFETCH=0: on demand only)
+PREFETCH = os.environ.get('READORA_PREFETCH', '1') != '0'
+
+# Highly rated books listed per page on My Ratings
+RATINGS_PAGE_SIZE = 20
 
 # Helper for placeholder image
 def get_placeholder_image(text="No Image"):
+    from PIL import Image, ImageDraw
     img = Image.new('RGB', (120, 180), color=(200, 200, 200))
     d = ImageDraw.Draw(img)
     d.text((30, 80), text, fill=(0, 0, 0))
     return img
 
-# Load Models (Cached)
 @st.cache_resource
+def loaded_model_version():
+    return components.model_version()
+
+if loaded_model_version() != components.model_version():
+    # A new model was trained since this process loaded one: reload every cached resource
+    st.cache_resource.clear()
+
+# Subsystems (Cached). Each loads the first time a page needs it, see components.py
+@st.cache_resource
+@metrics.timed('load', component='models')
 def load_models():
-    if not os.path.exists('models/nmf_model.pkl'):
-        return None, None, None
-        
-    with open('models/nmf_model.pkl', 'rb') as f:
-        model_data = pickle.load(f)
-    with open('models/mappings.pkl', 'rb') as f:
-        mappings = pickle.load(f)
-    books = pd.read_pickle('models/books_metadata.pkl')
-    return model_data, mappings, books
+    return components.load_models()
 
-model_data, mappings, books_df = load_models()
+@st.cache_resource
+@metrics.timed('load', component='rating_stats')
+def load_rating_stats():
+    return components.load_rating_stats()
 
-if model_data is None:
-    st.error("Model not found. Please train the model first.")
-    st.stop()
+@st.cache_resource
+@metrics.timed('load', component='search_index')
+def load_search_index():
+    return components.load_search_index()
+
+@st.cache_resource
+@metrics.timed('load', component='recommender')
+def load_recommender():
+    return components.load_recommender(require_models())
+
+@st.cache_resource
+@metrics.timed('load', component='top_n')
+def load_top_n():
+    return components.load_top_n()
+
+@st.cache_resource
+@metrics.timed('load', component='similar_items')
+def load_similar_items():
+    return components.load_similar_items()
+
+@st.cache_resource
+@metrics.timed('load', component='fold_in')
+def load_fold_in():
+    return components.load_fold_in(require_models())
 
-user_features = model_data['user_features']
-item_features = model_data['item_features']
-user_to_index = mappings['user_to_index']
-index_to_book = mappings['index_to_book']
-book_to_index = mappings['book_to_index']
+@st.cache_resource(max_entries=2)
+@metrics.timed('load', component='rating_history')
+def load_rating_history(stamp):
+    # Keyed on the store and database mtimes: a rebuilt store or a database change loads again
+    return components.load_rating_history()
+
+def current_rating_history():
+    return load_rating_history(components.rating_history_stamp())
+
+@st.cache_resource
+def load_service_client():
+    return components.load_service_client()
+
+def require_models():
+    artifacts = load_models()
+    if artifacts is None:
+        st.error("Model not found. Please train the model first.")
+        st.stop()
+    return artifacts
+
+def get_book_store():
+    return require_models().book_store
+
+def get_catalogue():
+    return components.catalogue(require_models())
+
+@metrics.timed('search')
+def search_books(query, limit=20):
+    book_store = get_book_store()
+    search_index = load_search_index()
+    if search_index is not None:
+        return book_store.get_many_by_index(search_index.search(query, limit))
+    books = book_store.frame[book_store.has_metadata]
+    return books[
+        books['Book-Title'].str.contains(query, case=False, na=False, regex=False) |
+        books['Book-Author'].str.contains(query, case=False, na=False, regex=False)
+    ].head(limit)
+
+@st.cache_resource
+def load_caches():
+    # Shared by all sessions of this process; keys carry the model version (and the report mtime)
+    return {
+        'recommendations': LRUCache(max_entries=10000, max_bytes=16 * 2**20, ttl=600),
+        'history': LRUCache(max_entries=2000, max_bytes=128 * 2**20, ttl=300),
+        'popular': LRUCache(max_entries=8, max_bytes=16 * 2**20),
+    }
+
+caches = load_caches()
+model_key = loaded_model_version()
+
+def prefetch():
+    # In the order pages need them; a loader already running in a session is awaited, not repeated
+    if load_models() is None:
+        return
+    for loader in (load_search_index, load_rating_stats, load_recommender, load_top_n, load_fold_in,
+                   load_similar_items, current_rating_history):
+        loader()
+
+@st.cache_resource
+def start_prefetch():
+    # Once per process (again after a model change). st.cache_resource is process-wide, so the
+    # thread needs no session context and never renders anything
+    thread = threading.Thread(target=prefetch, name='readora-prefetch', daemon=True)
+    thread.start()
+    return thread
 
 # Sample Users
 sample_users = {
@@ -58,7 +158,10 @@ current_user_id = sample_users[selected_user_label]
 
 st.sidebar.markdown("---")
 # Removed "Search" from navigation
-page = st.sidebar.radio("Navigation", ["Home", "Recommendations", "My Ratings"])
+pages = ["Home", "Recommendations", "My Ratings"]
+if current_user_id in ADMIN_USERS:
+    pages.append("Performance")
+page = st.sidebar.radio("Navigation", pages)
 
 # Initialize session state for book selection
 if 'selected_isbn' not in st.session_state:
@@ -71,26 +174,83 @@ def clear_selection():
     st.session_state.selected_isbn = None
 
 # Helper to get book details
+@metrics.timed('book_details')
 def get_book_details(isbn):
-    book = books_df[books_df['ISBN'] == isbn]
-    if not book.empty:
-        return book.iloc[0]
-    return None
+    # Books the model does not know (listed on My Ratings) come from the full catalogue
+    book = get_book_store().get(isbn)
+    return book if book is not None else get_catalogue().get(isbn)
 
+@metrics.timed('avg_rating')
 def get_avg_rating(isbn):
-    # This is expensive if we do it every time, but for single book detail it's fine.
-    # Ideally we should have this precomputed.
-    # Let's check if it's in the popular books csv, otherwise query DB.
+    # Precomputed by train_model.py; only older model folders fall back to the DB.
+    rating_stats = load_rating_stats()
+    if rating_stats is not None:
+        stats = rating_stats.get(isbn)
+        return float(stats['mean']) if stats is not None else 0.0
+    try:
+        avg = db.avg_rating(isbn)
+    except sqlite3.Error:
+        avg = None
+    return float(avg) if avg is not None else 0.0
+
+def cache_statistics():
+    # {cache name: LRUCache.stats()} of the page data caches
+    return {name: cache.stats() for name, cache in caches.items()}
+
+def user_history(user_id):
+    # The user's ratings for My Ratings when there is no history store; re-read from the database after the TTL
+    return caches['history'].get_or_compute((user_id, model_key), lambda: db.user_ratings(user_id))
+
+def rating_history(user_id):
+    # Precomputed histories of all users (history_store.py), or this user's database rows when it is missing or stale
+    history = current_rating_history()
+    if history is not None:
+        return history
+    from history_store import RatingHistory
+    return RatingHistory.from_ratings(user_history(user_id))
+
+def popular_books(n=10):
+    path = components.popular_path
+    key = (os.stat(path).st_mtime_ns, n)
+    return caches['popular'].get_or_compute(key, lambda: components.load_popular(n, path))
+
+def recommend_for(user_id, k=10):
+    """Item indices of the user's top k books, or None when the model has nothing for them (cold start)."""
+    return caches['recommendations'].get_or_compute((user_id, k, model_key),
+                                                    lambda: compute_recommendations(user_id, k))
+
+@metrics.timed('recommend')
+def compute_recommendations(user_id, k=10):
+    book_store = get_book_store()
+    service = load_service_client()
+    if service is not None:
+        try:
+            books = service.recommend(user_id, k=k)['books']
+            return book_store.indices_of([b['ISBN'] for b in books]) if books else None
+        except (OSError, ValueError):
+            pass  # Service unreachable: score in this process
+
+    recommender = load_recommender()
     try:
-        conn = sqlite3.connect('database/user_rate_book.db')
-        query = f"SELECT AVG(`Book-Rating`) as avg_rating FROM Ratings WHERE ISBN='{isbn}'"
-        df = pd.read_sql(query, conn)
-        conn.close()
-        if not df.empty and pd.notna(df.iloc[0]['avg_rating']):
-            return df.iloc[0]['avg_rating']
-    except:
-        pass
-    return 0.0
+        projection = load_fold_in().project(user_id)
+    except sqlite3.Error:
+        projection = None
+    
+    if projection is not None and projection.stale:
+        # Unseen user or ratings newer than the model: fold the current ratings in
+        top_indices, _ = recommender.top_k_vectors(projection.vector, [projection.item_indices], k=k)
+        return top_indices[0][top_indices[0] >= 0]
+    user_map = require_models().user_map
+    if user_id in user_map:
+        # Top k unrated books with metadata: precomputed table first, live scoring otherwise
+        u_idx = user_map[user_id]
+        top_n = load_top_n()
+        if top_n is not None and u_idx < len(top_n):
+            recommendations, _ = top_n.get(u_idx, k=k)
+            return recommendations
+        top_indices, _ = recommender.recommend([user_id], k=k)
+        return top_indices[0][top_indices[0] >= 0]
+    return None
 
 # View: Book Detail
 if st.session_state.selected_isbn:
@@ -110,6 +270,11 @@ if st.session_state.selected_isbn:
             
             avg_r = get_avg_rating(book['ISBN'])
             st.metric("Average Rating", f"{avg_r:.2f} / 10")
+            rating_stats = load_rating_stats()
+            stats = rating_stats.get(book['ISBN']) if rating_stats is not None else None
+            if stats is not None:
+                explicit = f"{stats['explicit_mean']:.2f}" if stats['explicit_count'] else "-"
+                st.caption(f"{int(stats['count'])} ratings · {explicit} avg of explicit ratings · weighted score {stats['score']:.2f}")
             
             st.markdown("### Description")
             # Generate description
@@ -127,6 +292,25 @@ if st.session_state.selected_isbn:
             st.markdown(desc)
             
             st.caption(f"ISBN: {book['ISBN']}")
+        
+        similar_items = load_similar_items()
+        if similar_items is not None:
+            book_store = get_book_store()
+            neighbors, _ = similar_items.get(book_store.index_of(book['ISBN']), k=5)
+            similar = book_store.get_many_by_index(neighbors)
+            if not similar.empty:
+                st.markdown("### Readers also liked")
+                cols = st.columns(5)
+                for i, (_, other) in enumerate(similar.iterrows()):
+                    with cols[i % 5]:
+                        if pd.notna(other['Image-URL-M']):
+                            st.image(other['Image-URL-M'], use_container_width=True)
+                        else:
+                            st.image(get_placeholder_image(), use_container_width=True)
+                        st.markdown(f"**{other['Book-Title']}**")
+                        st.caption(f"{other['Book-Author']}")
+                        st.button("View Details", key=f"sim_btn_{other['ISBN']}",
+                                  on_click=select_book, args=(other['ISBN'],))
             
     else:
         st.error("Book details not found.")
@@ -142,10 +326,7 @@ elif page == "Home":
     
     if search_query:
         st.subheader("Search Results")
-        results = books_df[
-            books_df['Book-Title'].str.contains(search_query, case=False, na=False) | 
-            books_df['Book-Author'].str.contains(search_query, case=False, na=False)
-        ].head(20)
+        results = search_books(search_query, limit=20)
         
         if not results.empty:
             for idx, book in results.iterrows():
@@ -178,7 +359,7 @@ elif page == "Home":
     
     st.subheader("Popular Books")
     try:
-        popular = pd.read_csv('reports/popular_books_weighted.csv').head(10)
+        popular = popular_books(10)
         
         cols = st.columns(5)
         for idx, row in popular.iterrows():
@@ -208,33 +389,12 @@ elif page == "Home":
 elif page == "Recommendations":
     st.title("Recommended for You")
     
-    if current_user_id in user_to_index:
-        u_idx = user_to_index[current_user_id]
-        
-        user_vector = user_features[u_idx, :]
-        predicted_ratings = np.dot(user_vector, item_features)
-        
-        top_indices = predicted_ratings.argsort()[::-1]
-        
-        conn = sqlite3.connect('database/user_rate_book.db')
-        rated_books = pd.read_sql(f"SELECT ISBN FROM Ratings WHERE `User-ID`={current_user_id}", conn)['ISBN'].astype(str).values
-        conn.close()
-        
-        recommendations = []
-        count = 0
-        for idx in top_indices:
-            isbn = index_to_book[idx]
-            if isbn not in rated_books:
-                book = get_book_details(isbn)
-                if book is not None:
-                    recommendations.append(book)
-                    count += 1
-                if count >= 10:
-                    break
-        
+    recommendations = recommend_for(current_user_id, k=10)
+    
+    if recommendations is not None:
         # Display
         cols = st.columns(5)
-        for i, book in enumerate(recommendations):
+        for i, (_, book) in enumerate(get_book_store().get_many_by_index(recommendations).iterrows()):
             col = cols[i % 5]
             with col:
                 if pd.notna(book['Image-URL-M']):
@@ -253,9 +413,9 @@ elif page == "Recommendations":
                     st.rerun()
                 
     else:
-        st.warning("User not found in training data (cold start or filtered out). Showing popular books.")
+        st.warning("No ratings on books the model knows yet (cold start). Showing popular books.")
         try:
-            popular = pd.read_csv('reports/popular_books_weighted.csv').head(10)
+            popular = popular_books(10)
             cols = st.columns(5)
             for idx, row in popular.iterrows():
                 col = cols[idx % 5]
@@ -277,47 +437,90 @@ elif page == "Recommendations":
 elif page == "My Ratings":
     st.title("My Ratings Analysis")
     
-    conn = sqlite3.connect('database/user_rate_book.db')
-    my_ratings = pd.read_sql(f"SELECT * FROM Ratings WHERE `User-ID`={current_user_id}", conn)
-    conn.close()
+    history = rating_history(current_user_id)
+    my_ratings = history.user_ratings(current_user_id)
     
-    if not my_ratings.empty:
-        my_ratings['Book-Rating'] = pd.to_numeric(my_ratings['Book-Rating'], errors='coerce')
-        
+    if len(my_ratings):
         col1, col2 = st.columns(2)
         with col1:
             st.metric("Total Ratings", len(my_ratings))
         with col2:
-            st.metric("Average Rating", f"{my_ratings['Book-Rating'].mean():.2f}")
+            st.metric("Average Rating", f"{my_ratings.mean():.2f}")
         
         st.divider()
         st.subheader("Books you rated highly (9-10)")
-        high_rated = my_ratings[my_ratings['Book-Rating'] >= 9]
+        # Highest ratings come first, so the 9-10s are a prefix of the history; only the shown page is read
+        n_high = history.count_at_least(current_user_id, 9)
         
-        if not high_rated.empty:
-            for idx, row in high_rated.iterrows():
-                book = get_book_details(str(row['ISBN']))
-                if book is not None:
-                    with st.container():
-                        c1, c2, c3 = st.columns([1, 5, 1])
+        if n_high:
+            n_pages = (n_high - 1) // RATINGS_PAGE_SIZE + 1
+            page_number = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1,
+                                          key="my_ratings_page") if n_pages > 1 else 1
+            start = (page_number - 1) * RATINGS_PAGE_SIZE
+            shown = history.page(current_user_id, start, min(start + RATINGS_PAGE_SIZE, n_high))
+            # Every rated book is listed; only ISBNs missing from Books have no metadata
+            from history_store import with_metadata
+            high_rated_books = with_metadata(shown, get_catalogue())
+            st.caption(f"{start + 1}-{start + len(high_rated_books)} of {n_high}")
+            for i, book in high_rated_books.iterrows():
+                with st.container():
+                    c1, c2, c3 = st.columns([1, 5, 1])
+                    if pd.isna(book['Book-Title']):
                         with c1:
-                            if pd.notna(book['Image-URL-M']):
-                                st.image(book['Image-URL-M'], width=60)
+                            st.image(get_placeholder_image("No Img"), width=60)
                         with c2:
-                            st.write(f"**{book['Book-Title']}** - ⭐ {row['Book-Rating']}")
-                            st.caption(f"Author: {book['Book-Author']}")
-                        with c3:
-                            if st.button("Details", key=f"my_btn_{row['ISBN']}"):
-                                select_book(str(row['ISBN']))
-                                st.rerun()
+                            st.write(f"**ISBN {book['ISBN']}** - ⭐ {book['Book-Rating']}")
+                            st.caption("Not in the catalogue")
+                        continue
+                    with c1:
+                        if pd.notna(book['Image-URL-M']):
+                            st.image(book['Image-URL-M'], width=60)
+                    with c2:
+                        st.write(f"**{book['Book-Title']}** - ⭐ {book['Book-Rating']}")
+                        st.caption(f"Author: {book['Book-Author']}")
+                    with c3:
+                        if st.button("Details", key=f"my_btn_{start + i}_{book['ISBN']}"):
+                            select_book(str(book['ISBN']))
+                            st.rerun()
         else:
             st.info("No highly rated books found.")
             
         # Plot distribution
         st.divider()
         st.subheader("Rating Distribution")
-        rating_counts = my_ratings['Book-Rating'].value_counts().sort_index()
-        st.bar_chart(rating_counts)
+        values, counts = np.unique(my_ratings, return_counts=True)
+        st.bar_chart(pd.Series(counts, index=values, name="count"))
         
     else:
         st.info("You haven't rated any books yet.")
+
+elif page == "Performance":
+    st.title("Performance")
+    st.caption(f"Since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(metrics.registry.started))} · "
+               f"model {model_key} · metrics {'enabled' if metrics.ENABLED else 'disabled (READORA_METRICS=0)'}")
+    
+    st.subheader("Latency")
+    st.dataframe(metrics.summary(), hide_index=True, use_container_width=True)
+    
+    st.subheader("Caches")
+    cache_stats = cache_statistics()
+    st.dataframe(pd.DataFrame.from_dict(cache_stats, orient='index'), use_container_width=True)
+    
+    st.subheader("SQLite Queries")
+    st.dataframe(db.query_timings(), hide_index=True, use_container_width=True)
+    
+    exposition = metrics.prometheus(
+        gauges={'cache_entries': {(('cache', n),): c['entries'] for n, c in cache_stats.items()},
+                'cache_bytes': {(('cache', n),): c['bytes'] for n, c in cache_stats.items()}},
+        counters={'cache_hits': {(('cache', n),): c['hits'] for n, c in cache_stats.items()},
+                  'cache_misses': {(('cache', n),): c['misses'] for n, c in cache_stats.items()}})
+    st.download_button("Download Prometheus metrics", exposition, file_name="readora_metrics.prom",
+                       mime="text/plain")
+    with st.expander("Prometheus text format"):
+        st.code(exposition, language=None)
+
+metrics.observe('render', time.perf_counter() - render_start,
+                page="Book Detail" if st.session_state.selected_isbn else page)
+
+if PREFETCH:
+    start_prefetch()
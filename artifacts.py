@@ -0,0 +1,182 @@
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+from book_store import BookStore, ColumnarBookStore
+from id_map import IdMap, load_mappings
+
+models_dir = 'models'
+FORMAT_VERSION = 2
+KEEP_VERSIONS = 3
+
+
+class ModelArtifacts:
+    """
+    Everything the serving side needs from a trained model: factors, the
+    training matrix (to mask rated books), the User-ID mapping and the book
+    metadata (plus, for versions that recorded it, the metadata of every book
+    in the Books table as catalogue; None otherwise).
+
+    save() writes a version directory under models/artifacts/:
+        manifest.json                        engine, params, shapes, training state
+        user_features.npy / item_features.npy float32 factors
+        user_items.{indptr,indices,data}.npy  training matrix as CSR arrays
+        user_ids.*.npy / isbns.*.npy         User-ID and ISBN IdMaps
+        books.<column>.{data,offsets,null}.npy  metadata columns (StringColumn)
+        catalogue.books.* / catalogue.isbns.*  the same for every book in Books (My Ratings)
+    and then points models/artifacts/CURRENT at it. load() memory-maps the
+    arrays, so loading is cheap, the pages are shared between processes and
+    nothing is unpickled (no scikit-learn import).
+    """
+
+    def __init__(self, manifest: dict, user_features, item_features, user_items, user_map: IdMap, book_store,
+                 catalogue=None):
+        self.manifest = manifest
+        self.user_features = user_features
+        self.item_features = item_features
+        self.user_items = user_items
+        self.user_map = user_map
+        self.book_store = book_store
+        self.catalogue = catalogue
+
+    @property
+    def version(self) -> str:
+        return self.manifest.get('version')
+
+    @property
+    def watermark(self):
+        """Highest Ratings rowid the model was trained on, or None if it was not recorded."""
+        return self.manifest.get('training_state', {}).get('watermark')
+
+    @property
+    def model_data(self) -> dict:
+        """The subset of the legacy nmf_model.pkl dict used for scoring and fold-in."""
+        return {'engine': self.manifest['engine'], 'params': self.manifest.get('params', {}),
+                'user_features': self.user_features, 'item_features': self.item_features}
+
+    @staticmethod
+    def current_path(models_dir: str = models_dir):
+        """Directory of the current version, or None if no version was written."""
+        pointer = os.path.join(models_dir, 'artifacts', 'CURRENT')
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer) as f:
+            path = os.path.join(models_dir, 'artifacts', f.read().strip())
+        return path if os.path.isdir(path) else None
+
+    @classmethod
+    def load(cls, path: str = None, models_dir: str = models_dir):
+        """Memory-maps a version directory (the current one by default); None if there is none."""
+        path = path or cls.current_path(models_dir)
+        if path is None:
+            return None
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != FORMAT_VERSION:
+            return None
+
+        def array(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+        user_items = sparse.csr_matrix(
+            (array('user_items.data'), array('user_items.indices'), array('user_items.indptr')),
+            shape=tuple(manifest['user_items_shape']), copy=False)
+        catalogue = None
+        if os.path.exists(os.path.join(path, 'catalogue.isbns.keys.npy')):
+            catalogue = ColumnarBookStore.load(path, 'catalogue.')
+        return cls(manifest, array('user_features'), array('item_features'), user_items,
+                   IdMap.load(path, 'user_ids'), ColumnarBookStore.load(path), catalogue)
+
+    @classmethod
+    def load_legacy(cls, models_dir: str = models_dir):
+        """Same view over the pickled artifacts of older training runs; None if they are missing."""
+        model_path = os.path.join(models_dir, 'nmf_model.pkl')
+        matrix_path = os.path.join(models_dir, 'user_item_matrix.npz')
+        if not os.path.exists(model_path) or not os.path.exists(matrix_path):
+            return None
+        with open(model_path, 'rb') as f:
+            model_data = pickle.load(f)
+        user_map, book_map = load_mappings(models_dir)
+        store_path = os.path.join(models_dir, 'book_store.pkl')
+        if os.path.exists(store_path):
+            store = BookStore.load(store_path)
+        else:
+            store = BookStore.build(pd.read_pickle(os.path.join(models_dir, 'books_metadata.pkl')),
+                                    book_map.ids(range(len(book_map))))
+        manifest = {'engine': model_data.get('engine', 'nmf'), 'params': model_data.get('params', {})}
+        return cls(manifest, model_data['user_features'], model_data['item_features'],
+                   sparse.load_npz(matrix_path).tocsr(), user_map, store)
+
+    @classmethod
+    def load_any(cls, models_dir: str = models_dir):
+        """The current version if there is one, else the legacy pickles (None if neither exists)."""
+        artifacts = cls.load(models_dir=models_dir)
+        return artifacts if artifacts is not None else cls.load_legacy(models_dir)
+
+    @staticmethod
+    def save(model_data: dict, user_items: sparse.csr_matrix, user_ids, book_store: BookStore,
+             state: dict = None, models_dir: str = models_dir, catalogue: BookStore = None) -> str:
+        """
+        Writes a new version and makes it current. The version directory is
+        filled under a temporary name and renamed when complete, then CURRENT is
+        replaced atomically, so readers only ever see whole versions. All but the
+        newest KEEP_VERSIONS versions are removed. catalogue (the metadata of
+        every book, not only the model's) is stored with it when given.
+        Returns the version name.
+        """
+        root = os.path.join(models_dir, 'artifacts')
+        os.makedirs(root, exist_ok=True)
+        version = time.strftime('%Y%m%d-%H%M%S')
+        suffix = 0
+        while os.path.exists(os.path.join(root, version + (f'-{suffix}' if suffix else ''))):
+            suffix += 1
+        version += f'-{suffix}' if suffix else ''
+        tmp = os.path.join(root, f'.{version}.tmp')
+        os.makedirs(tmp)
+
+        user_items = sparse.csr_matrix(user_items)
+        arrays = {
+            'user_features': np.asarray(model_data['user_features'], dtype=np.float32),
+            'item_features': np.asarray(model_data['item_features'], dtype=np.float32),
+            'user_items.indptr': user_items.indptr.astype(np.int64),
+            'user_items.indices': user_items.indices.astype(np.int32),
+            'user_items.data': user_items.data.astype(np.float32),
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp, f'{name}.npy'), values)
+        IdMap.build(user_ids).save(tmp, 'user_ids')
+        book_store.save_columns(tmp)
+        if catalogue is not None:
+            catalogue.save_columns(tmp, 'catalogue.')
+
+        manifest = {
+            'format': FORMAT_VERSION,
+            'version': version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'engine': model_data.get('engine', 'nmf'),
+            'params': model_data.get('params', {}),
+            'n_users': int(user_items.shape[0]),
+            'n_items': int(user_items.shape[1]),
+            'factors': int(arrays['user_features'].shape[1]),
+            'user_items_shape': list(user_items.shape),
+            'training_state': state or {},
+        }
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2, default=float)
+
+        os.rename(tmp, os.path.join(root, version))
+        with open(os.path.join(root, 'CURRENT.tmp'), 'w') as f:
+            f.write(version)
+        os.replace(os.path.join(root, 'CURRENT.tmp'), os.path.join(root, 'CURRENT'))
+
+        versions = sorted(name for name in os.listdir(root)
+                          if not name.startswith('.') and os.path.isdir(os.path.join(root, name)))
+        for old in versions[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+        return version
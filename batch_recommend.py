@@ -0,0 +1,115 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from artifacts import ModelArtifacts
+from components import is_current, model_version, write_version
+from recommender import Recommender
+
+models_dir = 'models'
+ITEMS_FILE = 'top_n_items.npy'
+SCORES_FILE = 'top_n_scores.npy'
+
+
+def load_recommender(models_dir: str = models_dir) -> Recommender:
+    artifacts = ModelArtifacts.load_any(models_dir)
+    return Recommender(artifacts.user_features, artifacts.item_features, artifacts.user_items,
+                       artifacts.user_map, candidate_mask=artifacts.book_store.has_metadata)
+
+
+class TopNTable:
+    """
+    Precomputed top-N item indices (int32) and scores (float32) per user row,
+    memory-mapped from models/. Slots without a recommendation hold -1.
+    """
+
+    def __init__(self, items: np.ndarray, scores: np.ndarray):
+        self.items = items
+        self.scores = scores
+
+    @classmethod
+    def load(cls, models_dir: str = models_dir):
+        """Returns None when the table is missing or was built for another model version."""
+        items_path = os.path.join(models_dir, ITEMS_FILE)
+        scores_path = os.path.join(models_dir, SCORES_FILE)
+        if not (is_current(items_path, models_dir) and os.path.exists(scores_path)):
+            return None
+        return cls(np.load(items_path, mmap_mode='r'), np.load(scores_path, mmap_mode='r'))
+
+    def __len__(self):
+        return self.items.shape[0]
+
+    def get(self, user_row: int, k: int = 10):
+        items = np.asarray(self.items[user_row, :k])
+        scores = np.asarray(self.scores[user_row, :k])
+        keep = items >= 0
+        return items[keep], scores[keep]
+
+
+# ---------------------------
+# Worker processes
+# ---------------------------
+_worker_recommender = None
+
+
+def _init_worker(models_dir: str, blas_threads: int):
+    global _worker_recommender
+    # One BLAS thread per process: the parallelism comes from the pool
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(blas_threads)
+    _worker_recommender = load_recommender(models_dir)
+
+
+def _score_chunk(bounds):
+    start, stop, n = bounds
+    indices, scores = _worker_recommender.top_k(np.arange(start, stop), n)
+    indices = np.where(np.isfinite(scores), indices, -1).astype(np.int32)
+    scores = np.where(np.isfinite(scores), scores, 0.0).astype(np.float32)
+    return start, indices, scores
+
+
+def run(n: int = 50, chunk_size: int = 1024, workers: int = None, models_dir: str = models_dir):
+    # Read before loading: if a new model lands meanwhile, the table is recorded as the older one's
+    version = model_version(models_dir)
+    recommender = load_recommender(models_dir)
+    n_users = recommender.user_features.shape[0]
+    n = min(n, recommender.n_items)
+    workers = workers or os.cpu_count() or 1
+    del recommender
+
+    # Write to temporary files first so the app never maps a half-written table
+    items_tmp = os.path.join(models_dir, ITEMS_FILE + '.tmp')
+    scores_tmp = os.path.join(models_dir, SCORES_FILE + '.tmp')
+    items_out = np.lib.format.open_memmap(items_tmp, mode='w+', dtype=np.int32, shape=(n_users, n))
+    scores_out = np.lib.format.open_memmap(scores_tmp, mode='w+', dtype=np.float32, shape=(n_users, n))
+
+    chunks = [(start, min(start + chunk_size, n_users), n) for start in range(0, n_users, chunk_size)]
+    print(f"Scoring {n_users} users in {len(chunks)} chunks with {workers} workers...")
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(models_dir, 1)) as pool:
+        for start, indices, scores in pool.map(_score_chunk, chunks):
+            items_out[start:start + len(indices)] = indices
+            scores_out[start:start + len(scores)] = scores
+    elapsed = time.perf_counter() - t0
+
+    items_out.flush()
+    scores_out.flush()
+    del items_out, scores_out
+    os.replace(scores_tmp, os.path.join(models_dir, SCORES_FILE))
+    os.replace(items_tmp, os.path.join(models_dir, ITEMS_FILE))
+    write_version(os.path.join(models_dir, ITEMS_FILE), version)
+
+    rate = n_users / elapsed if elapsed > 0 else float('inf')
+    print(f"Wrote top-{n} for {n_users} users in {elapsed:.2f}s ({rate:,.0f} users/s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute top-N recommendations for every trained user.")
+    parser.add_argument('--n', type=int, default=50, help="recommendations kept per user")
+    parser.add_argument('--chunk-size', type=int, default=1024, help="users scored per task (bounds memory)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+    run(n=args.n, chunk_size=args.chunk_size, workers=args.workers)
@@ -0,0 +1,234 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from generate_data import generate
+
+reports_dir = "reports"
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [20000, 100000, 500000]
+
+
+# ---------------------------
+# Timing
+# ---------------------------
+def measure(fn, inputs, min_seconds: float = 1.0, max_runs: int = 2000, warmup: int = 3) -> dict:
+    """
+    Calls fn on inputs (cycled) until min_seconds or max_runs, after a few
+    warm-up calls. Returns latency percentiles in ms and calls per second.
+    """
+    for x in inputs[:warmup]:
+        fn(x)
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_runs and (time.perf_counter() - start < min_seconds or len(times) < 5):
+        x = inputs[len(times) % len(inputs)]
+        t0 = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - t0)
+    times = np.array(times) * 1000
+    return {
+        'runs': len(times),
+        'p50_ms': float(np.percentile(times, 50)),
+        'p95_ms': float(np.percentile(times, 95)),
+        'p99_ms': float(np.percentile(times, 99)),
+        'throughput_per_s': float(len(times) / (times.sum() / 1000)),
+    }
+
+
+def _run_size(workdir: str, n_ratings: int, engine: str, min_seconds: float, queue):
+    # Runs in a fresh process per size: relative database/ and models/ paths resolve
+    # to workdir, and peak RSS belongs to this size only
+    try:
+        queue.put(_benchmark_size(workdir, n_ratings, engine, min_seconds))
+    except Exception as e:
+        queue.put(e)
+        raise
+
+
+def _benchmark_size(workdir: str, n_ratings: int, engine: str, min_seconds: float) -> list:
+    sys.path.insert(0, repo_dir)
+    os.chdir(workdir)
+    warnings.filterwarnings('ignore', module='sklearn')
+    os.environ['READORA_DB'] = os.path.join('database', 'user_rate_book.db')
+    import components
+    import db
+    import train_model
+    from artifacts import ModelArtifacts
+    from fold_in import FoldIn
+    from history_store import RatingHistory, with_metadata
+    from ingest import peak_memory_mb
+    from rating_stats import RatingStats
+    from recommender import Recommender
+    from search_index import SearchIndex
+
+    results = []
+
+    def record(name, stats, unit='calls/s'):
+        results.append({'size': n_ratings, 'benchmark': name, **stats, 'unit': unit})
+
+    # Training: one full run through train_model.py
+    args = argparse.Namespace(ingest='stream', chunk_size=500000, engine=engine, incremental=False)
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        train_model.main(args)
+    seconds = time.perf_counter() - t0
+    record('train_model', {'runs': 1, 'p50_ms': seconds * 1000, 'p95_ms': seconds * 1000, 'p99_ms': seconds * 1000,
+                           'throughput_per_s': n_ratings / seconds}, unit='ratings/s')
+
+    rng = np.random.default_rng(0)
+    record('load_artifacts', measure(lambda _: ModelArtifacts.load(), [None], min_seconds))
+    record('load_legacy_pickles', measure(lambda _: ModelArtifacts.load_legacy(), [None], min_seconds, max_runs=20))
+
+    artifacts = ModelArtifacts.load()
+    store = artifacts.book_store
+    recommender = Recommender(artifacts.user_features, artifacts.item_features, artifacts.user_items,
+                              artifacts.user_map, candidate_mask=store.has_metadata)
+    known_users = rng.choice(np.asarray(artifacts.user_map.keys), 200).tolist()
+    all_users = [u for (u,) in db.fetch_all('SELECT DISTINCT "User-ID" FROM Ratings')]
+    unknown_users = [u for u in all_users if u not in artifacts.user_map][:200] or known_users
+    isbns = store.frame['ISBN'].sample(200, replace=True, random_state=0).tolist()
+    top10 = [recommender.recommend([u], 10)[0][0] for u in known_users[:50]]
+
+    record('recommend', measure(lambda u: recommender.recommend([u], 10), known_users, min_seconds))
+    fold_in = FoldIn(artifacts.model_data, store, artifacts.user_items, artifacts.user_map, cache_size=0)
+    record('fold_in_recommend', measure(
+        lambda u: (lambda p: p and recommender.top_k_vectors(p.vector, [p.item_indices], 10))(fold_in.project(u)),
+        unknown_users, min_seconds))
+    record('book_details', measure(store.get, isbns, min_seconds))
+    record('recommendation_metadata', measure(store.get_many_by_index, top10, min_seconds))
+
+    search_index = SearchIndex.load('models/search_index.npz')
+    queries = [w for title in store.get_many_by_index(np.arange(0, len(store), max(len(store) // 100, 1)))
+               ['Book-Title'] for w in str(title).split()[1:3]]
+    queries += [q[:3] for q in queries]
+    record('search', measure(lambda q: search_index.search(q, 20), queries, min_seconds))
+
+    rating_stats = RatingStats.load('models/rating_stats.pkl')
+    record('avg_rating', measure(rating_stats.get, isbns, min_seconds))
+
+    # Written by the train_model.py run above
+    history = RatingHistory.load()
+    # The heaviest raters as well as sampled ones: the page should not slow down with history length
+    heavy_users = history.users[np.argsort(np.diff(history.offsets))[-20:]].tolist()
+
+    catalogue = components.catalogue(artifacts)
+
+    def my_ratings(user_id):
+        # Same steps as the My Ratings page (first page of the 9-10s)
+        ratings = history.user_ratings(user_id)
+        n_high = history.count_at_least(user_id, 9)
+        shown = history.page(user_id, 0, min(20, n_high))
+        books = with_metadata(shown, catalogue)
+        return len(ratings), ratings.mean(), books, np.unique(ratings, return_counts=True)
+
+    record('my_ratings', measure(my_ratings, known_users + heavy_users, min_seconds))
+
+    peak = peak_memory_mb()
+    for row in results:
+        row['peak_rss_mb'] = peak
+    return results
+
+
+# ---------------------------
+# Reports
+# ---------------------------
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=repo_dir).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2) -> list:
+    """
+    p50/p95 latency changes of the benchmarks in both runs, matched on (size,
+    benchmark). A p50 growth above threshold (relative) is flagged as a
+    regression; p95 is reported but too noisy on shared machines to gate on.
+    """
+    before = {(r['size'], r['benchmark']): r for r in baseline['results']}
+    rows = []
+    for r in current['results']:
+        b = before.get((r['size'], r['benchmark']))
+        if b is None:
+            continue
+        row = {'size': r['size'], 'benchmark': r['benchmark']}
+        for key in ('p50_ms', 'p95_ms'):
+            row[f'{key}_before'] = b[key]
+            row[f'{key}_after'] = r[key]
+            row[f'{key}_change'] = r[key] / b[key] - 1 if b[key] > 0 else 0.0
+        row['regression'] = row['p50_ms_change'] > threshold
+        rows.append(row)
+    return rows
+
+
+def main(args):
+    import pandas as pd
+
+    report = {'environment': environment(), 'results': []}
+    ctx = mp.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_ratings in args.sizes:
+            workdir = os.path.join(tmp, str(n_ratings))
+            print(f"Generating {n_ratings:,} ratings...")
+            generate(os.path.join(workdir, 'database', 'user_rate_book.db'), n_ratings, seed=args.seed, verbose=False)
+            print(f"Benchmarking size {n_ratings:,}...")
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_size, args=(workdir, n_ratings, args.engine, args.min_seconds, queue))
+            proc.start()
+            results = queue.get()
+            proc.join()
+            if isinstance(results, Exception):
+                raise RuntimeError(f"benchmark of size {n_ratings} failed") from results
+            report['results'].extend(results)
+
+    table = pd.DataFrame(report['results'])
+    print(table.to_string(index=False, float_format=lambda v: f'{v:,.3f}'))
+
+    output = args.output or os.path.join(reports_dir, 'benchmarks', f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = pd.DataFrame(compare(baseline, report, args.threshold))
+        if rows.empty:
+            print("No benchmarks in common with the baseline.")
+            return 0
+        print(rows[['size', 'benchmark', 'p50_ms_before', 'p50_ms_after', 'p50_ms_change', 'p95_ms_change',
+                    'regression']].to_string(index=False))
+        regressions = rows[rows['regression']]
+        if len(regressions):
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%} against {args.compare}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Headless latency/throughput benchmarks of the app and training paths on synthetic data.")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="ratings per synthetic database")
+    parser.add_argument('--engine', choices=['nmf', 'als'], default='nmf')
+    parser.add_argument('--min-seconds', type=float, default=1.0, help="time spent measuring each path")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="JSON path (default: reports/benchmarks/<timestamp>.json)")
+    parser.add_argument('--compare', default=None, help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="relative p50 slowdown flagged as a regression")
+    sys.exit(main(parser.parse_args()))
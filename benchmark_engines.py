@@ -0,0 +1,103 @@
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+reports_dir = "reports"
+
+
+def leave_one_out(matrix: sparse.csr_matrix, seed: int = 42):
+    """
+    Holds out one random rated item for every user with at least two ratings.
+    Returns (train matrix, user rows, held-out item per user row).
+    """
+    rng = np.random.default_rng(seed)
+    counts = np.diff(matrix.indptr)
+    users = np.nonzero(counts >= 2)[0]
+    held_pos = matrix.indptr[users] + (rng.random(len(users)) * counts[users]).astype(np.int64)
+    held_items = matrix.indices[held_pos]
+
+    keep = np.ones(matrix.nnz, dtype=bool)
+    keep[held_pos] = False
+    coo = matrix.tocoo()
+    train = sparse.csr_matrix((coo.data[keep], (coo.row[keep], coo.col[keep])), shape=matrix.shape)
+    return train, users, held_items
+
+
+def _run_engine(engine: str, train_path: str, test_path: str, k: int, queue):
+    # Runs in a fresh process so peak RSS belongs to this engine only
+    from ingest import peak_memory_mb
+    from recommender import Recommender
+    import train_model
+
+    train = sparse.load_npz(train_path).tocsr()
+    test = np.load(test_path)
+    users, held_items = test['users'], test['items']
+
+    t0 = time.perf_counter()
+    model_data = train_model.ENGINES[engine](train)
+    fit_seconds = time.perf_counter() - t0
+
+    rec = Recommender(model_data['user_features'], model_data['item_features'], train)
+    hits = np.zeros(len(users), dtype=bool)
+    ndcg = np.zeros(len(users))
+    for start in range(0, len(users), 1024):
+        idx, _ = rec.top_k(users[start:start + 1024], k)
+        match = idx == held_items[start:start + 1024, None]
+        found = match.any(axis=1)
+        hits[start:start + 1024] = found
+        ndcg[start:start + 1024] = np.where(found, 1 / np.log2(match.argmax(axis=1) + 2), 0)
+
+    queue.put({
+        'engine': engine,
+        'fit_seconds': fit_seconds,
+        'peak_rss_mb': peak_memory_mb(),
+        f'hit_rate@{k}': hits.mean(),
+        f'ndcg@{k}': ndcg.mean(),
+        'users_evaluated': len(users),
+    })
+
+
+def main(args):
+    import train_model
+
+    print("Loading ratings...")
+    data, _, _, _ = train_model.load_ratings_streaming(args.chunk_size, build_history=False)
+    matrix = train_model.build_user_item_matrix(data)
+    del data
+    train, users, held_items = leave_one_out(matrix)
+    print(f"Matrix {matrix.shape[0]} x {matrix.shape[1]}, {matrix.nnz} ratings; {len(users)} held-out users.")
+
+    results = []
+    ctx = mp.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        train_path = os.path.join(tmp, 'train.npz')
+        test_path = os.path.join(tmp, 'test.npz')
+        sparse.save_npz(train_path, train)
+        np.savez(test_path, users=users, items=held_items)
+        for engine in args.engines:
+            print(f"Benchmarking {engine}...")
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_engine, args=(engine, train_path, test_path, args.k, queue))
+            proc.start()
+            results.append(queue.get())
+            proc.join()
+
+    report = pd.DataFrame(results)
+    os.makedirs(reports_dir, exist_ok=True)
+    report.to_csv(os.path.join(reports_dir, "engine_benchmark.csv"), index=False)
+    print(report.to_string(index=False))
+    print("Saved reports/engine_benchmark.csv")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare training engines on wall time, peak memory and leave-one-out ranking quality.")
+    parser.add_argument('--engines', nargs='+', default=['nmf', 'als'])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--chunk-size', type=int, default=500000)
+    main(parser.parse_args())
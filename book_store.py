@@ -0,0 +1,179 @@
+import os
+
+import pandas as pd
+import numpy as np
+
+from id_map import IdMap
+
+METADATA_COLUMNS = ['ISBN', 'Book-Title', 'Book-Author', 'Image-URL-M']
+
+
+class BookStore:
+    """
+    Book metadata indexed by the model's item index and by ISBN.
+
+    Row i of the store holds the metadata of item i (the column of
+    item_features for that book), so lookups by item index are a positional
+    take and lookups by ISBN go through a hash index. Items without metadata
+    keep a row with only the ISBN filled in and are reported as missing.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame.reset_index(drop=True)
+        self.isbn_index = pd.Index(self.frame['ISBN'])
+        self.has_metadata = self.frame['Book-Title'].notna().to_numpy()
+
+    @classmethod
+    def build(cls, books: pd.DataFrame, isbns) -> 'BookStore':
+        """Aligns the books metadata to the item index of the trained model (isbns[i] is item i)."""
+        isbns = list(isbns)
+        books = books.drop_duplicates(subset=['ISBN']).set_index('ISBN')
+        frame = books.reindex(isbns).reset_index()
+        frame.columns = ['ISBN'] + list(books.columns)
+        return cls(frame)
+
+    @classmethod
+    def load(cls, path: str) -> 'BookStore':
+        return cls(pd.read_pickle(path))
+
+    def save(self, path: str):
+        self.frame.to_pickle(path)
+
+    def save_columns(self, directory: str, prefix: str = ''):
+        """Writes the metadata as StringColumn .npy files and an ISBN IdMap (see ColumnarBookStore)."""
+        for column in METADATA_COLUMNS:
+            StringColumn.from_values(self.frame[column]).save(directory, f'{prefix}books.{column}')
+        IdMap.build(self.frame['ISBN'].astype(str)).save(directory, f'{prefix}isbns')
+
+    def __len__(self):
+        return len(self.frame)
+
+    def index_of(self, isbn) -> int:
+        """Item index of an ISBN, or -1 if the book is not in the store."""
+        try:
+            return int(self.isbn_index.get_loc(isbn))
+        except KeyError:
+            return -1
+
+    def indices_of(self, isbns) -> np.ndarray:
+        """Item indices of a batch of ISBNs (-1 for unknown ones)."""
+        return self.isbn_index.get_indexer(pd.Index(isbns))
+
+    def get_by_index(self, idx):
+        if 0 <= idx < len(self.frame) and self.has_metadata[idx]:
+            return self.frame.iloc[idx]
+        return None
+
+    def get(self, isbn):
+        return self.get_by_index(self.index_of(isbn))
+
+    def get_many_by_index(self, indices) -> pd.DataFrame:
+        """Rows for a batch of item indices, in the given order, skipping books without metadata."""
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = indices[(indices >= 0) & (indices < len(self.frame))]
+        indices = indices[self.has_metadata[indices]]
+        return self.frame.take(indices)
+
+    def get_many(self, isbns) -> pd.DataFrame:
+        return self.get_many_by_index(self.indices_of(isbns))
+
+
+class StringColumn:
+    """
+    Strings stored as one UTF-8 byte buffer plus offsets, so a column can be
+    memory-mapped and only the rows that are read get decoded. Row i is
+    data[offsets[i]:offsets[i + 1]]; null[i] marks missing values.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray, null: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+        self.null = null
+
+    @classmethod
+    def from_values(cls, values) -> 'StringColumn':
+        values = pd.Series(values, dtype=object)
+        null = values.isna().to_numpy()
+        encoded = [b'' if missing else str(v).encode('utf-8') for v, missing in zip(values.tolist(), null.tolist())]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets, null)
+
+    @classmethod
+    def load(cls, directory: str, name: str, mmap_mode='r') -> 'StringColumn':
+        return cls(*(np.load(os.path.join(directory, f'{name}.{part}.npy'), mmap_mode=mmap_mode)
+                     for part in ('data', 'offsets', 'null')))
+
+    def save(self, directory: str, name: str):
+        # Each file is replaced, not rewritten in place: readers that memory-mapped it keep a valid copy
+        for part in ('data', 'offsets', 'null'):
+            path = os.path.join(directory, f'{name}.{part}.npy')
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, getattr(self, part))
+            os.replace(path + '.tmp', path)
+
+    def __len__(self):
+        return len(self.null)
+
+    def take(self, indices) -> list:
+        offsets = self.offsets
+        return [None if self.null[i] else bytes(self.data[offsets[i]:offsets[i + 1]]).decode('utf-8')
+                for i in indices]
+
+    def to_numpy(self) -> np.ndarray:
+        # One copy of the buffer, then bytes slices: ~10x faster than take() over every row
+        data, bounds = bytes(self.data), np.asarray(self.offsets).tolist()
+        out = np.empty(len(self), dtype=object)
+        out[:] = [None if missing else data[start:stop].decode('utf-8')
+                  for start, stop, missing in zip(bounds, bounds[1:], np.asarray(self.null).tolist())]
+        return out
+
+
+class ColumnarBookStore(BookStore):
+    """
+    BookStore over memory-mapped StringColumns and an ISBN IdMap. Nothing is
+    decoded up front: rows are decoded when they are read, and the full frame
+    only if something asks for it.
+    """
+
+    def __init__(self, columns: dict, isbn_map: IdMap):
+        self.columns = columns
+        self.isbn_map = isbn_map
+        self.has_metadata = ~np.asarray(columns['Book-Title'].null)
+        self._frame = None
+
+    @classmethod
+    def load(cls, directory: str, prefix: str = '') -> 'ColumnarBookStore':
+        return cls({column: StringColumn.load(directory, f'{prefix}books.{column}') for column in METADATA_COLUMNS},
+                   IdMap.load(directory, f'{prefix}isbns'))
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        if self._frame is None:
+            self._frame = pd.DataFrame({column: self.columns[column].to_numpy() for column in METADATA_COLUMNS})
+        return self._frame
+
+    def __len__(self):
+        return len(self.isbn_map)
+
+    def index_of(self, isbn) -> int:
+        return int(self.isbn_map.indices([isbn])[0])
+
+    def indices_of(self, isbns) -> np.ndarray:
+        return self.isbn_map.indices(isbns)
+
+    def _rows(self, indices) -> pd.DataFrame:
+        return pd.DataFrame({column: pd.Series(self.columns[column].take(indices), index=indices, dtype=object)
+                             for column in METADATA_COLUMNS}, columns=METADATA_COLUMNS)
+
+    def get_by_index(self, idx):
+        if 0 <= idx < len(self) and self.has_metadata[idx]:
+            # A Series built directly: going through a one-row DataFrame costs ~4x more per lookup
+            return pd.Series({column: self.columns[column].take([idx])[0] for column in METADATA_COLUMNS},
+                             name=idx, dtype=object)
+        return None
+
+    def get_many_by_index(self, indices) -> pd.DataFrame:
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = indices[(indices >= 0) & (indices < len(self))]
+        return self._rows(indices[self.has_metadata[indices]])
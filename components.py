@@ -0,0 +1,128 @@
+import os
+
+# The app's loadable subsystems as plain functions. app.py wraps each one in st.cache_resource,
+# calls it the first time a page needs it and prefetches the rest in the background;
+# startup.py times them without Streamlit. Heavy imports (scipy, scikit-learn through legacy
+# pickles) happen inside the loaders, so importing this module is cheap.
+
+models_dir = 'models'
+popular_path = os.path.join('reports', 'popular_books_weighted.csv')
+
+
+def model_version(models_dir: str = models_dir):
+    """
+    Name of the current artifacts version (models/artifacts/CURRENT), or the
+    legacy model's mtime; changes whenever train_model.py writes a new model.
+    Reads the pointer file directly so no artifacts (scipy) import is needed.
+    """
+    pointer = os.path.join(models_dir, 'artifacts', 'CURRENT')
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            return f.read().strip()
+    model_path = os.path.join(models_dir, 'nmf_model.pkl')
+    if os.path.exists(model_path):
+        return str(os.stat(model_path).st_mtime_ns)
+    return None
+
+
+def write_version(path: str, version: str):
+    """Records next to an output derived from a model which model version it was built from."""
+    with open(path + '.version.tmp', 'w') as f:
+        f.write(version or '')
+    os.replace(path + '.version.tmp', path + '.version')
+
+
+def is_current(path: str, models_dir: str = models_dir) -> bool:
+    """
+    Whether path exists and was built from the current model version (see
+    write_version). Outputs without a recorded version count as stale.
+    """
+    if not os.path.exists(path) or not os.path.exists(path + '.version'):
+        return False
+    with open(path + '.version') as f:
+        recorded = f.read().strip()
+    return bool(recorded) and recorded == model_version(models_dir)
+
+
+def load_models(models_dir: str = models_dir):
+    # Memory-mapped models/artifacts/CURRENT version; pickles of older training runs otherwise
+    from artifacts import ModelArtifacts
+    return ModelArtifacts.load_any(models_dir)
+
+
+def load_rating_stats(models_dir: str = models_dir):
+    from rating_stats import RatingStats
+    path = os.path.join(models_dir, 'rating_stats.pkl')
+    return RatingStats.load(path) if os.path.exists(path) else None
+
+
+def load_search_index(models_dir: str = models_dir):
+    from search_index import SearchIndex
+    path = os.path.join(models_dir, 'search_index.npz')
+    return SearchIndex.load(path) if os.path.exists(path) else None
+
+
+def load_recommender(artifacts, models_dir: str = models_dir):
+    from mips_index import MIPSIndex
+    from recommender import Recommender
+    # The approximate index is used only if it was built for the current model
+    mips_index = MIPSIndex.load_current(models_dir)
+    return Recommender(artifacts.user_features, artifacts.item_features, artifacts.user_items, artifacts.user_map,
+                       candidate_mask=artifacts.book_store.has_metadata, mips_index=mips_index)
+
+
+def load_top_n(models_dir: str = models_dir):
+    # Written by batch_recommend.py; None when missing or built for another model version
+    from batch_recommend import TopNTable
+    return TopNTable.load(models_dir)
+
+
+def load_similar_items(models_dir: str = models_dir):
+    # Written by similar_items.py; None when missing or built for another model version
+    from similar_items import SimilarItems
+    return SimilarItems.load(models_dir)
+
+
+def catalogue(artifacts):
+    # Metadata of every book in Books (My Ratings); the model's books for versions trained before it was stored
+    return artifacts.catalogue if artifacts.catalogue is not None else artifacts.book_store
+
+
+def load_rating_history(models_dir: str = models_dir):
+    # Written by history_store.py; None when missing or older than the database
+    from history_store import RatingHistory
+    return RatingHistory.load(models_dir)
+
+
+def rating_history_stamp(models_dir: str = models_dir):
+    # Changes whenever load_rating_history could return something else (a few stat calls)
+    from history_store import stamp
+    return stamp(models_dir)
+
+
+def load_fold_in(artifacts):
+    # Projects users the model has not seen (or with newer ratings) onto the item factors
+    from fold_in import FoldIn
+    return FoldIn(artifacts.model_data, artifacts.book_store, artifacts.user_items, artifacts.user_map,
+                  watermark=artifacts.watermark)
+
+
+def load_service_client():
+    # Scoring through service.py when READORA_SERVICE_URL points at one; in this process otherwise
+    url = os.environ.get('READORA_SERVICE_URL')
+    if not url:
+        return None
+    from service import ServiceClient
+    return ServiceClient(url)
+
+
+def load_popular(n: int = 10, path: str = popular_path):
+    import pandas as pd
+    return pd.read_csv(path).head(n)
+
+
+def open_database():
+    # Opens (and warms) this thread's read-only connection
+    import db
+    db.fetch_one("SELECT 1", label='warmup')
+    return db.get_connection()
@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+import metrics
+
+# Set READORA_DB to point every script at another database file (e.g. a generated one).
+# READORA_DB_IMMUTABLE=1 tells SQLite the file never changes while open (no locking at all);
+# only use it for databases that are not written to while the app runs.
+DB_PATH = os.environ.get('READORA_DB', os.path.join('database', 'user_rate_book.db'))
+IMMUTABLE = os.environ.get('READORA_DB_IMMUTABLE', '0') == '1'
+
+PRAGMAS = {
+    'mmap_size': 256 * 1024 * 1024,  # read pages straight from the OS page cache
+    'cache_size': -64 * 1024,        # 64 MB page cache (negative = KiB)
+    'temp_store': 'MEMORY',
+}
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_query_stats = {}
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes a table/column name; identifiers cannot be bound as parameters."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def connect(path: str = DB_PATH, readonly: bool = True, immutable: bool = IMMUTABLE) -> sqlite3.Connection:
+    """Opens a new connection with the read-tuned pragmas applied."""
+    if readonly:
+        uri = f"file:{os.path.abspath(path)}?mode=ro"
+        if immutable:
+            uri += "&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, cached_statements=256)
+        conn.execute("PRAGMA query_only = 1")
+    else:
+        conn = sqlite3.connect(path, cached_statements=256)
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def get_connection(path: str = DB_PATH) -> sqlite3.Connection:
+    """Cached read-only connection for the calling thread."""
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path)
+    return conn
+
+
+def close_connection(path: str = DB_PATH):
+    conn = getattr(_local, 'conns', {}).pop(path, None)
+    if conn is not None:
+        conn.close()
+
+
+# ---------------------------
+# Query timing
+# ---------------------------
+@contextmanager
+def _timed(label: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        with _stats_lock:
+            stats = _query_stats.setdefault(label, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+        metrics.observe('db_query', elapsed, query=label)
+
+
+def query_timings() -> pd.DataFrame:
+    """Calls, total and max seconds per query label since the process started."""
+    with _stats_lock:
+        rows = [(label, n, total, worst) for label, (n, total, worst) in _query_stats.items()]
+    return pd.DataFrame(rows, columns=['query', 'calls', 'total_s', 'max_s']).sort_values('total_s', ascending=False)
+
+
+# ---------------------------
+# Generic fetch helpers (always parameterized)
+# ---------------------------
+def fetch_all(sql: str, params=(), label: str = None, path: str = DB_PATH) -> list:
+    with _timed(label or sql):
+        return get_connection(path).execute(sql, params).fetchall()
+
+
+def fetch_one(sql: str, params=(), label: str = None, path: str = DB_PATH):
+    with _timed(label or sql):
+        return get_connection(path).execute(sql, params).fetchone()
+
+
+def fetch_scalar(sql: str, params=(), label: str = None, path: str = DB_PATH):
+    row = fetch_one(sql, params, label, path)
+    return row[0] if row is not None else None
+
+
+def fetch_df(sql: str, params=(), label: str = None, path: str = DB_PATH) -> pd.DataFrame:
+    with _timed(label or sql):
+        return pd.read_sql_query(sql, get_connection(path), params=params)
+
+
+def iter_df(sql: str, params=(), chunksize: int = 100000, label: str = None, path: str = DB_PATH):
+    """Yields the result in DataFrame chunks of at most chunksize rows."""
+    chunks = pd.read_sql_query(sql, get_connection(path), params=params, chunksize=chunksize)
+    while True:
+        with _timed(label or sql):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+# ---------------------------
+# Typed helpers
+# ---------------------------
+def list_tables(path: str = DB_PATH) -> list:
+    rows = fetch_all("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY rowid",
+                     label='list_tables', path=path)
+    return [name for (name,) in rows]
+
+
+def table_info(table: str, path: str = DB_PATH) -> list:
+    """Rows of PRAGMA table_info: (cid, name, type, notnull, dflt_value, pk)."""
+    return fetch_all(f"PRAGMA table_info({quote_identifier(table)})", label='table_info', path=path)
+
+
+def read_table(table: str, columns=None, limit: int = None, path: str = DB_PATH) -> pd.DataFrame:
+    """SELECT of whole columns, untyped (as stored)."""
+    cols = ', '.join(quote_identifier(c) for c in columns) if columns else '*'
+    sql = f"SELECT {cols} FROM {quote_identifier(table)}"
+    params = ()
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = (int(limit),)
+    return fetch_df(sql, params, label=f'read_table:{table}', path=path)
+
+
+def user_ratings(user_id: int, path: str = DB_PATH, since: int = None, until: int = None) -> pd.DataFrame:
+    """
+    A user's ratings in rowid order with ISBN as str and Book-Rating numeric
+    (unparseable values become NaN), optionally only rows with since < rowid <= until. With since set
+    to a training watermark the rowid range bounds the scan to the rows added
+    after it, so checking a user for new ratings stays cheap without an index.
+    """
+    sql = 'SELECT "User-ID", "ISBN", "Book-Rating" FROM Ratings WHERE "User-ID" = ?'
+    params = [int(user_id)]
+    label = 'user_ratings'
+    if since is not None:
+        sql += ' AND rowid > ?'
+        params.append(int(since))
+        label = 'user_ratings_since'
+    if until is not None:
+        sql += ' AND rowid <= ?'
+        params.append(int(until))
+    df = fetch_df(sql + ' ORDER BY rowid', tuple(params), label=label, path=path)
+    df['ISBN'] = df['ISBN'].astype(str)
+    df['Book-Rating'] = pd.to_numeric(df['Book-Rating'], errors='coerce')
+    return df
+
+
+def rated_since(user_id: int, since: int, path: str = DB_PATH) -> bool:
+    """Whether the user has any Ratings row with rowid > since (a scan of those rows only)."""
+    return fetch_one('SELECT 1 FROM Ratings WHERE rowid > ? AND "User-ID" = ? LIMIT 1',
+                     (int(since), int(user_id)), label='rated_since', path=path) is not None
+
+
+def avg_rating(isbn: str, path: str = DB_PATH):
+    """Mean Book-Rating of an ISBN, or None when it has no ratings."""
+    return fetch_scalar('SELECT AVG("Book-Rating") FROM Ratings WHERE "ISBN" = ?',
+                        (str(isbn),), label='avg_rating', path=path)
@@ -98,11 +98,22 @@
 #
 # print("EDA and Analysis Complete.")
 
-import sqlite3
+import argparse
+import functools
+import hashlib
+import inspect
+import multiprocessing as mp
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 import os
 import json
+import db
+import eda_queries
+from ingest import peak_memory_mb
+from rating_stats import weighted_score
 
 # ---------------------------
 # Helpers
@@ -141,169 +152,301 @@ def null_columns_summary(df: pd.DataFrame) -> dict:
 # ---------------------------
 # Load data from SQLite
 # ---------------------------
-db_path = "database/user_rate_book.db"
-reports_dir = "reports"
-ensure_dir(reports_dir)
-
-conn = sqlite3.connect(db_path)
-
-print("Loading data...")
-books = pd.read_sql("SELECT * FROM Books", conn)
-users = pd.read_sql("SELECT * FROM Users", conn)
-ratings = pd.read_sql("SELECT * FROM Ratings", conn)
-conn.close()
-
-print("Cleaning data...")
-# Books
-books["Year-Of-Publication"] = pd.to_numeric(books["Year-Of-Publication"], errors="coerce")
-books["Year-Of-Publication"] = books["Year-Of-Publication"].fillna(0).astype(int)
-
-# Users
-users["Age"] = pd.to_numeric(users["Age"], errors="coerce")
-
-# Ratings
-ratings["Book-Rating"] = pd.to_numeric(ratings["Book-Rating"], errors="coerce")
-ratings["User-ID"] = pd.to_numeric(ratings["User-ID"], errors="coerce")
+@functools.lru_cache(maxsize=None)
+def load_table(table: str) -> pd.DataFrame:
+    """
+    A whole table, cleaned. Cached, so the stages run in one process share it;
+    the reports must not modify it.
+    """
+    print(f"Loading {table}...")
+    df = db.read_table(table)
+    if table == "Books":
+        df["Year-Of-Publication"] = pd.to_numeric(df["Year-Of-Publication"], errors="coerce")
+        df["Year-Of-Publication"] = df["Year-Of-Publication"].fillna(0).astype(int)
+    elif table == "Users":
+        df["Age"] = pd.to_numeric(df["Age"], errors="coerce")
+    elif table == "Ratings":
+        df["Book-Rating"] = pd.to_numeric(df["Book-Rating"], errors="coerce")
+        df["User-ID"] = pd.to_numeric(df["User-ID"], errors="coerce")
+    return df
 
 # ---------------------------
-# Schema + Missingness report (NEW)
+# Schema + Missingness report
 # ---------------------------
-schema_report = pd.concat([
-    table_schema_missing_report(books, "Books"),
-    table_schema_missing_report(users, "Users"),
-    table_schema_missing_report(ratings, "Ratings"),
-], ignore_index=True)
-
-schema_report.to_csv(os.path.join(reports_dir, "schema_and_missingness.csv"), index=False)
-print("Saved reports/schema_and_missingness.csv")
+def schema_and_missingness() -> pd.DataFrame:
+    return pd.concat([
+        table_schema_missing_report(load_table("Books"), "Books"),
+        table_schema_missing_report(load_table("Users"), "Users"),
+        table_schema_missing_report(load_table("Ratings"), "Ratings"),
+    ], ignore_index=True)
 
 # ---------------------------
 # EDA Report (expanded)
 # ---------------------------
-eda_data = []
-
-# Table sizes
-add_eda_row(eda_data, "Total Books", len(books))
-add_eda_row(eda_data, "Total Users", len(users))
-add_eda_row(eda_data, "Total Ratings", len(ratings))
-
-# Duplicates
-add_eda_row(eda_data, "Duplicate Rows in Books", int(books.duplicated().sum()))
-add_eda_row(eda_data, "Duplicate Rows in Users", int(users.duplicated().sum()))
-add_eda_row(eda_data, "Duplicate Rows in Ratings", int(ratings.duplicated().sum()))
-
-# Key uniqueness checks (common in this dataset)
-if "ISBN" in books.columns:
-    add_eda_row(eda_data, "Unique ISBN in Books", int(books["ISBN"].nunique()))
-if "User-ID" in users.columns:
-    add_eda_row(eda_data, "Unique User-ID in Users", int(users["User-ID"].nunique()))
-if set(["User-ID", "ISBN"]).issubset(ratings.columns):
-    dup_pairs = int(ratings.duplicated(subset=["User-ID", "ISBN"]).sum())
-    add_eda_row(eda_data, "Duplicate (User-ID, ISBN) pairs in Ratings", dup_pairs)
-
-# Basic interaction counts
-add_eda_row(eda_data, "Unique Books in Ratings", int(ratings["ISBN"].nunique()))
-add_eda_row(eda_data, "Unique Users in Ratings", int(ratings["User-ID"].nunique()))
-
-# Rating stats
-add_eda_row(eda_data, "Average Rating (all)", float(ratings["Book-Rating"].mean()))
-add_eda_row(eda_data, "Median Rating (all)", float(ratings["Book-Rating"].median()))
-add_eda_row(eda_data, "Min Rating", float(ratings["Book-Rating"].min()))
-add_eda_row(eda_data, "Max Rating", float(ratings["Book-Rating"].max()))
-
-# Explicit vs implicit (0)
-n_total = len(ratings)
-n_zero = int((ratings["Book-Rating"] == 0).sum())
-n_exp = int((ratings["Book-Rating"] > 0).sum())
-add_eda_row(eda_data, "Total Rating Rows", n_total)
-add_eda_row(eda_data, "Rating Rows where Book-Rating=0", n_zero)
-add_eda_row(eda_data, "Rating Rows where Book-Rating>0 (explicit)", n_exp)
-add_eda_row(eda_data, "Pct Rating=0", round((n_zero / n_total) * 100, 4) if n_total else np.nan)
-
-# Missing/null columns info (NEW metrics you requested)
-books_nulls = null_columns_summary(books)
-users_nulls = null_columns_summary(users)
-ratings_nulls = null_columns_summary(ratings)
-
-add_eda_row(eda_data, "Books: #columns with any nulls", len(books_nulls))
-add_eda_row(eda_data, "Books: null columns (name->count)", json.dumps(books_nulls, ensure_ascii=False))
-
-add_eda_row(eda_data, "Users: #columns with any nulls", len(users_nulls))
-add_eda_row(eda_data, "Users: null columns (name->count)", json.dumps(users_nulls, ensure_ascii=False))
-
-add_eda_row(eda_data, "Ratings: #columns with any nulls", len(ratings_nulls))
-add_eda_row(eda_data, "Ratings: null columns (name->count)", json.dumps(ratings_nulls, ensure_ascii=False))
-
-# Some specific missing counts you already had
-add_eda_row(eda_data, "Missing Ages", int(users["Age"].isnull().sum()))
-add_eda_row(eda_data, "Missing Book Authors", int(books["Book-Author"].isnull().sum()) if "Book-Author" in books.columns else "N/A")
-add_eda_row(eda_data, "Missing Publishers", int(books["Publisher"].isnull().sum()) if "Publisher" in books.columns else "N/A")
-
-# Join coverage (helpful for project write-up)
-# What % of rating ISBNs exist in Books?
-books_isbn_set = set(books["ISBN"].astype(str))
-ratings_isbn = ratings["ISBN"].astype(str)
-isbn_match_pct = float(ratings_isbn.isin(books_isbn_set).mean() * 100) if len(ratings_isbn) else np.nan
-add_eda_row(eda_data, "Ratings→Books ISBN match %", round(isbn_match_pct, 4))
-
-# What % of rating users exist in Users?
-users_set = set(users["User-ID"].dropna().astype(int))
-ratings_users = ratings["User-ID"].dropna().astype(int)
-user_match_pct = float(ratings_users.isin(users_set).mean() * 100) if len(ratings_users) else np.nan
-add_eda_row(eda_data, "Ratings→Users User-ID match %", round(user_match_pct, 4))
-
-# Rating distribution
-rating_dist = ratings["Book-Rating"].value_counts().sort_index()
-for rating, count in rating_dist.items():
-    add_eda_row(eda_data, f"Count of Rating {int(rating) if pd.notna(rating) else rating}", int(count))
-
-eda_df = pd.DataFrame(eda_data)
-eda_df.to_csv(os.path.join(reports_dir, "eda_report.csv"), index=False)
-print("Saved reports/eda_report.csv")
+def eda_report() -> pd.DataFrame:
+    books, users, ratings = load_table("Books"), load_table("Users"), load_table("Ratings")
+    eda_data = []
+
+    # Table sizes
+    add_eda_row(eda_data, "Total Books", len(books))
+    add_eda_row(eda_data, "Total Users", len(users))
+    add_eda_row(eda_data, "Total Ratings", len(ratings))
+
+    # Duplicates
+    add_eda_row(eda_data, "Duplicate Rows in Books", int(books.duplicated().sum()))
+    add_eda_row(eda_data, "Duplicate Rows in Users", int(users.duplicated().sum()))
+    add_eda_row(eda_data, "Duplicate Rows in Ratings", int(ratings.duplicated().sum()))
+
+    # Key uniqueness checks (common in this dataset)
+    if "ISBN" in books.columns:
+        add_eda_row(eda_data, "Unique ISBN in Books", int(books["ISBN"].nunique()))
+    if "User-ID" in users.columns:
+        add_eda_row(eda_data, "Unique User-ID in Users", int(users["User-ID"].nunique()))
+    if set(["User-ID", "ISBN"]).issubset(ratings.columns):
+        dup_pairs = int(ratings.duplicated(subset=["User-ID", "ISBN"]).sum())
+        add_eda_row(eda_data, "Duplicate (User-ID, ISBN) pairs in Ratings", dup_pairs)
+
+    # Basic interaction counts
+    add_eda_row(eda_data, "Unique Books in Ratings", int(ratings["ISBN"].nunique()))
+    add_eda_row(eda_data, "Unique Users in Ratings", int(ratings["User-ID"].nunique()))
+
+    # Rating stats
+    add_eda_row(eda_data, "Average Rating (all)", float(ratings["Book-Rating"].mean()))
+    add_eda_row(eda_data, "Median Rating (all)", float(ratings["Book-Rating"].median()))
+    add_eda_row(eda_data, "Min Rating", float(ratings["Book-Rating"].min()))
+    add_eda_row(eda_data, "Max Rating", float(ratings["Book-Rating"].max()))
+
+    # Explicit vs implicit (0)
+    n_total = len(ratings)
+    n_zero = int((ratings["Book-Rating"] == 0).sum())
+    n_exp = int((ratings["Book-Rating"] > 0).sum())
+    add_eda_row(eda_data, "Total Rating Rows", n_total)
+    add_eda_row(eda_data, "Rating Rows where Book-Rating=0", n_zero)
+    add_eda_row(eda_data, "Rating Rows where Book-Rating>0 (explicit)", n_exp)
+    add_eda_row(eda_data, "Pct Rating=0", round((n_zero / n_total) * 100, 4) if n_total else np.nan)
+
+    # Missing/null columns info (NEW metrics you requested)
+    books_nulls = null_columns_summary(books)
+    users_nulls = null_columns_summary(users)
+    ratings_nulls = null_columns_summary(ratings)
+
+    add_eda_row(eda_data, "Books: #columns with any nulls", len(books_nulls))
+    add_eda_row(eda_data, "Books: null columns (name->count)", json.dumps(books_nulls, ensure_ascii=False))
+
+    add_eda_row(eda_data, "Users: #columns with any nulls", len(users_nulls))
+    add_eda_row(eda_data, "Users: null columns (name->count)", json.dumps(users_nulls, ensure_ascii=False))
+
+    add_eda_row(eda_data, "Ratings: #columns with any nulls", len(ratings_nulls))
+    add_eda_row(eda_data, "Ratings: null columns (name->count)", json.dumps(ratings_nulls, ensure_ascii=False))
+
+    # Some specific missing counts you already had
+    add_eda_row(eda_data, "Missing Ages", int(users["Age"].isnull().sum()))
+    add_eda_row(eda_data, "Missing Book Authors", int(books["Book-Author"].isnull().sum()) if "Book-Author" in books.columns else "N/A")
+    add_eda_row(eda_data, "Missing Publishers", int(books["Publisher"].isnull().sum()) if "Publisher" in books.columns else "N/A")
+
+    # Join coverage (helpful for project write-up)
+    # What % of rating ISBNs exist in Books?
+    books_isbn_set = set(books["ISBN"].astype(str))
+    ratings_isbn = ratings["ISBN"].astype(str)
+    isbn_match_pct = float(ratings_isbn.isin(books_isbn_set).mean() * 100) if len(ratings_isbn) else np.nan
+    add_eda_row(eda_data, "Ratings→Books ISBN match %", round(isbn_match_pct, 4))
+
+    # What % of rating users exist in Users?
+    users_set = set(users["User-ID"].dropna().astype(int))
+    ratings_users = ratings["User-ID"].dropna().astype(int)
+    user_match_pct = float(ratings_users.isin(users_set).mean() * 100) if len(ratings_users) else np.nan
+    add_eda_row(eda_data, "Ratings→Users User-ID match %", round(user_match_pct, 4))
+
+    # Rating distribution
+    rating_dist = ratings["Book-Rating"].value_counts().sort_index()
+    for rating, count in rating_dist.items():
+        add_eda_row(eda_data, f"Count of Rating {int(rating) if pd.notna(rating) else rating}", int(count))
+
+    return pd.DataFrame(eda_data)
 
 # ---------------------------
 # Data Analysis Report
 # ---------------------------
-# 1) Top rated books (at least 10 ratings)
-rating_counts = ratings.groupby("ISBN")["Book-Rating"].count()
-popular_books_isbn = rating_counts[rating_counts >= 10].index
-avg_ratings = ratings[ratings["ISBN"].isin(popular_books_isbn)].groupby("ISBN")["Book-Rating"].mean()
-
-top_books = avg_ratings.sort_values(ascending=False).head(50).reset_index()
-top_books = top_books.merge(
-    books[["ISBN", "Book-Title", "Book-Author", "Publisher"]],
-    on="ISBN",
-    how="left"
-)
-top_books.columns = ["ISBN", "Average Rating", "Title", "Author", "Publisher"]
-top_books.to_csv(os.path.join(reports_dir, "data_analysis_report.csv"), index=False)
-print("Saved reports/data_analysis_report.csv")
-
-# 2) Most active users
-active_users = ratings.groupby("User-ID")["Book-Rating"].count().sort_values(ascending=False).head(50).reset_index()
-active_users.columns = ["User-ID", "Rating Count"]
-active_users.to_csv(os.path.join(reports_dir, "active_users.csv"), index=False)
-print("Saved reports/active_users.csv")
-
-# 3) Popular books for app (weighted rating, IMDB-style)
-C = ratings["Book-Rating"].mean()
-m = rating_counts.quantile(0.9)  # 90th percentile threshold
-q_books = ratings[ratings["ISBN"].isin(rating_counts[rating_counts >= m].index)]
-
-book_stats = q_books.groupby("ISBN")["Book-Rating"].agg(["count", "mean"])
-book_stats["score"] = book_stats.apply(
-    lambda x: (x["count"] / (x["count"] + m) * x["mean"]) + (m / (x["count"] + m) * C),
-    axis=1
-)
-
-top_scored_books = book_stats.sort_values("score", ascending=False).head(100).reset_index()
-top_scored_books = top_scored_books.merge(
-    books[["ISBN", "Book-Title", "Book-Author", "Image-URL-M"]],
-    on="ISBN",
-    how="left"
-)
-
-top_scored_books.to_csv(os.path.join(reports_dir, "popular_books_weighted.csv"), index=False)
-print("Saved reports/popular_books_weighted.csv")
-
-print("EDA and Analysis Complete.")
\ No newline at end of file
+def top_rated_books() -> pd.DataFrame:
+    """Top rated books (at least 10 ratings)."""
+    books, ratings = load_table("Books"), load_table("Ratings")
+    rating_counts = ratings.groupby("ISBN")["Book-Rating"].count()
+    popular_books_isbn = rating_counts[rating_counts >= 10].index
+    avg_ratings = ratings[ratings["ISBN"].isin(popular_books_isbn)].groupby("ISBN")["Book-Rating"].mean()
+
+    top_books = avg_ratings.sort_values(ascending=False).head(50).reset_index()
+    top_books = top_books.merge(
+        books[["ISBN", "Book-Title", "Book-Author", "Publisher"]],
+        on="ISBN",
+        how="left"
+    )
+    top_books.columns = ["ISBN", "Average Rating", "Title", "Author", "Publisher"]
+    return top_books
+
+def most_active_users() -> pd.DataFrame:
+    ratings = load_table("Ratings")
+    active_users = ratings.groupby("User-ID")["Book-Rating"].count().sort_values(ascending=False).head(50).reset_index()
+    active_users.columns = ["User-ID", "Rating Count"]
+    return active_users
+
+def popular_books_weighted() -> pd.DataFrame:
+    """Popular books for the app (weighted rating, IMDB-style)."""
+    books, ratings = load_table("Books"), load_table("Ratings")
+    rating_counts = ratings.groupby("ISBN")["Book-Rating"].count()
+    C = ratings["Book-Rating"].mean()
+    m = rating_counts.quantile(0.9)  # 90th percentile threshold
+    q_books = ratings[ratings["ISBN"].isin(rating_counts[rating_counts >= m].index)]
+
+    book_stats = q_books.groupby("ISBN")["Book-Rating"].agg(["count", "mean"])
+    book_stats["score"] = weighted_score(book_stats["count"], book_stats["mean"], m, C)
+
+    top_scored_books = book_stats.sort_values("score", ascending=False).head(100).reset_index()
+    top_scored_books = top_scored_books.merge(
+        books[["ISBN", "Book-Title", "Book-Author", "Image-URL-M"]],
+        on="ISBN",
+        how="left"
+    )
+    return top_scored_books
+
+# ---------------------------
+# Stages
+# ---------------------------
+# Each report is a stage: the tables it reads, the file it writes, how to compute it
+# in memory and out-of-core, and the helpers whose code it depends on.
+Stage = namedtuple("Stage", ["name", "inputs", "output", "in_memory", "out_of_core", "helpers"])
+
+COMMON_HELPERS = (load_table, eda_queries.numeric, eda_queries.columns, eda_queries.use_temp_files)
+
+STAGES = [
+    Stage("schema", ("Books", "Users", "Ratings"), "schema_and_missingness.csv", schema_and_missingness,
+          eda_queries.schema_report, (table_schema_missing_report, eda_queries.column_profile, eda_queries._dtype)),
+    Stage("eda_report", ("Books", "Users", "Ratings"), "eda_report.csv", eda_report, eda_queries.eda_report,
+          (add_eda_row, null_columns_summary, eda_queries.schema_report, eda_queries.column_profile,
+           eda_queries._dtype, eda_queries.cleaned_view, eda_queries.duplicate_rows, eda_queries.rating_histogram,
+           eda_queries.ratings_summary, eda_queries.median)),
+    Stage("top_rated_books", ("Books", "Ratings"), "data_analysis_report.csv", top_rated_books,
+          eda_queries.top_rated_books, (eda_queries.book_counts, eda_queries.book_metadata, eda_queries._concat)),
+    Stage("active_users", ("Ratings",), "active_users.csv", most_active_users, eda_queries.active_users,
+          (eda_queries._concat,)),
+    Stage("popular_books", ("Books", "Ratings"), "popular_books_weighted.csv", popular_books_weighted,
+          eda_queries.popular_books, (weighted_score, eda_queries.count_histogram, eda_queries.quantile,
+                                      eda_queries.book_counts, eda_queries.book_metadata, eda_queries._concat)),
+]
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+def code_fingerprint(stage: Stage) -> str:
+    """Hash of the source of both implementations of the stage and of the helpers they call."""
+    digest = hashlib.sha256()
+    for fn in (stage.in_memory, stage.out_of_core) + stage.helpers + COMMON_HELPERS:
+        digest.update(inspect.getsource(fn).encode("utf-8"))
+    digest.update(repr(eda_queries.CLEANED).encode("utf-8"))
+    return digest.hexdigest()
+
+def table_fingerprint(table: str) -> list:
+    """Row count and largest rowid: cheap (no table scan) and moved by any insert or delete."""
+    return list(db.fetch_one(f"SELECT COUNT(*), MAX(rowid) FROM {db.quote_identifier(table)}",
+                             label="eda_fingerprint"))
+
+def database_fingerprint() -> dict:
+    """Size and mtime of the database file (and of its WAL), so in-place updates count as changes too."""
+    files = {}
+    for path in (db.DB_PATH, db.DB_PATH + "-wal"):
+        if os.path.exists(path):
+            st = os.stat(path)
+            files[os.path.basename(path)] = [st.st_size, st.st_mtime_ns]
+    return files
+
+def stage_fingerprint(stage: Stage, files: dict, tables: dict) -> str:
+    """Fingerprint of everything a stage's output depends on: its code, the database and its input tables."""
+    key = {"code": code_fingerprint(stage), "files": files, "tables": {t: tables[t] for t in stage.inputs}}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_cache(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_cache(path: str, cache: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, path)
+
+def is_up_to_date(entry: dict, fingerprint: str, reports_dir: str) -> bool:
+    """The stage ran with this fingerprint and its output is still the file it wrote."""
+    if not entry or entry.get("fingerprint") != fingerprint:
+        return False
+    path = os.path.join(reports_dir, entry["output"])
+    return os.path.exists(path) and file_hash(path) == entry["output_sha256"]
+
+def run_stage(name: str, out_of_core: bool, reports_dir: str) -> dict:
+    """Computes one stage and writes its output atomically. Runs in a worker process or in-process."""
+    stage = STAGES_BY_NAME[name]
+    if out_of_core:
+        eda_queries.use_temp_files()
+    t0 = time.perf_counter()
+    frame = stage.out_of_core() if out_of_core else stage.in_memory()
+    path = os.path.join(reports_dir, stage.output)
+    frame.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return {"stage": name, "seconds": time.perf_counter() - t0, "peak_rss_mb": peak_memory_mb()}
+
+reports_dir = "reports"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="EDA and analysis reports of the Books/Users/Ratings database, as cached, parallel stages.")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="aggregate inside SQLite instead of loading the tables (for large databases)")
+    parser.add_argument("--stages", nargs="+", choices=[s.name for s in STAGES], default=[s.name for s in STAGES])
+    parser.add_argument("--workers", type=int, default=None,
+                        help="stages run in parallel processes (default: all cores; 1 runs them in this process, "
+                             "loading each table once)")
+    parser.add_argument("--force", action="store_true", help="recompute stages even when they are up to date")
+    args = parser.parse_args()
+
+    ensure_dir(reports_dir)
+    cache_path = os.path.join(reports_dir, ".eda_cache.json")
+    cache = load_cache(cache_path)
+    stages = [STAGES_BY_NAME[name] for name in args.stages]
+
+    t_start = time.perf_counter()
+    files = database_fingerprint()
+    tables = {t: table_fingerprint(t) for t in sorted({t for s in stages for t in s.inputs})}
+    fingerprints = {s.name: stage_fingerprint(s, files, tables) for s in stages}
+    rows = {s.name: {"stage": s.name, "status": "cached", "seconds": 0.0, "peak_rss_mb": np.nan, "output": s.output}
+            for s in stages}
+    todo = [s for s in stages if args.force or not is_up_to_date(cache.get(s.name), fingerprints[s.name], reports_dir)]
+    print(f"{len(todo)} of {len(stages)} stages to run ({'out-of-core' if args.out_of_core else 'in memory'}).")
+
+    def finish(result):
+        stage = STAGES_BY_NAME[result["stage"]]
+        path = os.path.join(reports_dir, stage.output)
+        cache[stage.name] = {"fingerprint": fingerprints[stage.name], "output": stage.output,
+                             "output_sha256": file_hash(path), "seconds": result["seconds"],
+                             "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        save_cache(cache_path, cache)
+        rows[stage.name].update(status="ran", seconds=result["seconds"], peak_rss_mb=result["peak_rss_mb"])
+        print(f"Saved reports/{stage.output}")
+
+    workers = min(args.workers or os.cpu_count() or 1, max(len(todo), 1))
+    if workers > 1:
+        # A fresh process per stage keeps peak_rss_mb specific to it; in memory each one loads the tables it reads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 max_tasks_per_child=1) as pool:
+            futures = [pool.submit(run_stage, s.name, args.out_of_core, reports_dir) for s in todo]
+            for future in as_completed(futures):
+                finish(future.result())
+    else:
+        for s in todo:
+            finish(run_stage(s.name, args.out_of_core, reports_dir))
+
+    timings = pd.DataFrame([rows[s.name] for s in stages])
+    print(timings.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    print(f"Total: {time.perf_counter() - t_start:.2f}s")
+    print("EDA and Analysis Complete.")
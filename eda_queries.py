@@ -0,0 +1,374 @@
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import db
+from rating_stats import weighted_score
+
+# The same reports as eda_analysis.py, computed inside SQLite (GROUP BY, COUNT
+# DISTINCT, IN-subquery joins) instead of on the three tables loaded into
+# pandas. SQLite sorts and de-duplicates in temporary files, so memory stays
+# bounded by the per-user / per-book result sets, never by the Ratings table.
+
+
+# Whitespace pd.to_numeric ignores around a number (C isspace)
+SPACES = "char(32, 9, 10, 11, 12, 13)"
+
+
+def numeric(column: str) -> str:
+    """
+    SQL for pd.to_numeric(column, errors="coerce"): numbers as stored, text
+    that pandas parses converted, anything else NULL. The text grammar, after
+    surrounding whitespace: one optional sign, then inf or infinity (any
+    case), or digits with at most one '.' and a digit before the optional
+    exponent (e or E, one optional sign, digits). Each rule is a GLOB on the
+    text without its sign. Integers of up to 18 significant digits stay
+    integers. Known gaps: '-0' gives 0 where pandas gives -0.0 in a float
+    column, and decimals of more than 15 significant digits can differ in the
+    last bit (pandas' parser does not round correctly). See check_numeric.
+    """
+    c = db.quote_identifier(column)
+    t = f"trim({c}, {SPACES})"
+    u = f"(CASE WHEN {t} GLOB '[+-]*' THEN substr({t}, 2) ELSE {t} END)"
+    number = " AND ".join([
+        f"({u} GLOB '[0-9]*' OR {u} GLOB '.[0-9]*')",  # a digit first, or '.' and a digit
+        f"{u} NOT GLOB '*[^0-9.eE+-]*'",                 # only digits, '.', the exponent and its sign
+        f"{u} NOT GLOB '*.*.*'",                         # at most one '.'
+        f"{u} NOT GLOB '*[eE]*[.eE]*'",                  # one exponent, with no '.' after it
+        f"{u} NOT GLOB '*[^eE][+-]*'",                   # a sign only right after the exponent
+        f"{u} NOT GLOB '*[eE]'",                         # digits after the exponent and its sign
+        f"{u} NOT GLOB '*[eE][+-]'",
+    ])
+    return (f"(CASE typeof({c}) WHEN 'integer' THEN {c} WHEN 'real' THEN {c} WHEN 'text' THEN CASE "
+            f"WHEN instr(CAST({c} AS BLOB), x'00') THEN NULL "  # string functions stop at a NUL
+            f"WHEN {c} GLOB '[0-9]*' AND {c} NOT GLOB '*[^0-9]*' AND length({c}) <= 18 "  # the common cases first
+            f"THEN CAST({c} AS INTEGER) "
+            f"WHEN {c} GLOB '[0-9]*.*' AND {c} NOT GLOB '*[^0-9.]*' AND {c} NOT GLOB '*.*.*' THEN CAST({c} AS REAL) "
+            f"WHEN {u} GLOB '[0-9]*' AND {u} NOT GLOB '*[^0-9]*' AND length(ltrim({u}, '0')) <= 18 "
+            f"THEN CAST({t} AS INTEGER) "
+            f"WHEN {number} THEN CAST({t} AS REAL) "
+            f"WHEN lower({u}) IN ('inf', 'infinity') THEN CASE WHEN {t} GLOB '-*' THEN -1e999 ELSE 1e999 END "
+            f"END END)")
+
+
+# Inputs of check_numeric: well-formed and malformed numbers as they appear in text columns
+NUMERIC_CHECKS = [
+    "0", "7", "-3", "+12", "0010", " 5 ", "\t8\n", "\v1\f", "\r2", "123456789012345678", "12345678901234567890",
+    "1.", ".5", "-.5", "+.25", "3.75", "1e5", "1E+5", "2.5e-3", "1.e3", ".5e1", "-1e999", "1e-999",
+    "inf", "-inf", "+Inf", "INFINITY", "-Infinity", "iNf", "nan", "NaN", "-nan",
+    "", " ", ".", "-", "+", "e", "1e", "e1", "1e+", "1-2", "1+2", "--1", "+-1", "-+1", "1.2.3", "1e5.0", "1e5e5",
+    ".e5", "1.5e", "- 1", "1 2", "1_000", "1,000", "0x10", "1d5", "1.5f", "infinit", "infinityy", "n/a", "NULL",
+    "\xa01", "\uff11", "1\x00", 5, 2.5, None,
+]
+
+
+def check_numeric(values: list = NUMERIC_CHECKS) -> list:
+    """
+    The values where numeric() and pd.to_numeric(errors="coerce") disagree, as
+    (value, SQL result, pandas result); evaluated in an in-memory database.
+    Results are compared as floats, as they are read back in a column with
+    NULLs.
+    """
+    con = sqlite3.connect(":memory:")
+    con.execute('CREATE TABLE t ("v")')
+    con.executemany("INSERT INTO t VALUES (?)", [(v,) for v in values])
+    got = [row[0] for row in con.execute(f'SELECT {numeric("v")} FROM t ORDER BY rowid')]
+    expected = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").tolist()
+    return [(v, g, e) for v, g, e in zip(values, got, expected)
+            if not (g is None and np.isnan(e)) and not (g is not None and float(g) == e)]
+
+
+# Cleaned column expressions, as eda_analysis.py cleans the loaded tables
+CLEANED = {
+    "Books": {"Year-Of-Publication": f"CAST(COALESCE({numeric('Year-Of-Publication')}, 0) AS INTEGER)"},
+    "Users": {"Age": numeric("Age")},
+    "Ratings": {"Book-Rating": numeric("Book-Rating"), "User-ID": numeric("User-ID")},
+}
+
+
+def use_temp_files():
+    """Lets this process's connection spill sorts and DISTINCTs to disk (db.PRAGMAS keeps them in memory)."""
+    db.get_connection().execute("PRAGMA temp_store = FILE")
+
+
+def columns(table: str) -> list:
+    return [row[1] for row in db.table_info(table)]
+
+
+def cleaned_view(table: str) -> str:
+    """SELECT of every column of table, cleaned, under its own name."""
+    cleaned = CLEANED.get(table, {})
+    select = ", ".join(f"{cleaned.get(c, db.quote_identifier(c))} AS {db.quote_identifier(c)}" for c in columns(table))
+    return f"SELECT {select} FROM {db.quote_identifier(table)}"
+
+
+def _dtype(kinds: dict, table: str, column: str) -> str:
+    """
+    The dtype pandas gives the column: read_sql (and the cleaning) applied to one
+    value of each storage class it holds, which is all the inference looks at.
+    """
+    examples = {"integer": 0, "real": 0.0, "text": "", "blob": b"", "null": None}
+    values = [examples[kind] for kind, n in kinds.items() if n]
+    if not values:
+        return "object"
+    frame = db.fetch_df(" UNION ALL ".join(["SELECT ? AS c"] * len(values)), values, label="eda_dtype")
+    if column in CLEANED.get(table, {}):
+        frame["c"] = pd.to_numeric(frame["c"], errors="coerce")
+        if table == "Books" and column == "Year-Of-Publication":
+            frame["c"] = frame["c"].fillna(0).astype(int)
+    return str(frame["c"].dtype)
+
+
+def column_profile(table: str) -> pd.DataFrame:
+    """
+    One pass over table: rows, and per cleaned column its dtype, NULL count and
+    distinct non-NULL values. The rows of schema_and_missingness.csv.
+    """
+    cols = columns(table)
+    parts = ["COUNT(*)"]
+    for i, _ in enumerate(cols):
+        c = f"c{i}"
+        parts += [f"SUM({c} IS NULL)", f"COUNT(DISTINCT {c})"]
+        parts += [f"SUM(typeof({c}) = '{kind}')" for kind in ("integer", "real", "text", "blob")]
+    select = ", ".join(f"{CLEANED.get(table, {}).get(c, db.quote_identifier(c))} AS c{i}" for i, c in enumerate(cols))
+    row = db.fetch_one(f"SELECT {', '.join(parts)} FROM (SELECT {select} FROM {db.quote_identifier(table)})",
+                       label=f"eda_profile:{table}")
+    n = np.int64(row[0])
+    records = []
+    for i, c in enumerate(cols):
+        missing, unique, integer, real, text, blob = (int(v or 0) for v in row[1 + 6 * i:7 + 6 * i])
+        kinds = {"integer": integer, "real": real, "text": text, "blob": blob, "null": missing}
+        records.append({
+            "table": table,
+            "column": c,
+            "dtype": _dtype(kinds, table, c),
+            "missing_count": missing,
+            "missing_pct": round((np.int64(missing) / n) * 100, 4) if n else np.nan,
+            "unique_count": unique,
+        })
+    return pd.DataFrame(records, columns=["table", "column", "dtype", "missing_count", "missing_pct", "unique_count"])
+
+
+def schema_report() -> pd.DataFrame:
+    return pd.concat([column_profile("Books"), column_profile("Users"), column_profile("Ratings")],
+                     ignore_index=True)
+
+
+def duplicate_rows(table: str, subset: list = None) -> int:
+    """Rows equal (after cleaning) to an earlier row, on subset or all columns, as DataFrame.duplicated()."""
+    cols = ", ".join(db.quote_identifier(c) for c in (subset or columns(table)))
+    total, distinct = db.fetch_one(
+        f"SELECT (SELECT COUNT(*) FROM {db.quote_identifier(table)}), "
+        f"(SELECT COUNT(*) FROM (SELECT DISTINCT {cols} FROM ({cleaned_view(table)})))",
+        label=f"eda_duplicates:{table}")
+    return int(total - distinct)
+
+
+def rating_histogram() -> pd.Series:
+    """Count of each cleaned Book-Rating value, ascending (NULLs left out)."""
+    rows = db.fetch_all(f'SELECT r, COUNT(*) FROM (SELECT {numeric("Book-Rating")} AS r FROM Ratings) '
+                        'WHERE r IS NOT NULL GROUP BY r ORDER BY r', label="eda_rating_histogram")
+    return pd.Series([n for _, n in rows], index=[v for v, _ in rows], dtype=np.int64)
+
+
+def ratings_summary() -> dict:
+    """Counts, sum, range and join coverage of the cleaned Ratings in one pass."""
+    row = db.fetch_one(
+        'SELECT COUNT(*), COUNT(r), SUM(r), MIN(r), MAX(r), TOTAL(r = 0), TOTAL(r > 0), COUNT(u), '
+        'TOTAL(CAST(isbn AS TEXT) IN (SELECT CAST("ISBN" AS TEXT) FROM Books) '
+        '      OR (isbn IS NULL AND EXISTS (SELECT 1 FROM Books WHERE "ISBN" IS NULL))), '
+        'TOTAL(u IS NOT NULL AND CAST(u AS INTEGER) IN '
+        '      (SELECT CAST("User-ID" AS INTEGER) FROM Users WHERE "User-ID" IS NOT NULL)) '
+        f'FROM (SELECT {numeric("User-ID")} AS u, "ISBN" AS isbn, {numeric("Book-Rating")} AS r FROM Ratings)',
+        label="eda_ratings_summary")
+    keys = ["rows", "rated", "sum", "min", "max", "zero", "explicit", "users", "isbn_matched", "user_matched"]
+    return dict(zip(keys, row))
+
+
+def median(histogram: pd.Series) -> float:
+    """Series.median() of the values histogram.index repeated histogram times."""
+    n = int(histogram.sum())
+    if not n:
+        return np.nan
+    cumulative = np.cumsum(histogram.to_numpy())
+    values = histogram.index.to_numpy()
+    lower = values[np.searchsorted(cumulative, (n - 1) // 2, side="right")]
+    upper = values[np.searchsorted(cumulative, n // 2, side="right")]
+    return (lower + upper) / 2 if n % 2 == 0 else lower
+
+
+def quantile(values: np.ndarray, frequency: np.ndarray, q: float) -> float:
+    """
+    Series.quantile(q) (numpy's "linear" method) of values[i] repeated
+    frequency[i] times, values ascending, from the histogram alone.
+    """
+    n = int(frequency.sum())
+    virtual = (n - 1) * q
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    cumulative = np.cumsum(frequency)
+    a = values[np.searchsorted(cumulative, int(previous), side="right")]
+    b = values[np.searchsorted(cumulative, min(int(previous) + 1, n - 1), side="right")]
+    diff = b - a
+    # numpy interpolates from the nearer end
+    return b - diff * (1 - gamma) if gamma >= 0.5 else a + diff * gamma
+
+
+def eda_report(schema: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    The rows of eda_report.csv, metric by metric in the same order and with the
+    same value types. Column counts come from schema (schema_report()).
+    """
+    schema = schema_report() if schema is None else schema
+    book_cols, user_cols, rating_cols = columns("Books"), columns("Users"), columns("Ratings")
+    profiles = {table: schema[schema["table"] == table].set_index("column") for table in ("Books", "Users", "Ratings")}
+    summary = ratings_summary()
+    histogram = rating_histogram()
+    n_books, n_users, n_total = (int(db.fetch_scalar(f"SELECT COUNT(*) FROM {t}", label=f"eda_count:{t}"))
+                                 for t in ("Books", "Users", "Ratings"))
+    eda_data = []
+
+    def add(metric, value):
+        eda_data.append({"Metric": metric, "Value": value})
+
+    add("Total Books", n_books)
+    add("Total Users", n_users)
+    add("Total Ratings", n_total)
+
+    add("Duplicate Rows in Books", duplicate_rows("Books"))
+    add("Duplicate Rows in Users", duplicate_rows("Users"))
+    add("Duplicate Rows in Ratings", duplicate_rows("Ratings"))
+
+    if "ISBN" in book_cols:
+        add("Unique ISBN in Books", int(profiles["Books"].loc["ISBN", "unique_count"]))
+    if "User-ID" in user_cols:
+        add("Unique User-ID in Users", int(profiles["Users"].loc["User-ID", "unique_count"]))
+    if {"User-ID", "ISBN"}.issubset(rating_cols):
+        add("Duplicate (User-ID, ISBN) pairs in Ratings", duplicate_rows("Ratings", ["User-ID", "ISBN"]))
+
+    add("Unique Books in Ratings", int(profiles["Ratings"].loc["ISBN", "unique_count"]))
+    add("Unique Users in Ratings", int(profiles["Ratings"].loc["User-ID", "unique_count"]))
+
+    rated = summary["rated"]
+    add("Average Rating (all)", float(summary["sum"] / rated) if rated else np.nan)
+    add("Median Rating (all)", float(median(histogram)))
+    add("Min Rating", float(summary["min"]) if rated else np.nan)
+    add("Max Rating", float(summary["max"]) if rated else np.nan)
+
+    n_zero, n_exp = int(summary["zero"]), int(summary["explicit"])
+    add("Total Rating Rows", n_total)
+    add("Rating Rows where Book-Rating=0", n_zero)
+    add("Rating Rows where Book-Rating>0 (explicit)", n_exp)
+    add("Pct Rating=0", round((n_zero / n_total) * 100, 4) if n_total else np.nan)
+
+    for table in ("Books", "Users", "Ratings"):
+        missing = profiles[table]["missing_count"]
+        nulls = {col: int(cnt) for col, cnt in missing[missing > 0].items()}
+        add(f"{table}: #columns with any nulls", len(nulls))
+        add(f"{table}: null columns (name->count)", json.dumps(nulls, ensure_ascii=False))
+
+    add("Missing Ages", int(profiles["Users"].loc["Age", "missing_count"]))
+    add("Missing Book Authors", int(profiles["Books"].loc["Book-Author", "missing_count"])
+        if "Book-Author" in book_cols else "N/A")
+    add("Missing Publishers", int(profiles["Books"].loc["Publisher", "missing_count"])
+        if "Publisher" in book_cols else "N/A")
+
+    isbn_match_pct = float(summary["isbn_matched"] / n_total * 100) if n_total else np.nan
+    add("Ratings→Books ISBN match %", round(isbn_match_pct, 4))
+    users = summary["users"]
+    user_match_pct = float(summary["user_matched"] / users * 100) if users else np.nan
+    add("Ratings→Users User-ID match %", round(user_match_pct, 4))
+
+    for rating, count in histogram.items():
+        add(f"Count of Rating {int(rating)}", int(count))
+    return pd.DataFrame(eda_data)
+
+
+def _concat(chunks, columns: list) -> pd.DataFrame:
+    frames = list(chunks)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+
+def book_counts(min_count: float, chunksize: int = 500000) -> pd.DataFrame:
+    """
+    Per-ISBN count and sum of the cleaned ratings for ISBNs with at least
+    min_count of them, ISBN ascending like a pandas groupby.
+    """
+    chunks = db.iter_df(
+        f'SELECT "ISBN", COUNT(r) AS count, TOTAL(r) AS total FROM (SELECT "ISBN", {numeric("Book-Rating")} AS r '
+        'FROM Ratings WHERE "ISBN" IS NOT NULL) GROUP BY "ISBN" HAVING COUNT(r) >= ? ORDER BY "ISBN"',
+        params=(float(min_count),), chunksize=chunksize, label="eda_book_counts")
+    return _concat(chunks, ["ISBN", "count", "total"]).set_index("ISBN")
+
+
+def count_histogram() -> tuple:
+    """(counts, number of ISBNs with that many ratings), counts ascending."""
+    rows = db.fetch_all(
+        f'SELECT n, COUNT(*) FROM (SELECT COUNT({numeric("Book-Rating")}) AS n FROM Ratings '
+        'WHERE "ISBN" IS NOT NULL GROUP BY "ISBN") GROUP BY n ORDER BY n', label="eda_count_histogram")
+    return np.array([n for n, _ in rows], dtype=np.int64), np.array([k for _, k in rows], dtype=np.int64)
+
+
+def book_metadata(isbns, columns: list) -> pd.DataFrame:
+    """Books rows of the given ISBNs in table order, duplicates included, as a merge against Books would see."""
+    cols = ", ".join(db.quote_identifier(c) for c in ["ISBN"] + columns)
+    return db.fetch_df(f'SELECT {cols} FROM Books WHERE "ISBN" IN (SELECT value FROM json_each(?)) ORDER BY rowid',
+                       (json.dumps([str(i) for i in isbns]),), label="eda_book_metadata")
+
+
+def top_rated_books(min_ratings: int = 10, n: int = 50) -> pd.DataFrame:
+    """
+    Rows of data_analysis_report.csv. The per-book means are rebuilt exactly as
+    the pandas groupby holds them (same index order and values), so sorting
+    them gives the same order, ties included.
+    """
+    stats = book_counts(min_ratings)
+    avg_ratings = (stats["total"] / stats["count"]).rename("Book-Rating")
+    top_books = avg_ratings.sort_values(ascending=False).head(n).reset_index()
+    top_books = top_books.merge(book_metadata(top_books["ISBN"], ["Book-Title", "Book-Author", "Publisher"]),
+                                on="ISBN", how="left")
+    top_books.columns = ["ISBN", "Average Rating", "Title", "Author", "Publisher"]
+    return top_books
+
+
+def popular_books(quantile_q: float = 0.9, n: int = 100) -> pd.DataFrame:
+    """Rows of popular_books_weighted.csv: weighted score of the books with at least the quantile_q rating count."""
+    values, frequency = count_histogram()
+    m = quantile(values, frequency, quantile_q) if len(values) else np.nan
+    rated, total = db.fetch_one(f'SELECT COUNT(r), SUM(r) FROM (SELECT {numeric("Book-Rating")} AS r FROM Ratings)',
+                                label="eda_rating_mean")
+    C = total / rated if rated else np.nan
+    stats = book_counts(m)
+    book_stats = pd.DataFrame({"count": stats["count"], "mean": stats["total"] / stats["count"]})
+    book_stats["score"] = weighted_score(book_stats["count"], book_stats["mean"], m, C)
+    top_scored_books = book_stats.sort_values("score", ascending=False).head(n).reset_index()
+    return top_scored_books.merge(
+        book_metadata(top_scored_books["ISBN"], ["Book-Title", "Book-Author", "Image-URL-M"]), on="ISBN", how="left")
+
+
+def active_users(n: int = 50, chunksize: int = 500000) -> pd.DataFrame:
+    """Rows of active_users.csv: the per-user rating counts sorted as the pandas groupby result would be."""
+    chunks = db.iter_df(
+        f'SELECT u AS "User-ID", COUNT(r) AS "Book-Rating" FROM (SELECT {numeric("User-ID")} AS u, '
+        f'{numeric("Book-Rating")} AS r FROM Ratings) WHERE u IS NOT NULL GROUP BY u ORDER BY u',
+        chunksize=chunksize, label="eda_user_counts")
+    counts = _concat(chunks, ["User-ID", "Book-Rating"])
+    # A NULL (unparseable) User-ID makes the whole pandas column float
+    if db.fetch_scalar(f'SELECT EXISTS (SELECT 1 FROM Ratings WHERE {numeric("User-ID")} IS NULL)',
+                       label="eda_null_users"):
+        counts["User-ID"] = counts["User-ID"].astype(float)
+    per_user = counts.set_index("User-ID")["Book-Rating"].astype(np.int64)
+    active = per_user.sort_values(ascending=False).head(n).reset_index()
+    active.columns = ["User-ID", "Rating Count"]
+    return active
+
+
+if __name__ == "__main__":
+    # Checks the SQL cleaning against pandas; exits non-zero on any difference
+    mismatches = check_numeric()
+    for value, sql, expected in mismatches:
+        print(f"numeric({value!r}): SQL {sql!r}, pandas {expected!r}")
+    print(f"{len(NUMERIC_CHECKS) - len(mismatches)} of {len(NUMERIC_CHECKS)} values match pd.to_numeric.")
+    raise SystemExit(1 if mismatches else 0)
@@ -0,0 +1,192 @@
+import argparse
+import itertools
+import multiprocessing as mp
+import os
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+from ingest import RatingsData, stream_ratings
+
+reports_dir = "reports"
+
+
+def holdout_split(user_codes: np.ndarray, n_users: int, test_fraction: float = 0.2, seed: int = 42) -> np.ndarray:
+    """
+    Per-user holdout: a random test_fraction of every user's ratings (at least
+    one, never all of them; users with a single rating stay in training).
+    Returns a boolean mask over the rating rows, True for held-out rows.
+    """
+    rng = np.random.default_rng(seed)
+    counts = np.bincount(user_codes, minlength=n_users)
+    order = np.lexsort((rng.random(len(user_codes)), user_codes))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts[user_codes[order]]
+    n_test = np.where(counts >= 2, np.maximum(1, np.floor(counts * test_fraction)), 0)
+    return rank < n_test[user_codes]
+
+
+def ranking_metrics(recommender, user_rows: np.ndarray, relevant: sparse.csr_matrix, n_relevant: np.ndarray,
+                    k: int = 10, batch_size: int = 1024) -> dict:
+    """
+    Mean precision@k, recall@k and NDCG@k of recommender.top_k over user_rows,
+    plus the share of the catalogue that appears in any top k. relevant[i]
+    marks the held-out items of user_rows[i] that the model knows; n_relevant[i]
+    counts all of them, so held-out books outside the model count as misses.
+    Users are scored batch_size at a time.
+    """
+    discount = 1 / np.log2(np.arange(2, k + 2))
+    ideal = np.concatenate([[1.0], np.cumsum(discount)])
+    precision = recall = ndcg = 0.0
+    recommended = np.zeros(recommender.n_items, dtype=bool)
+    for start in range(0, len(user_rows), batch_size):
+        rows = user_rows[start:start + batch_size]
+        idx, scores = recommender.top_k(rows, k)
+        valid = np.isfinite(scores)
+        idx = np.where(valid, idx, 0)
+        batch = relevant[start:start + len(rows)]
+        hits = (np.asarray(batch[np.arange(len(rows))[:, None], idx].todense()) > 0) & valid
+        n_rel = n_relevant[start:start + len(rows)]
+        n_hits = hits.sum(axis=1)
+        precision += (n_hits / k).sum()
+        recall += (n_hits / n_rel).sum()
+        ndcg += ((hits * discount[:idx.shape[1]]).sum(axis=1) / ideal[np.minimum(n_rel, k)]).sum()
+        recommended[idx[valid]] = True
+    n = max(len(user_rows), 1)
+    return {
+        f'precision@{k}': precision / n,
+        f'recall@{k}': recall / n,
+        f'ndcg@{k}': ndcg / n,
+        'catalog_coverage': recommended.mean() if len(recommended) else 0.0,
+    }
+
+
+def evaluate_config(config: dict, data_path: str, k: int, batch_size: int) -> dict:
+    """Filters and trains one configuration on the training split and scores it on the held-out ratings."""
+    # One BLAS thread per process: the parallelism comes from the pool
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+    warnings.filterwarnings('ignore', module='sklearn')
+    from ingest import peak_memory_mb
+    from recommender import Recommender
+    import train_model
+
+    with np.load(data_path) as data:
+        user_codes, book_codes, ratings, test = data['user_codes'], data['book_codes'], data['ratings'], data['test']
+        n_users, n_books = int(data['n_users']), int(data['n_books'])
+
+    # Codes double as ids, so the filtered data maps its rows/columns back to raw codes
+    train = RatingsData(np.arange(n_users), np.arange(n_books), user_codes[~test], book_codes[~test],
+                        ratings[~test]).filter(config['min_book_ratings'], config['min_user_ratings'])
+    matrix = train_model.build_user_item_matrix(train)
+
+    kwargs = {'n_components': config['n_components'], 'max_iter': config['max_iter']}
+    if config['engine'] == 'als':
+        kwargs.update(n_jobs=1, verbose=False)
+    t0 = time.perf_counter()
+    model_data = train_model.ENGINES[config['engine']](matrix, **kwargs)
+    fit_seconds = time.perf_counter() - t0
+
+    # Held-out ratings of users the model knows, in model row / column space
+    user_row = np.full(n_users, -1, dtype=np.int64)
+    user_row[train.user_ids] = np.arange(len(train.user_ids))
+    book_col = np.full(n_books, -1, dtype=np.int64)
+    book_col[train.isbns] = np.arange(len(train.isbns))
+    test_users = np.unique(user_codes[test])
+    rows = user_row[user_codes[test]]
+    cols = book_col[book_codes[test]]
+    users = np.unique(rows[rows >= 0])
+    n_relevant = np.bincount(rows[rows >= 0], minlength=matrix.shape[0])[users]
+    known = (rows >= 0) & (cols >= 0)
+    relevant = sparse.csr_matrix((np.ones(known.sum()), (rows[known], cols[known])), shape=matrix.shape)[users]
+
+    rec = Recommender(model_data['user_features'], model_data['item_features'], matrix)
+    metrics = ranking_metrics(rec, users, relevant, n_relevant, k, batch_size)
+    return {
+        **config,
+        'n_users': matrix.shape[0],
+        'n_items': matrix.shape[1],
+        'train_ratings': matrix.nnz,
+        'users_evaluated': len(users),
+        'user_coverage': len(users) / max(len(test_users), 1),
+        **metrics,
+        'fit_seconds': fit_seconds,
+        'peak_rss_mb': peak_memory_mb(),
+    }
+
+
+def sweep_configs(args) -> list:
+    """Every combination of the swept values, or args.random of them drawn without replacement."""
+    grid = [dict(zip(('engine', 'n_components', 'max_iter', 'min_book_ratings', 'min_user_ratings'), values))
+            for values in itertools.product(args.engine, args.n_components, args.max_iter,
+                                            args.min_book_ratings, args.min_user_ratings)]
+    if args.random and args.random < len(grid):
+        rng = np.random.default_rng(args.seed)
+        grid = [grid[i] for i in sorted(rng.choice(len(grid), args.random, replace=False))]
+    return grid
+
+
+def main(args):
+    print("Loading ratings...")
+    data, _ = stream_ratings(args.chunk_size)
+    test = holdout_split(data.user_codes, len(data.user_ids), args.test_fraction, args.seed)
+    print(f"{len(data):,} ratings, {len(data.user_ids):,} users; {int(test.sum()):,} held out.")
+
+    configs = sweep_configs(args)
+    workers = min(args.workers or os.cpu_count() or 1, len(configs))
+    print(f"Evaluating {len(configs)} configurations with {workers} workers...")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, 'ratings.npz')
+        np.savez(data_path, user_codes=data.user_codes, book_codes=data.book_codes, ratings=data.ratings,
+                 test=test, n_users=len(data.user_ids), n_books=len(data.isbns))
+        del data
+
+        # A fresh process per configuration keeps peak_rss_mb specific to it
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                                 max_tasks_per_child=1) as pool:
+            futures = [pool.submit(evaluate_config, config, data_path, args.k, args.batch_size)
+                       for config in configs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"  {len(results)}/{len(configs)} {result['engine']} n_components={result['n_components']} "
+                      f"max_iter={result['max_iter']} min_book={result['min_book_ratings']} "
+                      f"min_user={result['min_user_ratings']}: ndcg@{args.k}={result[f'ndcg@{args.k}']:.4f}, "
+                      f"fit {result['fit_seconds']:.1f}s, {result['peak_rss_mb']:,.0f} MB")
+
+    report = pd.DataFrame(results).sort_values(f'ndcg@{args.k}', ascending=False)
+    os.makedirs(reports_dir, exist_ok=True)
+    path = os.path.join(reports_dir, args.output)
+    report.to_csv(path, index=False)
+    print(report.to_string(index=False))
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    import train_model
+
+    parser = argparse.ArgumentParser(
+        description="Offline ranking quality (per-user holdout) of training configurations, swept in parallel.")
+    parser.add_argument('--engine', nargs='+', choices=sorted(train_model.ENGINES), default=['nmf'])
+    parser.add_argument('--n-components', nargs='+', type=int, default=[train_model.n_components])
+    parser.add_argument('--max-iter', nargs='+', type=int, default=[train_model.nmf_max_iter],
+                        help="NMF max_iter / ALS iterations")
+    parser.add_argument('--min-book-ratings', nargs='+', type=int, default=[train_model.min_book_ratings])
+    parser.add_argument('--min-user-ratings', nargs='+', type=int, default=[train_model.min_user_ratings])
+    parser.add_argument('--random', type=int, default=0, help="evaluate this many random grid points instead of all")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--batch-size', type=int, default=1024, help="users scored per batch")
+    parser.add_argument('--chunk-size', type=int, default=500000)
+    parser.add_argument('--output', default="evaluation_sweep.csv")
+    main(parser.parse_args())
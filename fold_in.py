@@ -0,0 +1,124 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import nnls
+
+import db
+from cache import LRUCache
+
+# vector: user factor; item_indices: rated items known to the model; stale: True when the
+# trained user_features row is missing or older than the user's current ratings (a book or
+# a rating the model was not trained on).
+Projection = namedtuple('Projection', ['vector', 'item_indices', 'stale'])
+
+
+class FoldIn:
+    """
+    Projects a user's current ratings onto the fixed item factors, so users the
+    model has never seen (new, or dropped by min_user_ratings) and users with
+    ratings newer than the last train_model.py run get personalised scores
+    without retraining.
+
+    NMF models solve the non-negative least-squares problem of the NMF
+    objective, min ||r - H^T x|| with x >= 0, in its f x f normal-equation
+    form. ALS models solve the same confidence-weighted normal equations as
+    the trainer. Results are kept in a small LRU cache keyed by the user and
+    their ratings.
+
+    With the model's watermark (the highest Ratings rowid it was trained on),
+    only rows above it are read per call: a trained user without any is
+    answered from the model, and the rows up to it are read once per user and
+    cached, since they cannot change for this model.
+    """
+
+    def __init__(self, model_data: dict, book_store, user_items, user_map, cache_size: int = 1024,
+                 watermark: int = None):
+        self.engine = model_data.get('engine', 'nmf')
+        self.params = model_data.get('params', {})
+        self.item_features = np.asarray(model_data['item_features'], dtype=np.float64)
+        self.gram = self.item_features @ self.item_features.T
+        self.book_store = book_store
+        self.user_items = user_items
+        self.user_map = user_map
+        self.cache_size = cache_size
+        self._cache = LRUCache(max_entries=cache_size, max_bytes=16 * 2 ** 20)
+        self.watermark = watermark
+        self._trained_ratings = LRUCache(max_entries=cache_size, max_bytes=64 * 2 ** 20)
+
+        if self.engine == 'nmf':
+            # G = L L^T, so ||H^T x - r||^2 = ||L^T x - L^-1 H r||^2 + const
+            ridge = 1e-10 * np.trace(self.gram) / len(self.gram)
+            self._chol = np.linalg.cholesky(self.gram + ridge * np.eye(len(self.gram)))
+
+    def solve(self, item_indices: np.ndarray, ratings: np.ndarray) -> np.ndarray:
+        """User factor for ratings on the given item indices."""
+        V = self.item_features[:, item_indices]
+        ratings = np.asarray(ratings, dtype=np.float64)
+        if self.engine == 'als':
+            weight = np.where(ratings > 0, ratings, self.params.get('implicit_weight', 1.0))
+            c1 = self.params.get('alpha', 2.0) * weight
+            A = self.gram + (V * c1) @ V.T + self.params.get('regularization', 0.1) * np.eye(len(self.gram))
+            return np.linalg.solve(A, V @ (c1 + 1))
+        rhs = np.linalg.solve(self._chol, V @ ratings)
+        return nnls(self._chol.T, rhs)[0]
+
+    def project(self, user_id, ratings=None) -> Projection:
+        """
+        Projection of the user's ratings currently in the database, or None when
+        none of them is on a book the model knows (or they carry no signal), or
+        when the user was trained and has rated nothing since (the trained row
+        is current). ratings is the user's db.user_ratings frame when the caller
+        already has it.
+        """
+        if ratings is None:
+            ratings = self.current_ratings(user_id)
+            if ratings is None:
+                return None
+        ratings = ratings.dropna(subset=['Book-Rating'])
+        items = self.book_store.indices_of(ratings['ISBN'])
+        known = items >= 0
+        items = items[known]
+        values = ratings['Book-Rating'].to_numpy(np.float64)[known]
+        if not len(items):
+            return None
+        order = np.argsort(items, kind='stable')
+        items, values = items[order], values[order]
+
+        row = self.user_map.get(user_id)
+        stale = row is None or not self._trained_on(row, items, values)
+
+        key = (user_id, hash(items.tobytes() + values.tobytes()))
+        vector = self._cache.get_or_compute(key, lambda: self.solve(items, values))
+
+        if not np.any(vector):
+            return None
+        return Projection(vector, items, stale)
+
+    def _trained_on(self, row: int, items: np.ndarray, values: np.ndarray) -> bool:
+        """
+        Whether the training row holds the latest rating of every book in items
+        (sorted, each book's ratings in rowid order): a re-rated book is stale too.
+        """
+        span = slice(self.user_items.indptr[row], self.user_items.indptr[row + 1])
+        trained_items = np.asarray(self.user_items.indices[span])
+        if not len(trained_items):
+            return False
+        order = np.argsort(trained_items, kind='stable')
+        trained_items, trained_values = trained_items[order], np.asarray(self.user_items.data[span])[order]
+        latest = np.append(items[1:] != items[:-1], True)
+        items, values = items[latest], values[latest]
+        pos = np.minimum(np.searchsorted(trained_items, items), len(trained_items) - 1)
+        return bool(np.all((trained_items[pos] == items) & (trained_values[pos] == values)))
+
+    def current_ratings(self, user_id):
+        """The user's ratings in the database, or None for a trained user with no rows above the watermark."""
+        if self.watermark is None:
+            return db.user_ratings(user_id)
+        trained_user = self.user_map is not None and user_id in self.user_map
+        if trained_user and not db.rated_since(user_id, self.watermark):
+            return None
+        new = db.user_ratings(user_id, since=self.watermark)
+        trained = self._trained_ratings.get_or_compute(
+            user_id, lambda: db.user_ratings(user_id, until=self.watermark))
+        return pd.concat([trained, new], ignore_index=True) if len(new) else trained
@@ -0,0 +1,334 @@
+import argparse
+import math
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# ---------------------------
+# Shape of the Book-Crossing data behind database/user_rate_book.db
+# ---------------------------
+USERS_PER_RATING = 0.2425      # 278,858 users for 1,149,780 ratings
+ACTIVE_USER_SHARE = 0.378      # 105,283 users have at least one rating
+ISBNS_PER_RATING = 0.6         # catalogue the popularity curve draws from (~0.3 distinct rated ISBNs per rating)
+BOOKS_ROW_SHARE = 0.5          # most popular part of the catalogue with Books rows (~0.28 per rating)
+MISSING_BOOK_SHARE = 0.05      # ISBNs in that part without one anyway (~17% of ratings lack metadata)
+IMPLICIT_SHARE = 0.623         # Book-Rating = 0
+EXPLICIT_COUNTS = [1770, 2759, 5996, 8904, 50974, 36924, 76457, 103736, 67541, 78610]  # ratings 1..10
+MISSING_AGE_SHARE = 0.397
+USER_EXPONENT = 0.95           # Zipf exponent of ratings per user
+BOOK_EXPONENT = 0.9            # Zipf exponent of ratings per book
+N_GENRES = 24
+TASTE_SHARE = 0.6              # share of a user's books drawn from their own genre
+
+# The sample users of the app's sidebar: always present and among the most active,
+# so every page has data whatever the size
+APP_USERS = [11676, 198711, 153662, 98391, 35859, 212898]
+
+ADJECTIVES = ['Silent', 'Hidden', 'Last', 'Lost', 'Dark', 'Golden', 'Broken', 'Secret', 'Wild', 'Little', 'Burning',
+              'Forgotten', 'Endless', 'Bright', 'Distant', 'Crimson', 'Quiet', 'Bitter', 'Sweet', 'Cold', 'Final',
+              'Wandering', 'Perfect', 'Glass', 'Iron', 'Midnight', 'Summer', 'Northern', 'Painted', 'Fallen']
+NOUNS = ['River', 'Garden', 'House', 'Winter', 'Kingdom', 'Shadow', 'Promise', 'Island', 'Letter', 'Road', 'Storm',
+         'Daughter', 'Witness', 'Harbor', 'Mountain', 'Secret', 'Journey', 'Bridge', 'Empire', 'Voice', 'Fire',
+         'Orchard', 'Season', 'Mirror', 'Stranger', 'Crown', 'Tide', 'Forest', 'Heart', 'Night']
+GENRE_WORDS = ['Murder', 'Love', 'Dragon', 'Ghost', 'Spy', 'Stars', 'War', 'Cooking', 'Money', 'Soul', 'Detective',
+               'Wizard', 'Sea', 'Horse', 'City', 'Time', 'Family', 'Mind', 'Machine', 'Saint', 'Thief', 'Desert',
+               'Song', 'Garden']
+FIRST_NAMES = ['John', 'Mary', 'James', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William', 'Elizabeth',
+               'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+               'Stephen', 'Nora', 'Anne', 'Dean', 'Janet', 'Nicholas', 'Danielle', 'Dan', 'Toni', 'Agatha', 'Neil',
+               'Maeve', 'Terry', 'Sue', 'Tom', 'Ursula', 'Isaac', 'Jane', 'Mark', 'Alice']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Miller', 'Davis', 'Garcia', 'Wilson', 'Anderson',
+              'Taylor', 'Thomas', 'Moore', 'Martin', 'Jackson', 'Thompson', 'White', 'Harris', 'Clark', 'Lewis',
+              'King', 'Roberts', 'Koontz', 'Grisham', 'Steel', 'Evanovich', 'Christie', 'Pratchett', 'Binchy',
+              'Grafton', 'Clancy', 'Le Guin', 'Asimov', 'Austen', 'Twain', 'Atwood', 'Rice', 'Crichton', 'Gaiman',
+              'Patterson']
+PUBLISHERS = ['Ballantine Books', 'Pocket', 'Berkley Publishing Group', 'Warner Books', 'Harlequin', 'Bantam Books',
+              'Bantam', 'Signet Book', 'Penguin Books', 'Avon', 'HarperCollins', 'Fawcett Books', 'Random House',
+              'St. Martin\'s Press', 'Scholastic', 'Simon & Schuster', 'Tor Books', 'Vintage', 'Dell', 'Zebra Books',
+              'Jove Books', 'Doubleday', 'Del Rey', 'Little, Brown', 'Orbit', 'Knopf', 'Anchor', 'Penguin USA',
+              'Goldmann', 'Heyne']
+LOCATIONS = ['toronto, ontario, canada', 'chicago, illinois, usa', 'seattle, washington, usa',
+             'portland, oregon, usa', 'london, england, united kingdom', 'san diego, california, usa',
+             'madrid, madrid, spain', 'barcelona, barcelona, spain', 'houston, texas, usa', 'new york, new york, usa',
+             'austin, texas, usa', 'vancouver, british columbia, canada', 'sydney, new south wales, australia',
+             'melbourne, victoria, australia', 'berlin, berlin, germany', 'milano, lombardia, italy',
+             'lisboa, lisboa, portugal', 'dublin, n/a, ireland', 'boston, massachusetts, usa', 'denver, colorado, usa',
+             'ottawa, ontario, canada', 'montreal, quebec, canada', 'munich, bavaria, germany', 'paris, n/a, france',
+             'auckland, auckland, new zealand', 'n/a, n/a, n/a']
+
+SCHEMA = [
+    'CREATE TABLE Users ("User-ID" INTEGER, "Location" TEXT, "Age" REAL)',
+    'CREATE TABLE Books ("ISBN" TEXT, "Book-Title" TEXT, "Book-Author" TEXT, "Year-Of-Publication" INTEGER, '
+    '"Publisher" TEXT, "Image-URL-S" TEXT, "Image-URL-M" TEXT, "Image-URL-L" TEXT)',
+    'CREATE TABLE Ratings ("User-ID" INTEGER, "ISBN" TEXT, "Book-Rating" INTEGER)',
+]
+
+# Bulk-load settings: the file is built under a temporary name and renamed when
+# complete, so no journal or fsync is needed
+LOAD_PRAGMAS = {
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'locking_mode': 'EXCLUSIVE',
+    'temp_store': 'MEMORY',
+    'cache_size': -64 * 1024,
+}
+
+
+def parse_count(value: str) -> int:
+    """'1M', '10m', '250k', '1e6' or a plain integer."""
+    value = str(value).strip().lower().replace('_', '').replace(',', '')
+    scale = {'k': 10 ** 3, 'm': 10 ** 6, 'b': 10 ** 9}.get(value[-1:], 1)
+    if scale > 1:
+        value = value[:-1]
+    return int(float(value) * scale)
+
+
+def zipf_weights(n: int, exponent: float, offset: float = 1.0) -> np.ndarray:
+    """Probabilities of ranks 0..n-1, proportional to (rank + offset) ** -exponent."""
+    weights = (np.arange(n) + offset) ** -exponent
+    return weights / weights.sum()
+
+
+def zipf_cdf(n: int, exponent: float, offset: float = 1.0) -> np.ndarray:
+    cdf = np.cumsum(zipf_weights(n, exponent, offset))
+    return cdf / cdf[-1]
+
+
+def sample_ranks(rng, cdf: np.ndarray, size: int) -> np.ndarray:
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), len(cdf) - 1)
+
+
+class Catalogue:
+    """
+    The ISBN universe. Books are drawn by popularity rank; rank r belongs to
+    genre r % n_genres and maps to a catalogue index through a fixed
+    permutation, so popularity is unrelated to ISBN order and nothing of size
+    n_books has to be kept besides the two popularity curves.
+    """
+
+    def __init__(self, n_books: int, n_genres: int = N_GENRES, exponent: float = BOOK_EXPONENT):
+        self.n_genres = n_genres
+        self.n_books = max(n_genres, math.ceil(n_books / n_genres) * n_genres)
+        self.popularity = zipf_cdf(self.n_books, exponent, offset=2.0)
+        self.genre_popularity = zipf_cdf(self.n_books // n_genres, exponent, offset=2.0)
+        stride = 1_000_003
+        while math.gcd(stride, self.n_books) != 1:
+            stride += 2
+        self.stride = stride
+        self.inverse = pow(stride, -1, self.n_books)
+
+    def sample(self, rng, genres: np.ndarray) -> np.ndarray:
+        """Popularity ranks, TASTE_SHARE of them from the given genre, the rest from the whole catalogue."""
+        ranks = sample_ranks(rng, self.popularity, len(genres))
+        own = rng.random(len(genres)) < TASTE_SHARE
+        ranks[own] = sample_ranks(rng, self.genre_popularity, int(own.sum())) * self.n_genres + genres[own]
+        return ranks
+
+    def index_of(self, ranks: np.ndarray) -> np.ndarray:
+        return ranks.astype(np.int64) * self.stride % self.n_books
+
+    def rank_of(self, indices: np.ndarray) -> np.ndarray:
+        return indices.astype(np.int64) * self.inverse % self.n_books
+
+    @staticmethod
+    def isbns(indices: np.ndarray) -> np.ndarray:
+        """Valid ISBN-10 strings (check digit included), one per catalogue index."""
+        body = (indices.astype(np.int64) * 7919 + 10 ** 8) % 10 ** 9
+        digits = body[:, None] // 10 ** np.arange(8, -1, -1) % 10
+        check = (11 - (digits * np.arange(10, 1, -1)).sum(axis=1) % 11) % 11
+        chars = np.array(list('0123456789X'), dtype=object)
+        return np.char.zfill(body.astype(str), 9).astype(object) + chars[check]
+
+    def has_metadata(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Whether an ISBN gets a Books row: the BOOKS_ROW_SHARE most popular, less
+        MISSING_BOOK_SHARE of them picked by a fixed hash of the index.
+        """
+        hashed = (indices.astype(np.uint64) * np.uint64(2654435761)) >> np.uint64(8)
+        return ((self.rank_of(indices) < BOOKS_ROW_SHARE * self.n_books)
+                & (hashed % np.uint64(1000) >= np.uint64(MISSING_BOOK_SHARE * 1000)))
+
+
+# ---------------------------
+# Table writers (each yields row tuples chunk by chunk)
+# ---------------------------
+def book_rows(rng, catalogue: Catalogue, chunk_size: int):
+    adjectives, nouns = np.array(ADJECTIVES, dtype=object), np.array(NOUNS, dtype=object)
+    genre_words = np.array(GENRE_WORDS * (catalogue.n_genres // len(GENRE_WORDS) + 1), dtype=object)
+    authors = np.array([f'{f} {l}' for l in LAST_NAMES for f in FIRST_NAMES], dtype=object)
+    author_cdf = zipf_cdf(len(authors), 0.8, offset=5.0)
+    publishers = np.array(PUBLISHERS, dtype=object)
+    publisher_cdf = zipf_cdf(len(publishers), 1.0, offset=2.0)
+    url = 'http://images.amazon.com/images/P/'
+
+    for start in range(0, catalogue.n_books, chunk_size):
+        indices = np.arange(start, min(start + chunk_size, catalogue.n_books))
+        indices = indices[catalogue.has_metadata(indices)]
+        n = len(indices)
+        isbns = catalogue.isbns(indices)
+        genres = catalogue.rank_of(indices) % catalogue.n_genres
+        titles = np.where(rng.random(n) < 0.5,
+                          'The ' + adjectives[rng.integers(len(adjectives), size=n)] + ' ' + genre_words[genres],
+                          genre_words[genres] + ' of the ' + adjectives[rng.integers(len(adjectives), size=n)] + ' '
+                          + nouns[rng.integers(len(nouns), size=n)])
+        author = authors[sample_ranks(rng, author_cdf, n)]
+        author[rng.random(n) < 1e-5] = None
+        years = np.where(rng.random(n) < 0.017, 0, np.clip(np.round(2004 - rng.gamma(2.0, 6.0, n)), 1900, 2004))
+        publisher = publishers[sample_ranks(rng, publisher_cdf, n)]
+        publisher[rng.random(n) < 1e-5] = None
+        yield list(zip(isbns, titles, author, years.astype(np.int64).tolist(), publisher,
+                       url + isbns + '.01.THUMBZZZ.jpg', url + isbns + '.01.MZZZZZZZ.jpg',
+                       url + isbns + '.01.LZZZZZZZ.jpg'))
+
+
+def user_rows(rng, user_ids: np.ndarray, chunk_size: int):
+    locations = np.array(LOCATIONS, dtype=object)
+    location_cdf = zipf_cdf(len(locations), 1.0, offset=3.0)
+    for start in range(0, len(user_ids), chunk_size):
+        ids = user_ids[start:start + chunk_size]
+        n = len(ids)
+        ages = np.clip(np.round(rng.normal(35, 13, n)), 5, 99)
+        outliers = rng.random(n) < 0.005
+        ages[outliers] = rng.choice([0, 1, 2, 103, 104, 113, 116, 201, 228, 244], int(outliers.sum()))
+        ages = ages.astype(object)
+        ages[rng.random(n) < MISSING_AGE_SHARE] = None
+        yield list(zip(ids.tolist(), locations[sample_ranks(rng, location_cdf, n)], ages))
+
+
+def rating_rows(rng, catalogue: Catalogue, user_ids: np.ndarray, activity: np.ndarray, chunk_size: int,
+                max_rounds: int = 8):
+    """
+    Ratings in User-ID order (like the original table), about chunk_size per
+    chunk. Each user rates up to activity[u] distinct books: books are drawn,
+    repeated pairs are dropped and the shortfall is drawn again, at most
+    max_rounds times. Explicit ratings lean up for books of the user's genre
+    and down for the others, which gives the models some signal to find.
+    """
+    explicit = np.array(EXPLICIT_COUNTS, dtype=float) / sum(EXPLICIT_COUNTS)
+    cumulative = np.cumsum(activity)
+    ends = np.searchsorted(cumulative, np.arange(chunk_size, cumulative[-1], chunk_size)) + 1
+    lo = 0
+    for hi in np.unique(np.append(ends, len(user_ids))):
+        target = activity[lo:hi]
+        genres = rng.integers(catalogue.n_genres, size=hi - lo)
+        keys = np.empty(0, dtype=np.int64)
+        need = target
+        for _ in range(max_rounds):
+            local = np.repeat(np.arange(hi - lo), need)
+            keys = np.unique(np.concatenate([keys, local * catalogue.n_books + catalogue.sample(rng, genres[local])]))
+            need = target - np.bincount(keys // catalogue.n_books, minlength=hi - lo)
+            if not need.any():
+                break
+        # Shuffle each user's books (np.unique left them in popularity order)
+        keys = keys[rng.permutation(len(keys))]
+        keys = keys[np.argsort(keys // catalogue.n_books, kind='stable')]
+        local, ranks = keys // catalogue.n_books, keys % catalogue.n_books
+
+        n = len(local)
+        values = rng.choice(np.arange(1, 11), n, p=explicit)
+        match = ranks % catalogue.n_genres == genres[local]
+        bump = (match & (rng.random(n) < 0.4)).astype(np.int64) - (~match & (rng.random(n) < 0.2))
+        values = np.clip(values + bump, 1, 10)
+        values[rng.random(n) < IMPLICIT_SHARE] = 0
+        isbns = catalogue.isbns(catalogue.index_of(ranks))
+        yield list(zip(user_ids[lo:hi][local].tolist(), isbns, values.tolist()))
+        lo = hi
+
+
+# ---------------------------
+# Driver
+# ---------------------------
+def generate(path: str, n_ratings: int, n_users: int = None, n_books: int = None, seed: int = 42,
+             chunk_size: int = 250000, index: bool = False, verbose: bool = True) -> dict:
+    """
+    Writes a database with the Users, Books and Ratings tables of
+    database/user_rate_book.db to path, with about n_ratings ratings. Users and
+    books default to the proportions of the original data. Memory grows with
+    the number of users and books, not ratings: rows are generated and inserted
+    chunk_size at a time. Returns row counts and timings.
+    """
+    t0 = time.perf_counter()
+    n_users = n_users or max(int(n_ratings * USERS_PER_RATING), 10)
+    catalogue = Catalogue(n_books or max(int(n_ratings * ISBNS_PER_RATING), 100))
+    rng = np.random.default_rng(seed)
+
+    # Users: ids 1..n_users plus the app's sample users; the active ones get Zipf activity
+    user_ids = np.union1d(np.arange(1, n_users + 1), APP_USERS)
+    n_active = min(max(int(len(user_ids) * ACTIVE_USER_SHARE), len(APP_USERS)), len(user_ids), n_ratings)
+    counts = 1 + rng.multinomial(n_ratings - n_active, zipf_weights(n_active, USER_EXPONENT, offset=5.0))
+    counts = np.minimum(np.sort(counts)[::-1], catalogue.n_books // 4)
+    app = np.searchsorted(user_ids, APP_USERS)
+    others = np.setdiff1d(np.arange(len(user_ids)), app)
+    active = np.concatenate([app, rng.choice(others, n_active - len(app), replace=False)])
+    activity = np.zeros(len(user_ids), dtype=np.int64)
+    activity[active[:len(app)]] = counts[:len(app)]
+    activity[rng.permutation(active[len(app):])] = counts[len(app):]
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    for name, value in LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    summary = {}
+    tables = [
+        ('Users', 'INSERT INTO Users VALUES (?, ?, ?)', user_rows(rng, user_ids, chunk_size)),
+        ('Books', 'INSERT INTO Books VALUES (?, ?, ?, ?, ?, ?, ?, ?)', book_rows(rng, catalogue, chunk_size)),
+        ('Ratings', 'INSERT INTO Ratings VALUES (?, ?, ?)',
+         rating_rows(rng, catalogue, user_ids, activity, chunk_size)),
+    ]
+    for table, sql, chunks in tables:
+        t_table, rows = time.perf_counter(), 0
+        for i, chunk in enumerate(chunks):
+            conn.executemany(sql, chunk)
+            rows += len(chunk)
+            if verbose and i % 10 == 9:
+                print(f"  {table}: {rows:,} rows ({rows / (time.perf_counter() - t_table):,.0f} rows/s)")
+        conn.commit()
+        summary[table] = rows
+        summary[f'{table}_seconds'] = time.perf_counter() - t_table
+        if verbose:
+            print(f"  {table}: {rows:,} rows in {summary[f'{table}_seconds']:.1f}s")
+
+    if index:
+        if verbose:
+            print("Creating indexes...")
+        conn.execute('CREATE INDEX idx_ratings_user ON Ratings ("User-ID")')
+        conn.execute('CREATE INDEX idx_ratings_isbn ON Ratings ("ISBN")')
+        conn.execute('CREATE INDEX idx_books_isbn ON Books ("ISBN")')
+        conn.commit()
+    conn.close()
+    os.replace(tmp, path)
+    summary['seconds'] = time.perf_counter() - t0
+    return summary
+
+
+def main(args):
+    if os.path.exists(args.output) and not args.force:
+        raise SystemExit(f"{args.output} exists; pass --force to replace it.")
+    print(f"Generating ~{args.ratings:,} ratings into {args.output}...")
+    summary = generate(args.output, args.ratings, args.users, args.books, args.seed, args.chunk_size, args.index)
+    print(f"Done in {summary['seconds']:.1f}s: {summary['Users']:,} users, {summary['Books']:,} books, "
+          f"{summary['Ratings']:,} ratings ({summary['Ratings'] / summary['Ratings_seconds']:,.0f} ratings/s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Synthetic Users/Books/Ratings database with the schema of database/user_rate_book.db.")
+    parser.add_argument('--ratings', type=parse_count, default=parse_count('1M'), help="e.g. 1M, 10M, 100M")
+    parser.add_argument('--users', type=parse_count, default=None, help="Users rows (default: scaled to --ratings)")
+    parser.add_argument('--books', type=parse_count, default=None,
+                        help="ISBN catalogue size (default: scaled to --ratings)")
+    parser.add_argument('--output', default=os.path.join('database', 'user_rate_book.db'))
+    parser.add_argument('--force', action='store_true', help="replace an existing output file")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=250000, help="rows generated and inserted per batch")
+    parser.add_argument('--index', action='store_true',
+                        help="also index Ratings by User-ID and ISBN and Books by ISBN (faster per-user app queries)")
+    main(parser.parse_args())
@@ -0,0 +1,194 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import db
+from book_store import StringColumn
+
+models_dir = 'models'
+USERS_FILE = 'history_users.npy'
+OFFSETS_FILE = 'history_offsets.npy'
+BOOKS_FILE = 'history_books.npy'
+RATINGS_FILE = 'history_ratings.npy'
+ISBNS_NAME = 'history_isbns'
+
+
+class RatingHistory:
+    """
+    Every user's ratings in CSR layout: the ratings of users[r] (sorted
+    User-IDs) are books[offsets[r]:offsets[r + 1]] (codes into isbns) and
+    ratings[offsets[r]:offsets[r + 1]], highest rating first. Memory-mapped
+    from models/, so a page of a user's history reads and decodes only the
+    rows it shows, however long the history is.
+    """
+
+    def __init__(self, users: np.ndarray, offsets: np.ndarray, books: np.ndarray, ratings: np.ndarray,
+                 isbns: StringColumn):
+        self.users = users
+        self.offsets = offsets
+        self.books = books
+        self.ratings = ratings
+        self.isbns = isbns
+
+    @classmethod
+    def build(cls, user_ids, isbns, user_codes, book_codes, ratings) -> 'RatingHistory':
+        """From integer-coded rows (user_ids[user_codes[i]] rated isbns[book_codes[i]] with ratings[i])."""
+        user_ids = np.asarray(user_ids)
+        by_id = np.argsort(user_ids, kind='stable')
+        rank = np.empty(len(user_ids), dtype=np.int32)
+        rank[by_id] = np.arange(len(user_ids), dtype=np.int32)
+        rows = rank[user_codes]
+        # Book codes re-numbered in ISBN order, so equal ratings list by ISBN
+        isbns = np.asarray(isbns, dtype=object)
+        by_isbn = np.argsort(isbns, kind='stable')
+        book_rank = np.empty(len(isbns), dtype=np.int32)
+        book_rank[by_isbn] = np.arange(len(isbns), dtype=np.int32)
+        book_codes = book_rank[book_codes]
+        ratings = np.asarray(ratings)
+        order = np.lexsort((book_codes, -ratings, rows))
+        offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(user_ids)), out=offsets[1:])
+        return cls(user_ids[by_id], offsets, book_codes[order], _compact_ratings(ratings[order]),
+                   StringColumn.from_values(isbns[by_isbn]))
+
+    @classmethod
+    def from_data(cls, data) -> 'RatingHistory':
+        """From ingest.RatingsData (all ratings, before any filtering)."""
+        return cls.build(data.user_ids, data.isbns, data.user_codes, data.book_codes, data.ratings)
+
+    @classmethod
+    def from_ratings(cls, ratings: pd.DataFrame) -> 'RatingHistory':
+        """From rows of the Ratings table (e.g. db.user_ratings); unparseable ratings are dropped."""
+        ratings = ratings.dropna(subset=['Book-Rating'])
+        user_codes, user_ids = pd.factorize(ratings['User-ID'])
+        book_codes, isbns = pd.factorize(ratings['ISBN'].astype(str))
+        return cls.build(np.asarray(user_ids), np.asarray(isbns, dtype=object), user_codes, book_codes,
+                         ratings['Book-Rating'].to_numpy(np.float32))
+
+    @classmethod
+    def load(cls, models_dir: str = models_dir, db_path: str = db.DB_PATH):
+        """
+        Returns None when the store is missing or older than the database (see
+        stamp); db_path=None skips that check.
+        """
+        paths = [os.path.join(models_dir, name) for name in (USERS_FILE, OFFSETS_FILE, BOOKS_FILE, RATINGS_FILE)]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        if db_path is not None:
+            written, *database = stamp(models_dir, db_path)
+            if any(modified is not None and modified > written for modified in database):
+                return None
+        return cls(*(np.load(path, mmap_mode='r') for path in paths),
+                   StringColumn.load(models_dir, ISBNS_NAME))
+
+    def with_users(self, ratings: pd.DataFrame) -> 'RatingHistory':
+        """
+        A copy where the users in ratings (rows of the Ratings table) have
+        exactly those rows as their history; everyone else's is kept.
+        incremental.py passes the full histories of the users with new ratings.
+        """
+        ratings = ratings.dropna(subset=['Book-Rating'])
+        rated = ratings['ISBN'].astype(str)
+        rows = np.repeat(np.arange(len(self.users)), np.diff(self.offsets))
+        kept = ~np.isin(self.users, ratings['User-ID'].unique())[rows]
+        user_ids = pd.Index(self.users)
+        user_ids = user_ids.append(pd.Index(ratings['User-ID'].unique()).difference(user_ids))
+        isbns = pd.Index(self.isbns.to_numpy())
+        isbns = isbns.append(pd.Index(rated.unique()).difference(isbns))
+        return RatingHistory.build(
+            user_ids.to_numpy(), isbns.to_numpy(dtype=object),
+            np.concatenate([rows[kept], user_ids.get_indexer(ratings['User-ID'])]),
+            np.concatenate([np.asarray(self.books)[kept], isbns.get_indexer(rated)]),
+            np.concatenate([np.asarray(self.ratings, dtype=np.float32)[kept],
+                            ratings['Book-Rating'].to_numpy(np.float32)]))
+
+    def save(self, models_dir: str = models_dir):
+        # ISBNs and the CSR arrays first, the users file (the one load checks) last
+        self.isbns.save(models_dir, ISBNS_NAME)
+        for name, values in ((OFFSETS_FILE, self.offsets), (BOOKS_FILE, self.books), (RATINGS_FILE, self.ratings),
+                             (USERS_FILE, self.users)):
+            path = os.path.join(models_dir, name)
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, values)
+            os.replace(path + '.tmp', path)
+
+    def __len__(self):
+        return len(self.users)
+
+    def _bounds(self, user_id):
+        row = int(np.searchsorted(self.users, user_id))
+        if row < len(self.users) and self.users[row] == user_id:
+            return int(self.offsets[row]), int(self.offsets[row + 1])
+        return 0, 0
+
+    def count(self, user_id) -> int:
+        start, stop = self._bounds(user_id)
+        return stop - start
+
+    def user_ratings(self, user_id) -> np.ndarray:
+        """The user's ratings, highest first (a view; no ISBNs are decoded)."""
+        start, stop = self._bounds(user_id)
+        return np.asarray(self.ratings[start:stop])
+
+    def count_at_least(self, user_id, min_rating: float) -> int:
+        """How many of the user's ratings are >= min_rating (they come first in page order)."""
+        ratings = self.user_ratings(user_id)
+        return int(np.searchsorted(-ratings.astype(np.float32), -min_rating, side='right'))
+
+    def page(self, user_id, start: int = 0, stop: int = None) -> pd.DataFrame:
+        """ISBN and Book-Rating of positions start:stop of the user's history, highest rating first."""
+        first, last = self._bounds(user_id)
+        stop = last - first if stop is None else min(stop, last - first)
+        rows = slice(first + max(start, 0), first + max(stop, 0))
+        return pd.DataFrame({'ISBN': self.isbns.take(self.books[rows]),
+                             'Book-Rating': np.asarray(self.ratings[rows])})
+
+
+def stamp(models_dir: str = models_dir, db_path: str = db.DB_PATH) -> tuple:
+    """
+    Modification times (ns, None when missing) of the store, the database and
+    its WAL. RatingHistory.load returns the same thing as long as they do not
+    change, so the app caches the store under this key.
+    """
+    return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None
+                 for path in (os.path.join(models_dir, USERS_FILE), db_path, db_path + '-wal'))
+
+
+def with_metadata(page: pd.DataFrame, catalogue) -> pd.DataFrame:
+    """
+    A page of a history (RatingHistory.page) left-joined to the metadata in
+    catalogue (a BookStore), in page order; books it does not know keep null
+    metadata columns.
+    """
+    metadata = catalogue.get_many(page['ISBN']).drop_duplicates(subset=['ISBN'])
+    return page.merge(metadata, on='ISBN', how='left')
+
+
+def _compact_ratings(ratings: np.ndarray) -> np.ndarray:
+    # Book-Crossing ratings are integers 0-10: one byte each
+    if len(ratings) and (np.all(ratings == np.round(ratings)) and ratings.min() >= -128 and ratings.max() <= 127):
+        return ratings.astype(np.int8)
+    return ratings.astype(np.float32)
+
+
+def run(chunk_size: int = 500000, models_dir: str = models_dir):
+    from ingest import stream_ratings
+
+    t0 = time.perf_counter()
+    data, _ = stream_ratings(chunk_size)
+    history = RatingHistory.from_data(data)
+    del data
+    os.makedirs(models_dir, exist_ok=True)
+    history.save(models_dir)
+    print(f"Wrote the rating histories of {len(history):,} users ({len(history.ratings):,} ratings) "
+          f"in {time.perf_counter() - t0:.2f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute every user's rating history for the My Ratings page.")
+    parser.add_argument('--chunk-size', type=int, default=500000, help="rows read from the database per chunk")
+    args = parser.parse_args()
+    run(chunk_size=args.chunk_size)
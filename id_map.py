@@ -0,0 +1,113 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+
+class IdMap:
+    """
+    Bidirectional mapping between external ids and 0..n-1 indices, backed by
+    arrays instead of dicts: keys[i] is the id of index i, sorted_keys/order
+    are keys sorted and the index of each sorted key, so id -> index is a
+    vectorized binary search. User-IDs are int64; ISBNs are UTF-8 encoded
+    into a fixed-width byte array ('S' dtype), about 24 bytes per entry in
+    total against ~200 bytes for a pair of dict entries.
+    """
+
+    def __init__(self, keys: np.ndarray, sorted_keys: np.ndarray, order: np.ndarray):
+        self.keys = keys
+        self.sorted_keys = sorted_keys
+        self.order = order
+
+    @classmethod
+    def build(cls, ids) -> 'IdMap':
+        """From the ids in index order (ints, or strings for ISBNs)."""
+        keys = cls._encode_keys(ids)
+        order = np.argsort(keys, kind='stable')
+        return cls(keys, keys[order], order.astype(np.int64))
+
+    @staticmethod
+    def _encode_keys(ids) -> np.ndarray:
+        ids = np.asarray(ids)
+        if ids.dtype.kind in 'iu' or not len(ids):
+            return ids.astype(np.int64)
+        if ids.dtype.kind == 'S':
+            return ids
+        return np.array([str(i).encode('utf-8') for i in ids], dtype=bytes)
+
+    @property
+    def is_bytes(self) -> bool:
+        return self.keys.dtype.kind == 'S'
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _encode(self, ids):
+        """(keys, valid) for a batch of ids; ids that cannot be keys of this map are not valid."""
+        ids = np.asarray(ids).reshape(-1)
+        if self.is_bytes:
+            keys = np.array([str(i).encode('utf-8') for i in ids], dtype=bytes) if len(ids) else self.keys[:0]
+            return keys, np.ones(len(keys), dtype=bool)
+        if ids.dtype.kind in 'iu':
+            return ids.astype(np.int64), np.ones(len(ids), dtype=bool)
+        values = pd.to_numeric(pd.Series(ids, dtype=object), errors='coerce').to_numpy(np.float64)
+        valid = np.isfinite(values) & (values == np.round(values))
+        return np.where(valid, values, 0).astype(np.int64), valid
+
+    def indices(self, ids) -> np.ndarray:
+        """Indices of a batch of ids, -1 for unknown ones."""
+        keys, valid = self._encode(ids)
+        if not len(self) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self) - 1)
+        return np.where(valid & (self.sorted_keys[pos] == keys), self.order[pos], -1)
+
+    def ids(self, indices) -> np.ndarray:
+        """Ids of a batch of indices (ISBNs decoded to str)."""
+        keys = self.keys[np.asarray(indices, dtype=np.int64)]
+        if self.is_bytes:
+            return np.array([k.decode('utf-8') for k in keys], dtype=object)
+        return keys
+
+    def get(self, id_, default=None):
+        index = int(self.indices([id_])[0])
+        return index if index >= 0 else default
+
+    def __contains__(self, id_):
+        return self.get(id_) is not None
+
+    def __getitem__(self, id_):
+        index = self.get(id_)
+        if index is None:
+            raise KeyError(id_)
+        return index
+
+    def save(self, directory: str, name: str):
+        for part in ('keys', 'sorted_keys', 'order'):
+            np.save(os.path.join(directory, f'{name}.{part}.npy'), getattr(self, part))
+
+    @classmethod
+    def load(cls, directory: str, name: str, mmap_mode='r') -> 'IdMap':
+        return cls(*(np.load(os.path.join(directory, f'{name}.{part}.npy'), mmap_mode=mmap_mode)
+                     for part in ('keys', 'sorted_keys', 'order')))
+
+
+def save_mappings(path: str, user_ids, isbns):
+    """User-IDs and ISBNs in index order, the inputs of IdMap.build."""
+    users, books = IdMap.build(user_ids), IdMap.build(isbns)
+    with open(path, 'wb') as f:
+        np.savez(f, user_ids=users.keys, isbns=books.keys)
+
+
+def load_mappings(models_dir: str = 'models'):
+    """(user IdMap, book IdMap) from mappings.npz, or from the dicts of an older mappings.pkl."""
+    path = os.path.join(models_dir, 'mappings.npz')
+    if os.path.exists(path):
+        with np.load(path) as data:
+            return IdMap.build(data['user_ids']), IdMap.build(data['isbns'])
+    with open(os.path.join(models_dir, 'mappings.pkl'), 'rb') as f:
+        mappings = pickle.load(f)
+    index_to_user, index_to_book = mappings['index_to_user'], mappings['index_to_book']
+    return (IdMap.build([index_to_user[i] for i in range(len(index_to_user))]),
+            IdMap.build([index_to_book[i] for i in range(len(index_to_book))]))
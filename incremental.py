@@ -0,0 +1,234 @@
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+import db
+import train_model
+from fold_in import FoldIn
+from history_store import RatingHistory
+from id_map import load_mappings
+from ingest import k_core, peak_memory_mb, stream_ratings
+from rating_stats import compute_rating_stats, merge_rating_stats
+from recommender import top_k
+
+RATING_COLUMNS = 'rowid, "User-ID", "ISBN", "Book-Rating"'
+
+
+def _clean(frame: pd.DataFrame) -> pd.DataFrame:
+    # Same cleaning as load_ratings_frame: drop non-numeric ratings, ISBN as str
+    frame = frame.assign(**{'Book-Rating': pd.to_numeric(frame['Book-Rating'], errors='coerce')})
+    frame = frame.dropna(subset=['Book-Rating'])
+    return frame.assign(ISBN=frame['ISBN'].astype(str))
+
+
+def read_delta(watermark: int, new_watermark: int, chunksize: int = 500000):
+    """Ratings with watermark < rowid <= new_watermark, in rowid order. Returns (frame, rows read)."""
+    chunks, rows_read = [], 0
+    for chunk in db.iter_df(f'SELECT {RATING_COLUMNS} FROM Ratings WHERE rowid > ? AND rowid <= ? ORDER BY rowid',
+                            params=(watermark, new_watermark), chunksize=chunksize, label='ratings_delta'):
+        rows_read += len(chunk)
+        chunks.append(_clean(chunk))
+    if not chunks:
+        return _clean(pd.DataFrame(columns=['rowid', 'User-ID', 'ISBN', 'Book-Rating'])), 0
+    return pd.concat(chunks, ignore_index=True), rows_read
+
+
+def read_history(user_ids, isbns, new_watermark: int) -> pd.DataFrame:
+    """
+    All ratings up to new_watermark by the given users or on the given books, in
+    one pass over Ratings (the id lists are bound as JSON arrays, so there is no
+    limit on their length).
+    """
+    frame = db.fetch_df(
+        f'SELECT {RATING_COLUMNS} FROM Ratings WHERE rowid <= ? AND ('
+        '"User-ID" IN (SELECT value FROM json_each(?)) OR "ISBN" IN (SELECT value FROM json_each(?))) '
+        'ORDER BY rowid',
+        params=(new_watermark, json.dumps(pd.Index(user_ids).tolist()), json.dumps([str(i) for i in isbns])),
+        label='ratings_history',
+    )
+    return _clean(frame)
+
+
+def merge_matrix(user_items: sparse.csr_matrix, shape, rows, cols, values) -> sparse.csr_matrix:
+    """
+    user_items grown to shape, with (rows[i], cols[i]) set to values[i]. A pair
+    that is already stored, or repeated in the update, keeps its last value.
+    """
+    coo = user_items.tocoo()
+    n_items = shape[1]
+    keys = np.concatenate([coo.row.astype(np.int64) * n_items + coo.col, np.asarray(rows, np.int64) * n_items + cols])
+    data = np.concatenate([coo.data, np.asarray(values, dtype=coo.data.dtype)])
+    _, last = np.unique(keys[::-1], return_index=True)
+    keep = len(keys) - 1 - last
+    return sparse.csr_matrix((data[keep], (keys[keep] // n_items, keys[keep] % n_items)), shape=shape)
+
+
+def warm_start(model_data: dict, user_items: sparse.csr_matrix, n_users: int, n_items: int):
+    """
+    Initial factors for the grown matrix: previous factors for known rows and
+    columns, fold-in projections (fold_in.py) for the new ones. New items are
+    projected from their raters among the known users, new users from all of
+    their ratings.
+    """
+    user_features, item_features = model_data['user_features'], model_data['item_features']
+    users = np.zeros((user_items.shape[0], user_features.shape[1]))
+    users[:n_users] = user_features
+    items = np.zeros((item_features.shape[0], user_items.shape[1]))
+    items[:, :n_items] = item_features
+
+    by_item = user_items[:n_users].tocsc()
+    fold = FoldIn({**model_data, 'item_features': user_features.T}, None, None, None)
+    for j in range(n_items, user_items.shape[1]):
+        span = slice(by_item.indptr[j], by_item.indptr[j + 1])
+        if span.start < span.stop:
+            items[:, j] = fold.solve(by_item.indices[span], by_item.data[span])
+
+    fold = FoldIn({**model_data, 'item_features': items}, None, None, None)
+    for u in range(n_users, user_items.shape[0]):
+        span = slice(user_items.indptr[u], user_items.indptr[u + 1])
+        users[u] = fold.solve(user_items.indices[span], user_items.data[span])
+    return users, items
+
+
+def score_drift(old: dict, new: dict, n_users: int = 1000, k: int = 10, seed: int = 0) -> dict:
+    """
+    How far the update moved predictions for existing users on existing items:
+    RMSE of the scores relative to their RMS, and the mean overlap of the top k.
+    """
+    old_users, old_items = old['user_features'], old['item_features']
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(old_users), min(n_users, len(old_users)), replace=False)
+    before = old_users[rows] @ old_items
+    after = new['user_features'][rows] @ new['item_features'][:, :old_items.shape[1]]
+    top_before, _ = top_k(before, k)
+    top_after, _ = top_k(after, k)
+    return {
+        'users': len(rows),
+        'relative_rmse': float(np.sqrt(np.mean((after - before) ** 2) / max(np.mean(before ** 2), 1e-12))),
+        f'top{k}_overlap': float((top_before[:, :, None] == top_after[:, None, :]).any(axis=2).mean()),
+    }
+
+
+def train_incremental(args):
+    """
+    Updates the current model with the ratings appended since its watermark
+    instead of retraining from scratch:
+    - reads only rows with rowid above the watermark and merges their per-book
+      aggregates into the saved rating stats
+    - appends the users and books that now belong to the k-core of the grown
+      matrix, with the same thresholds as a full retrain (train_model.
+      k_core_thresholds), to the mappings, pulling their earlier ratings;
+      existing users and books are kept as they are, so their indices never move
+    - sets the new ratings in the training matrix (a re-rated pair keeps the
+      latest rating)
+    - runs a few solver iterations from the previous factors and saves the new
+      version through train_model.save_artifacts, with the rating history store
+      updated for the users with new ratings
+
+    Rows changed in place (same rowid) are not seen; run a full retrain for those.
+    """
+    t0 = time.perf_counter()
+    state = train_model.load_state()
+    if state is None or not os.path.exists('models/nmf_model.pkl'):
+        raise SystemExit("No training state found: run a full `python train_model.py` first.")
+    new_watermark = train_model.read_watermark()
+    if new_watermark <= state['watermark']:
+        print(f"No ratings after rowid {state['watermark']}; the model is up to date.")
+        return
+
+    with open('models/nmf_model.pkl', 'rb') as f:
+        model_data = pickle.load(f)
+    user_map, book_map = load_mappings()
+    with open('models/rating_stats.pkl', 'rb') as f:
+        rating_stats = pickle.load(f)
+    user_items = sparse.load_npz('models/user_item_matrix.npz').tocsr()
+    engine = model_data.get('engine', 'nmf')
+
+    print(f"Loading ratings after rowid {state['watermark']}...")
+    delta, rows_read = read_delta(state['watermark'], new_watermark, args.chunk_size)
+    rating_stats = merge_rating_stats(rating_stats, compute_rating_stats(delta))
+
+    # Rating histories for My Ratings: the users in the delta re-read in full, everyone else's kept
+    rating_history = RatingHistory.load(db_path=None)
+    if rating_history is None:
+        print("No rating history store to update; building it from all ratings...")
+        rating_history = RatingHistory.from_data(stream_ratings(args.chunk_size)[0])
+    elif len(delta):
+        rating_history = rating_history.with_users(read_history(delta['User-ID'].unique(), [], new_watermark))
+
+    # Grow the mappings: candidate books are new books in the delta whose all-time counts can pass
+    # the book thresholds, candidate users are new raters in the delta or of the candidate books
+    thresholds = train_model.k_core_thresholds()
+    users = pd.Index(user_map.keys)
+    books = pd.Index(book_map.ids(np.arange(len(book_map))), dtype=object)
+    new_books = pd.Index(delta['ISBN'].unique(), dtype=object).difference(books)
+    stats = rating_stats['stats'].reindex(new_books).fillna(0)
+    new_books = new_books[(stats['count'].to_numpy() >= thresholds['min_book_ratings'])
+                          & (stats['explicit_count'].to_numpy() >= thresholds['min_book_explicit'])
+                          & ((stats['count'] - stats['explicit_count']).to_numpy() >= thresholds['min_book_implicit'])]
+    candidates = pd.Index(delta['User-ID'].unique()).difference(users)
+
+    all_books = books.append(new_books)
+    history = read_history(candidates, new_books, new_watermark) if len(candidates) or len(new_books) else delta[:0]
+    # Earlier raters of the new books may now pass the user thresholds too
+    extra = pd.Index(history['User-ID'].unique()).difference(users).difference(candidates)
+    if len(extra):
+        history = pd.concat([history, read_history(extra, [], new_watermark)]).drop_duplicates('rowid')
+        candidates = candidates.union(extra)
+    all_users = users.append(candidates.sort_values())
+
+    rows = pd.concat([delta, history]).drop_duplicates('rowid').sort_values('rowid', kind='stable')
+    user_codes = all_users.get_indexer(rows['User-ID'])
+    book_codes = all_books.get_indexer(rows['ISBN'])
+    keep = (user_codes >= 0) & (book_codes >= 0)
+    grown = merge_matrix(user_items, (len(all_users), len(all_books)),
+                         user_codes[keep], book_codes[keep], rows['Book-Rating'].to_numpy()[keep]).tocoo()
+
+    # Peel the candidates to the k-core of the grown matrix; the model's users and books are pinned
+    print("Filtering the new users and books to the k-core...")
+    core = k_core(grown.row, grown.col, grown.data, len(all_users), len(all_books), **thresholds, verbose=True,
+                  pinned_users=np.arange(len(all_users)) < len(users),
+                  pinned_books=np.arange(len(all_books)) < len(books))
+    user_kept = np.bincount(grown.row[core], minlength=len(all_users)) > 0
+    user_kept[:len(users)] = True
+    book_kept = np.bincount(grown.col[core], minlength=len(all_books)) > 0
+    book_kept[:len(books)] = True
+    new_users, new_books = all_users[len(users):][user_kept[len(users):]], new_books[book_kept[len(books):]]
+    all_users, all_books = all_users[user_kept], all_books[book_kept]
+    matrix = sparse.csr_matrix((grown.data[core], ((np.cumsum(user_kept) - 1)[grown.row[core]],
+                                                   (np.cumsum(book_kept) - 1)[grown.col[core]])),
+                               shape=(len(all_users), len(all_books)))
+    keep[keep] = user_kept[user_codes[keep]] & book_kept[book_codes[keep]]
+    print(f"Delta: {rows_read:,} rows read, {int(keep.sum()):,} applied; "
+          f"+{len(new_users)} users, +{len(new_books)} books -> {matrix.shape[0]} x {matrix.shape[1]}.")
+
+    print(f"Warm-starting {engine.upper()} model...")
+    t_fit = time.perf_counter()
+    init = warm_start(model_data, matrix, len(users), len(books))
+    updated = train_model.ENGINES[engine](matrix, warm_start=init)
+    print(f"Trained in {time.perf_counter() - t_fit:.2f}s.")
+    train_seconds = time.perf_counter() - t0
+    drift = score_drift(model_data, updated)
+
+    print("Saving model and artifacts...")
+    full_seconds = state.get('full_train_seconds')
+    new_state = {'mode': 'incremental', 'engine': engine, 'watermark': new_watermark,
+                 'previous_watermark': state['watermark'], 'rows_read': rows_read,
+                 'train_seconds': train_seconds, 'full_train_seconds': full_seconds,
+                 'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'drift': drift}
+    train_model.save_artifacts(updated, matrix, all_users.to_numpy(), all_books.to_numpy(dtype=object),
+                               train_model.load_books(), rating_stats, new_state, history=rating_history)
+
+    print("Incremental update complete.")
+    print(f"Ingest + fit: {train_seconds:.2f}s. Total: {time.perf_counter() - t0:.2f}s. "
+          f"Peak memory: {peak_memory_mb():,.0f} MB.")
+    if full_seconds:
+        print(f"Last full retrain (ingest + fit): {full_seconds:.2f}s; saved {full_seconds - train_seconds:.2f}s "
+              f"({full_seconds / train_seconds:.1f}x faster).")
+    print(f"Score drift on {drift['users']} existing users: relative RMSE {drift['relative_rmse']:.2%}, "
+          f"top-10 overlap {drift['top10_overlap']:.1%}.")
@@ -0,0 +1,156 @@
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+
+import db
+
+
+def peak_memory_mb() -> float:
+    """Peak resident set size of this process so far (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _Encoder:
+    """Assigns int32 codes to keys in order of first appearance, one chunk at a time."""
+
+    def __init__(self):
+        self.codes = {}
+        self.keys = []
+
+    def encode(self, values: pd.Series) -> np.ndarray:
+        chunk_codes, uniques = pd.factorize(values)
+        lookup = np.empty(len(uniques), dtype=np.int32)
+        for i, key in enumerate(uniques):
+            code = self.codes.get(key)
+            if code is None:
+                code = self.codes[key] = len(self.keys)
+                self.keys.append(key)
+            lookup[i] = code
+        return lookup[chunk_codes]
+
+
+class RatingsData:
+    """
+    Ratings held as compact per-row arrays: int32 user and book codes plus float32
+    ratings. user_ids[c] / isbns[c] give the User-ID / ISBN behind code c.
+    """
+
+    def __init__(self, user_ids, isbns, user_codes, book_codes, ratings):
+        self.user_ids = user_ids
+        self.isbns = isbns
+        self.user_codes = user_codes
+        self.book_codes = book_codes
+        self.ratings = ratings
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def filter(self, min_book_ratings: int, min_user_ratings: int, min_book_explicit: int = 0,
+               min_user_explicit: int = 0, min_book_implicit: int = 0, min_user_implicit: int = 0,
+               verbose: bool = False) -> 'RatingsData':
+        """
+        Keeps the k-core of the ratings (see k_core): every kept book and user
+        has at least the given numbers of ratings among the kept rows. Codes are
+        re-numbered by first appearance among the kept rows.
+        """
+        keep = k_core(self.user_codes, self.book_codes, self.ratings, len(self.user_ids), len(self.isbns),
+                      min_book_ratings, min_user_ratings, min_book_explicit, min_user_explicit,
+                      min_book_implicit, min_user_implicit, verbose)
+        return self.take(keep)
+
+    def take(self, keep: np.ndarray) -> 'RatingsData':
+        user_codes, user_keep = pd.factorize(self.user_codes[keep])
+        book_codes, book_keep = pd.factorize(self.book_codes[keep])
+        return RatingsData(self.user_ids[user_keep], self.isbns[book_keep], user_codes.astype(np.int32),
+                           book_codes.astype(np.int32), self.ratings[keep])
+
+
+def k_core(user_codes, book_codes, ratings, n_users: int, n_books: int, min_book_ratings: int,
+           min_user_ratings: int, min_book_explicit: int = 0, min_user_explicit: int = 0,
+           min_book_implicit: int = 0, min_user_implicit: int = 0, verbose: bool = False,
+           pinned_users: np.ndarray = None, pinned_books: np.ndarray = None) -> np.ndarray:
+    """
+    Boolean mask of the rows to keep so that every book and user left has at
+    least min_*_ratings ratings, min_*_explicit ratings of 1-10 and
+    min_*_implicit ratings of 0, all counted among the kept rows. Dropping
+    books can push users under their thresholds and vice versa, so rows are
+    peeled off until nothing changes. Counts come from bincount over the
+    integer codes and are updated with only the rows dropped each iteration.
+    Users / books marked in the pinned_* boolean masks are never dropped
+    (incremental.py: those already in the model keep their indices).
+    """
+    t0 = time.perf_counter()
+    explicit = ratings > 0
+    keep = np.ones(len(ratings), dtype=bool)
+    book_counts, book_explicit = _rating_counts(book_codes, explicit, n_books)
+    user_counts, user_explicit = _rating_counts(user_codes, explicit, n_users)
+
+    iteration = 0
+    while True:
+        if verbose:
+            print(f"  k-core iteration {iteration}: {int(book_counts.sum()):,} ratings, "
+                  f"{int(np.count_nonzero(user_counts)):,} users, {int(np.count_nonzero(book_counts)):,} books "
+                  f"({time.perf_counter() - t0:.2f}s)")
+        book_ok = ((book_counts >= min_book_ratings) & (book_explicit >= min_book_explicit)
+                   & (book_counts - book_explicit >= min_book_implicit))
+        user_ok = ((user_counts >= min_user_ratings) & (user_explicit >= min_user_explicit)
+                   & (user_counts - user_explicit >= min_user_implicit))
+        if pinned_books is not None:
+            book_ok |= pinned_books
+        if pinned_users is not None:
+            user_ok |= pinned_users
+        dropped = np.flatnonzero(keep & ~(book_ok[book_codes] & user_ok[user_codes]))
+        if not len(dropped):
+            return keep
+        keep[dropped] = False
+        dropped_explicit = dropped[explicit[dropped]]
+        book_counts -= np.bincount(book_codes[dropped], minlength=n_books)
+        book_explicit -= np.bincount(book_codes[dropped_explicit], minlength=n_books)
+        user_counts -= np.bincount(user_codes[dropped], minlength=n_users)
+        user_explicit -= np.bincount(user_codes[dropped_explicit], minlength=n_users)
+        iteration += 1
+
+
+def _rating_counts(codes, explicit, n: int):
+    # All and explicit ratings per code in one pass: a bincount over (code, explicit) pairs
+    pairs = np.bincount(codes.astype(np.int64) * 2 + explicit, minlength=2 * n).reshape(n, 2)
+    return pairs.sum(axis=1), pairs[:, 1].copy()
+
+
+def stream_ratings(chunksize: int = 500000, verbose: bool = True):
+    """
+    Reads the Ratings table chunk by chunk and encodes it incrementally, so only
+    the compact arrays (about 12 bytes per rating) outlive each chunk. Rows whose
+    Book-Rating is not numeric are dropped, as in the pandas path.
+    Returns (RatingsData, number of rows read).
+    """
+    users, books = _Encoder(), _Encoder()
+    user_parts, book_parts, rating_parts = [], [], []
+    rows_read = 0
+    t0 = time.perf_counter()
+    for chunk in db.iter_df('SELECT "User-ID", "ISBN", "Book-Rating" FROM Ratings',
+                            chunksize=chunksize, label='stream_ratings'):
+        rows_read += len(chunk)
+        rating = pd.to_numeric(chunk['Book-Rating'], errors='coerce')
+        valid = rating.notna().to_numpy()
+        chunk = chunk[valid]
+        user_parts.append(users.encode(chunk['User-ID']))
+        book_parts.append(books.encode(chunk['ISBN'].astype(str)))
+        rating_parts.append(rating[valid].to_numpy(np.float32))
+        if verbose:
+            print(f"  streamed {rows_read:,} rows...", end='\r')
+
+    def concat(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    data = RatingsData(
+        np.array(users.keys), np.array(books.keys, dtype=object),
+        concat(user_parts, np.int32), concat(book_parts, np.int32), concat(rating_parts, np.float32),
+    )
+    elapsed = time.perf_counter() - t0
+    if verbose:
+        rate = rows_read / elapsed if elapsed > 0 else float('inf')
+        print(f"Streamed {rows_read:,} rows ({len(data):,} valid) in {elapsed:.2f}s ({rate:,.0f} rows/s).")
+    return data, rows_read
@@ -1,35 +1,28 @@
-import sqlite3
-import pandas as pd
 import os
+import db
 
-db_path = os.path.join('database', 'user_rate_book.db')
+db_path = db.DB_PATH
 
 def inspect_db():
     if not os.path.exists(db_path):
         print(f"Database not found at {db_path}")
         return
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
     # Get table names
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+    tables = db.list_tables()
     print("Tables found:", tables)
 
-    for table in tables:
-        table_name = table[0]
+    for table_name in tables:
         print(f"\n--- Schema for {table_name} ---")
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = cursor.fetchall()
-        for col in columns:
+        for col in db.table_info(table_name):
             print(col)
         
         print(f"\n--- Sample data for {table_name} ---")
-        df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT 5", conn)
+        df = db.read_table(table_name, limit=5)
         print(df)
 
-    conn.close()
+    print("\n--- Query timings ---")
+    print(db.query_timings().to_string(index=False))
 
 if __name__ == "__main__":
     inspect_db()
@@ -1,31 +1,20 @@
-import sqlite3
-import pandas as pd
-
-db_path = 'database/user_rate_book.db'
+import db
 
 try:
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
     # Get table names
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+    tables = db.list_tables()
     print("Tables:", tables)
     
-    for table in tables:
-        table_name = table[0]
+    for table_name in tables:
         print(f"\nSchema for {table_name}:")
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = cursor.fetchall()
-        for col in columns:
+        for col in db.table_info(table_name):
             print(col)
             
         # Preview data
         print(f"Preview {table_name}:")
-        df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT 5", conn)
+        df = db.read_table(table_name, limit=5)
         print(df)
         print("-" * 20)
 
-    conn.close()
 except Exception as e:
     print(f"Error: {e}")
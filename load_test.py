@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ModelArtifacts
+from service import ServiceClient
+
+reports_dir = "reports"
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_service(port: int, batching: bool, window_ms: float, max_batch: int, live: bool) -> subprocess.Popen:
+    """Runs service.py in a subprocess and waits until /health answers."""
+    cmd = [sys.executable, os.path.join(repo_dir, 'service.py'), '--port', str(port),
+           '--window-ms', str(window_ms), '--max-batch', str(max_batch)]
+    if not batching:
+        cmd.append('--no-batching')
+    if live:
+        cmd.append('--live')
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    client = ServiceClient(f'http://127.0.0.1:{port}')
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"service.py exited with code {proc.returncode}")
+        try:
+            client.get('/health')
+            return proc
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("service.py did not start within 120s")
+
+
+async def _client(host: str, port: int, paths: list, offset: int, stop_at: float, latencies: list, errors: list):
+    """One keep-alive connection sending requests back to back until stop_at."""
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    try:
+        while time.perf_counter() < stop_at:
+            path = paths[i % len(paths)]
+            i += 1
+            t0 = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            lines = head.decode('latin-1').split('\r\n')
+            length = next(int(line.split(':', 1)[1]) for line in lines if line.lower().startswith('content-length'))
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - t0)
+            if not lines[0].split(' ')[1].startswith('2'):
+                errors.append(lines[0])
+    finally:
+        writer.close()
+
+
+async def _run_load(host: str, port: int, paths: list, concurrency: int, seconds: float):
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + seconds
+    t0 = time.perf_counter()
+    await asyncio.gather(*[_client(host, port, paths, i * 7919, stop_at, latencies, errors)
+                           for i in range(concurrency)])
+    return latencies, errors, time.perf_counter() - t0
+
+
+def run_load(url: str, paths: list, concurrency: int, seconds: float, warmup: float = 1.0) -> dict:
+    """Throughput and latency percentiles (ms) of concurrency clients sending requests for seconds."""
+    parsed = url.split('://', 1)[-1].rstrip('/')
+    host, port = parsed.split(':') if ':' in parsed else (parsed, '80')
+    asyncio.run(_run_load(host, int(port), paths, concurrency, warmup))
+    before = ServiceClient(url).get('/stats')
+    latencies, errors, elapsed = asyncio.run(_run_load(host, int(port), paths, concurrency, seconds))
+    after = ServiceClient(url).get('/stats')
+    batches = after['batches'] - before['batches']
+    scored = after['scored_requests'] - before['scored_requests']
+    latencies = np.array(latencies) * 1000
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_per_s': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else np.nan,
+        'p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else np.nan,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else np.nan,
+        'mean_batch_size': scored / batches if batches else 0.0,
+    }
+
+
+def main(args):
+    artifacts = ModelArtifacts.load_any()
+    if artifacts is None:
+        raise SystemExit("Model not found. Please train the model first.")
+    rng = np.random.default_rng(args.seed)
+    users = rng.choice(np.asarray(artifacts.user_map.keys), args.users).tolist()
+    paths = [f'/recommend?user_id={u}&k={args.k}' for u in users]
+    del artifacts
+
+    # An external service runs in one mode only, whatever it is configured with
+    modes = [('batched', True), ('unbatched', False)] if args.url is None else [('external', None)]
+    results = []
+    for mode, batching in modes:
+        proc = None
+        url = args.url
+        if url is None:
+            port = free_port()
+            proc = start_service(port, batching, args.window_ms, args.max_batch, live=not args.top_n)
+            url = f'http://127.0.0.1:{port}'
+        try:
+            for concurrency in args.concurrency:
+                print(f"{mode}: {concurrency} clients for {args.seconds:g}s...")
+                results.append({'mode': mode, **run_load(url, paths, concurrency, args.seconds)})
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+    report = pd.DataFrame(results)
+    print(report.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    os.makedirs(reports_dir, exist_ok=True)
+    path = os.path.join(reports_dir, args.output)
+    report.to_csv(path, index=False)
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test of service.py /recommend: throughput and tail latency with batching on and off.")
+    parser.add_argument('--url', default=None,
+                        help="test an already running service instead of starting one per mode")
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32, 128],
+                        help="concurrent keep-alive clients")
+    parser.add_argument('--seconds', type=float, default=5.0, help="measured duration per concurrency level")
+    parser.add_argument('--users', type=int, default=1000, help="trained users sampled for the requests")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--window-ms', type=float, default=2.0)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--top-n', action='store_true',
+                        help="let the service answer from the precomputed top-N table (no scoring to batch)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default="service_load_test.csv")
+    main(parser.parse_args())
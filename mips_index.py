@@ -0,0 +1,228 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ModelArtifacts
+from components import is_current, model_version, write_version
+from recommender import top_k
+
+index_path = os.path.join('models', 'mips_index.npz')
+
+
+def _kmeans(x: np.ndarray, k: int, n_iter: int, rng, chunk_size: int = 65536) -> np.ndarray:
+    """Plain Lloyd's k-means; distances are computed in chunks to bound memory."""
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _nearest(x, centroids, chunk_size)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters on random points
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    c_sq = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk_size):
+        block = x[start:start + chunk_size]
+        out[start:start + chunk_size] = np.argmin(c_sq[None, :] - 2 * block @ centroids.T, axis=1)
+    return out
+
+
+class MIPSIndex:
+    """
+    Inverted-file (IVF) index for maximum inner product search over item factors.
+
+    Items are augmented with sqrt(M^2 - |x|^2) (M = largest item norm) so that the
+    largest inner product with a query [q, 0] is the nearest item in L2 distance.
+    The augmented items are clustered with k-means; a query probes the n_probe
+    lists with the closest centroids and only those items are scored exactly.
+    Item vectors are stored in list order so each probed list is a contiguous slice.
+    """
+
+    def __init__(self, centroids, offsets, items, vectors, n_probe=8):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.items = items
+        self.vectors = vectors
+        self.n_probe = int(n_probe)
+        self.centroids_q = centroids[:, :-1]
+        self.centroids_sq = (centroids ** 2).sum(axis=1)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, item_features: np.ndarray, n_lists: int = None, n_probe: int = 8,
+              n_iter: int = 20, sample_size: int = 256, seed: int = 42) -> 'MIPSIndex':
+        """item_features is (n_factors, n_items), as stored with the model."""
+        x = np.ascontiguousarray(item_features.T, dtype=np.float32)
+        n_items = len(x)
+        n_lists = n_lists or max(1, int(np.sqrt(n_items)))
+        n_lists = min(n_lists, n_items)
+
+        norms_sq = (x ** 2).sum(axis=1)
+        extra = np.sqrt(np.maximum(norms_sq.max() - norms_sq, 0))
+        aug = np.hstack([x, extra[:, None]])
+
+        rng = np.random.default_rng(seed)
+        # Train the centroids on a sample, then assign every item
+        train = aug
+        if n_items > n_lists * sample_size:
+            train = aug[rng.choice(n_items, n_lists * sample_size, replace=False)]
+        centroids = _kmeans(train, n_lists, n_iter, rng)
+        assign = _nearest(aug, centroids)
+
+        order = np.argsort(assign, kind='stable')
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=n_lists))
+        return cls(centroids, offsets, order.astype(np.int32), x[order], n_probe)
+
+    @classmethod
+    def load(cls, path: str = index_path) -> 'MIPSIndex':
+        data = np.load(path)
+        return cls(data['centroids'], data['offsets'], data['items'], data['vectors'], int(data['n_probe']))
+
+    @classmethod
+    def load_current(cls, models_dir: str = 'models'):
+        """The saved index if it was built for the current model version, else None."""
+        path = os.path.join(models_dir, 'mips_index.npz')
+        return cls.load(path) if is_current(path, models_dir) else None
+
+    def save(self, path: str = index_path):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, centroids=self.centroids, offsets=self.offsets, items=self.items,
+                 vectors=self.vectors, n_probe=self.n_probe)
+        os.replace(tmp, path)
+
+    def tune(self, user_features, item_features, k: int = 10, target_recall: float = 0.95,
+             n_users: int = 500) -> pd.DataFrame:
+        """
+        Sets n_probe to the smallest probe count whose recall@k against exact
+        scoring reaches target_recall on a sample of users (all lists if none does).
+        Returns the recall/latency report it was chosen from.
+        """
+        probes = [p for p in (1, 2, 4, 8, 16, 32, 64, 128, 256) if p < self.n_lists] + [self.n_lists]
+        report = recall_report(user_features, item_features, self, k=k, n_users=n_users, probes=probes)
+        ok = report[report[f'recall@{k}'] >= target_recall]
+        self.n_probe = int(ok.iloc[0]['n_probe']) if not ok.empty else self.n_lists
+        return report
+
+    def probe(self, query: np.ndarray, n_probe: int = None) -> np.ndarray:
+        """Ids of the lists to scan for one query vector."""
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        dist = self.centroids_sq - 2 * (self.centroids_q @ query)
+        return np.argpartition(dist, n_probe - 1)[:n_probe]
+
+    def candidates(self, query: np.ndarray, n_probe: int = None):
+        """(item indices, exact scores) of every item in the probed lists."""
+        lists = self.probe(query, n_probe)
+        slices = [slice(self.offsets[l], self.offsets[l + 1]) for l in lists]
+        items = np.concatenate([self.items[s] for s in slices])
+        scores = np.concatenate([self.vectors[s] @ query for s in slices])
+        return items, scores
+
+
+# ---------------------------
+# Recall vs latency report
+# ---------------------------
+def recall_report(user_features, item_features, index: MIPSIndex, k: int = 10,
+                  n_users: int = 500, probes=(1, 2, 4, 8, 16, 32, 64), seed: int = 0) -> pd.DataFrame:
+    """
+    Compares the index against exact scoring on a sample of users: recall@k of
+    the exact top k and mean single-query latency for each probe count.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(user_features), min(n_users, len(user_features)), replace=False)
+    queries = np.asarray(user_features[rows], dtype=np.float32)
+    item_features = np.asarray(item_features, dtype=np.float32)
+
+    t0 = time.perf_counter()
+    for q in queries:
+        top_k((q @ item_features)[None, :], k)
+    exact_ms = (time.perf_counter() - t0) / len(queries) * 1000
+    exact, _ = top_k(queries @ item_features, k)
+
+    results = []
+    for n_probe in probes:
+        if n_probe > index.n_lists:
+            break
+        hits = 0
+        scanned = 0
+        t0 = time.perf_counter()
+        for i, q in enumerate(queries):
+            items, scores = index.candidates(q, n_probe)
+            found = items[top_k(scores[None, :], k)[0][0]]
+            hits += np.intersect1d(found, exact[i]).size
+            scanned += len(items)
+        approx_ms = (time.perf_counter() - t0) / len(queries) * 1000
+        results.append({
+            'n_probe': n_probe,
+            f'recall@{k}': hits / exact.size,
+            'items_scanned_pct': scanned / len(queries) / item_features.shape[1] * 100,
+            'latency_ms': approx_ms,
+            'exact_latency_ms': exact_ms,
+            'speedup': exact_ms / approx_ms if approx_ms else np.nan,
+        })
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the MIPS index and report recall vs latency against exact scoring.")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild and tune the index from the current model")
+    parser.add_argument('--n-lists', type=int, default=None)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--users', type=int, default=500, help="sampled users for the report")
+    parser.add_argument('--target-recall', type=float, default=0.95)
+    parser.add_argument('--save-probe', action='store_true',
+                        help="store the smallest n_probe reaching the target recall in the saved index")
+    parser.add_argument('--force', action='store_true',
+                        help="save the index even below train_model.mips_min_items, where exact scoring is faster")
+    args = parser.parse_args()
+    from train_model import mips_min_items
+
+    version = model_version()
+    artifacts = ModelArtifacts.load_any()
+    if artifacts is None:
+        raise SystemExit("Model not found. Please train the model first.")
+    user_features = np.asarray(artifacts.user_features)
+    item_features = np.asarray(artifacts.item_features)
+
+    # Below the threshold the index is only measured: serving would be slower with it
+    save = args.force or item_features.shape[1] >= mips_min_items
+    if args.rebuild or not os.path.exists(index_path):
+        index = MIPSIndex.build(item_features, n_lists=args.n_lists)
+        report = index.tune(user_features, item_features, k=args.k, target_recall=args.target_recall,
+                            n_users=args.users)
+        if save:
+            index.save()
+            write_version(index_path, version)
+            print(f"Saved {index_path} ({index.n_lists} lists, n_probe={index.n_probe})")
+        else:
+            print(f"Not saving the index: {item_features.shape[1]:,} items < mips_min_items ({mips_min_items:,}); "
+                  f"use --force to save it anyway.")
+    else:
+        index = MIPSIndex.load()
+        report = recall_report(user_features, item_features, index, k=args.k, n_users=args.users)
+
+    os.makedirs('reports', exist_ok=True)
+    report.to_csv(os.path.join('reports', 'mips_recall_latency.csv'), index=False)
+    print(report.to_string(index=False))
+    print("Saved reports/mips_recall_latency.csv")
+
+    ok = report[report[f'recall@{args.k}'] >= args.target_recall]
+    if ok.empty:
+        print(f"No probe count reaches recall@{args.k} >= {args.target_recall}; keep exact scoring.")
+    elif args.save_probe and save:
+        index.n_probe = int(ok.iloc[0]['n_probe'])
+        index.save()
+        print(f"Saved n_probe={index.n_probe} to {index_path}")
@@ -0,0 +1,113 @@
+import pickle
+import pandas as pd
+import numpy as np
+
+
+def weighted_score(count, mean, m, C):
+    """
+    Weighted Rating (IMDB formula): (v/(v+m) * R) + (m/(m+v) * C)
+    v = number of ratings for the book
+    m = minimum number of ratings required to be listed
+    R = average rating of the book
+    C = mean vote across the whole report
+    """
+    return (count / (count + m) * mean) + (m / (count + m) * C)
+
+
+def compute_rating_stats(ratings: pd.DataFrame, quantile: float = 0.9) -> dict:
+    """Per-ISBN aggregates of the cleaned Ratings table (see compute_rating_stats_from_codes)."""
+    book_codes, isbns = pd.factorize(ratings['ISBN'].astype(str))
+    return compute_rating_stats_from_codes(np.asarray(isbns, dtype=object), book_codes,
+                                           ratings['Book-Rating'].to_numpy(np.float64), quantile)
+
+
+def compute_rating_stats_from_codes(isbns, book_codes, ratings, quantile: float = 0.9) -> dict:
+    """
+    Per-ISBN aggregates in one vectorized pass over integer-coded ratings
+    (book_codes[i] indexes isbns):
+    - count / mean over all ratings (implicit 0 included, as in the EDA)
+    - explicit_count / explicit_mean over ratings 1-10 only
+    - score: weighted rating with the same C and m as popular_books_weighted.csv
+    """
+    n = len(isbns)
+    ratings = np.asarray(ratings, dtype=np.float64)
+    explicit = ratings > 0
+    count = np.bincount(book_codes, minlength=n)
+    total = np.bincount(book_codes, weights=ratings, minlength=n)
+    explicit_count = np.bincount(book_codes[explicit], minlength=n)
+    explicit_total = np.bincount(book_codes[explicit], weights=ratings[explicit], minlength=n)
+    return _finalize(pd.Index(isbns, name='ISBN'), count, total, explicit_count, explicit_total, quantile)
+
+
+def merge_rating_stats(old: dict, delta: dict, quantile: float = 0.9) -> dict:
+    """
+    Aggregates over the union of two disjoint sets of ratings, e.g. the saved
+    stats plus those of rows appended since. Counts and sums add up exactly;
+    means, C, m and the weighted score are recomputed from them.
+    """
+    index = old['stats'].index.union(delta['stats'].index)
+    sums = []
+    for data in (old, delta):
+        stats = data['stats'].reindex(index)
+        count = stats['count'].fillna(0).to_numpy(np.float64)
+        explicit_count = stats['explicit_count'].fillna(0).to_numpy(np.float64)
+        sums.append((count, count * stats['mean'].fillna(0).to_numpy(np.float64),
+                     explicit_count, explicit_count * stats['explicit_mean'].fillna(0).to_numpy(np.float64)))
+    count, total, explicit_count, explicit_total = (a + b for a, b in zip(*sums))
+    return _finalize(index, count.astype(np.int64), total, explicit_count.astype(np.int64), explicit_total, quantile)
+
+
+def _finalize(index, count, total, explicit_count, explicit_total, quantile) -> dict:
+    n = len(index)
+    stats = pd.DataFrame({
+        'count': count,
+        'mean': total / np.maximum(count, 1),
+        'explicit_count': explicit_count,
+        'explicit_mean': np.divide(explicit_total, explicit_count,
+                                   out=np.full(n, np.nan), where=explicit_count > 0),
+    }, index=index).sort_index()
+    C = float(total.sum() / max(count.sum(), 1))
+    m = float(stats['count'].quantile(quantile))
+    stats['score'] = weighted_score(stats['count'], stats['mean'], m, C)
+
+    stats = stats.astype({
+        'count': np.int32,
+        'mean': np.float32,
+        'explicit_count': np.int32,
+        'explicit_mean': np.float32,
+        'score': np.float32,
+    })
+    return {'stats': stats, 'C': C, 'm': m}
+
+
+class RatingStats:
+    """Read-only view over the saved aggregates with O(1) lookups by ISBN."""
+
+    def __init__(self, stats: pd.DataFrame, C: float, m: float):
+        self.stats = stats
+        self.C = C
+        self.m = m
+
+    @classmethod
+    def load(cls, path: str) -> 'RatingStats':
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        return cls(data['stats'], data['C'], data['m'])
+
+    @staticmethod
+    def save(data: dict, path: str):
+        with open(path, 'wb') as f:
+            pickle.dump(data, f)
+
+    def get(self, isbn):
+        try:
+            return self.stats.iloc[self.stats.index.get_loc(isbn)]
+        except KeyError:
+            return None
+
+    def scores_for(self, isbns) -> np.ndarray:
+        """Weighted scores for a batch of ISBNs (0 for books without ratings)."""
+        positions = self.stats.index.get_indexer(pd.Index(isbns))
+        scores = self.stats['score'].to_numpy()[positions]
+        scores[positions < 0] = 0.0
+        return scores
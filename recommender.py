@@ -0,0 +1,109 @@
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int):
+    """
+    Row-wise top-k of a (n_users, n_items) score matrix using partial selection.
+    Returns (indices, scores), both (n_users, k), sorted by descending score.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class Recommender:
+    """
+    Scores users against all items in one matrix multiply and keeps the top k.
+
+    user_items is the training CSR matrix (users x books); every stored entry,
+    including implicit 0 ratings, counts as already rated. candidate_mask is an
+    optional boolean array over items; items outside it are never returned
+    (e.g. books without metadata). With a mips_index, each user only scores
+    the items of the probed index lists instead of the whole catalogue.
+    user_map (an IdMap of User-IDs to rows) is only needed by recommend().
+    """
+
+    def __init__(self, user_features, item_features, user_items, user_map=None, candidate_mask=None,
+                 mips_index=None):
+        self.user_features = user_features
+        self.item_features = item_features
+        self.user_items = user_items
+        self.user_map = user_map
+        self.n_items = item_features.shape[1]
+        self.item_bias = None
+        if candidate_mask is not None:
+            self.item_bias = np.where(candidate_mask, 0.0, -np.inf)
+        self.mips_index = mips_index
+
+    def rated_mask(self, user_rows: np.ndarray):
+        """(row, col) positions of the already-rated items of a batch of users."""
+        rated = self.user_items[user_rows]
+        rows = np.repeat(np.arange(len(user_rows)), np.diff(rated.indptr))
+        return rows, rated.indices
+
+    def score(self, user_rows: np.ndarray, exclude_rated: bool = True) -> np.ndarray:
+        scores = self.user_features[user_rows] @ self.item_features
+        if self.item_bias is not None:
+            scores += self.item_bias
+        if exclude_rated:
+            scores[self.rated_mask(user_rows)] = -np.inf
+        return scores
+
+    def top_k(self, user_rows, k: int = 10, exclude_rated: bool = True):
+        """Top k item indices and scores for a batch of user rows."""
+        user_rows = np.asarray(user_rows, dtype=np.int64)
+        if self.mips_index is not None:
+            return self.approximate_top_k(user_rows, k, exclude_rated)
+        return top_k(self.score(user_rows, exclude_rated), k)
+
+    def approximate_top_k(self, user_rows: np.ndarray, k: int, exclude_rated: bool = True):
+        k = min(k, self.n_items)
+        indices = np.full((len(user_rows), k), -1, dtype=np.int64)
+        scores = np.full((len(user_rows), k), -np.inf)
+        for i, row in enumerate(user_rows):
+            items, item_scores = self.mips_index.candidates(self.user_features[row])
+            item_scores = item_scores.astype(np.float64)
+            if self.item_bias is not None:
+                item_scores += self.item_bias[items]
+            if exclude_rated:
+                rated = self.user_items.indices[self.user_items.indptr[row]:self.user_items.indptr[row + 1]]
+                item_scores[np.isin(items, rated)] = -np.inf
+            top, top_scores = top_k(item_scores[None, :], k)
+            indices[i, :top.shape[1]] = items[top[0]]
+            scores[i, :top.shape[1]] = top_scores[0]
+        return indices, scores
+
+    def top_k_vectors(self, vectors: np.ndarray, rated_items, k: int = 10):
+        """
+        Top k for user factors that are not rows of user_features (e.g. folded-in
+        users). rated_items[i] lists the item indices to exclude for vectors[i].
+        """
+        scores = np.atleast_2d(vectors) @ self.item_features
+        if self.item_bias is not None:
+            scores += self.item_bias
+        for i, items in enumerate(rated_items):
+            scores[i, items] = -np.inf
+        indices, scores = top_k(scores, k)
+        return np.where(np.isfinite(scores), indices, -1), scores
+
+    def recommend(self, user_ids, k: int = 10, exclude_rated: bool = True):
+        """
+        Top k item indices and scores for a batch of User-IDs.
+        Users unknown to the model get index -1 and score -inf; so do slots
+        left over when a user has fewer than k candidate items.
+        """
+        rows = self.user_map.indices(user_ids)
+        known = rows >= 0
+        k = min(k, self.n_items)
+        indices = np.full((len(rows), k), -1, dtype=np.int64)
+        scores = np.full((len(rows), k), -np.inf)
+        if known.any():
+            idx, sc = self.top_k(rows[known], k, exclude_rated)
+            indices[known] = np.where(np.isfinite(sc), idx, -1)
+            scores[known] = sc
+        return indices, scores
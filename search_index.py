@@ -0,0 +1,167 @@
+import os
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+index_path = os.path.join('models', 'search_index.npz')
+
+COMBINING = '[\u0300-\u036f]'
+NON_WORD = r'[\W_]+'
+MAX_TOKEN_LENGTH = 40
+
+
+def normalize(text: str) -> str:
+    """Lowercase, accent-free text with single spaces between word tokens."""
+    text = unicodedata.normalize('NFKD', text)
+    text = re.sub(COMBINING, '', text).lower()
+    return re.sub(NON_WORD, ' ', text).strip()
+
+
+def normalize_series(s: pd.Series) -> pd.Series:
+    """Vectorized normalize() over a column (missing values become '')."""
+    s = s.fillna('').astype(str).str.normalize('NFKD')
+    s = s.str.replace(COMBINING, '', regex=True).str.lower()
+    return s.str.replace(NON_WORD, ' ', regex=True).str.strip()
+
+
+def _hash(strings) -> np.ndarray:
+    return pd.util.hash_array(np.asarray(strings, dtype=object))
+
+
+def _gather(offsets: np.ndarray, values: np.ndarray, rows: np.ndarray, limit: int = None) -> np.ndarray:
+    """Concatenates values[offsets[r]:offsets[r+1]] for all rows (at most limit per row) without a Python loop."""
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    if limit is not None:
+        lengths = np.minimum(lengths, limit)
+    total = int(lengths.sum())
+    if total == 0:
+        return values[:0]
+    run_starts = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return values[run_starts + np.arange(total)]
+
+
+class SearchIndex:
+    """
+    Inverted index over normalized title and author tokens.
+
+    Documents are numbered by popularity rank (weighted score, best first), so every
+    postings list sorted by doc id is also sorted by popularity and "most popular
+    matches" is simply "smallest doc ids". The vocabulary is a sorted array, which
+    makes a prefix a contiguous range of tokens found with searchsorted. A forward
+    index (doc -> token ids) answers prefix checks on an already small candidate set.
+
+    Results are ranked in three tiers, each ordered by popularity:
+    0. the whole query equals the normalized title or author
+    1. every query word matches a whole token
+    2. the last query word only matches as a prefix (search-as-you-type)
+    """
+
+    def __init__(self, vocab, offsets, postings, fwd_offsets, fwd_tokens, doc_items, title_hash, author_hash):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings = postings
+        self.fwd_offsets = fwd_offsets
+        self.fwd_tokens = fwd_tokens
+        self.doc_items = doc_items
+        self.title_hash = title_hash
+        self.author_hash = author_hash
+
+    @classmethod
+    def build(cls, books: pd.DataFrame, popularity=None) -> 'SearchIndex':
+        """
+        books is the BookStore frame (row i = item i). popularity is an optional
+        per-item score (higher first); ties keep the item order.
+        """
+        n = len(books)
+        popularity = np.zeros(n) if popularity is None else np.asarray(popularity, dtype=np.float64)
+        doc_items = np.argsort(-popularity, kind='stable').astype(np.int32)
+
+        titles = normalize_series(books['Book-Title']).to_numpy()[doc_items]
+        authors = normalize_series(books['Book-Author']).to_numpy()[doc_items]
+
+        tokens = pd.concat([pd.Series(titles).str.split(), pd.Series(authors).str.split()])
+        tokens = tokens.explode().dropna()
+        tokens = tokens[tokens != ''].str.slice(0, MAX_TOKEN_LENGTH)
+        pairs = pd.DataFrame({'doc': tokens.index.to_numpy(np.int64), 'token': tokens.to_numpy()})
+
+        vocab, token_ids = np.unique(pairs['token'].to_numpy(dtype=str), return_inverse=True)
+        pairs = pd.DataFrame({'token': token_ids, 'doc': pairs['doc'].to_numpy()}).drop_duplicates()
+
+        by_token = pairs.sort_values(['token', 'doc'])
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(by_token['token'], minlength=len(vocab)))
+
+        by_doc = pairs.sort_values(['doc', 'token'])
+        fwd_offsets = np.zeros(n + 1, dtype=np.int64)
+        fwd_offsets[1:] = np.cumsum(np.bincount(by_doc['doc'], minlength=n))
+
+        return cls(vocab, offsets, by_token['doc'].to_numpy(np.int32), fwd_offsets,
+                   by_doc['token'].to_numpy(np.int32), doc_items, _hash(titles), _hash(authors))
+
+    @classmethod
+    def load(cls, path: str = index_path) -> 'SearchIndex':
+        data = np.load(path)
+        return cls(data['vocab'], data['offsets'], data['postings'], data['fwd_offsets'],
+                   data['fwd_tokens'], data['doc_items'], data['title_hash'], data['author_hash'])
+
+    def save(self, path: str = index_path):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, vocab=self.vocab, offsets=self.offsets, postings=self.postings,
+                 fwd_offsets=self.fwd_offsets, fwd_tokens=self.fwd_tokens, doc_items=self.doc_items,
+                 title_hash=self.title_hash, author_hash=self.author_hash)
+        os.replace(tmp, path)
+
+    def _token_range(self, token: str, prefix: bool):
+        lo = np.searchsorted(self.vocab, token, side='left')
+        if prefix:
+            hi = np.searchsorted(self.vocab, token + '\U0010ffff', side='left')
+        else:
+            hi = lo + 1 if lo < len(self.vocab) and self.vocab[lo] == token else lo
+        return lo, hi
+
+    def _docs(self, token: str) -> np.ndarray:
+        lo, hi = self._token_range(token, prefix=False)
+        return self.postings[self.offsets[lo]:self.offsets[hi]]
+
+    def _docs_with_prefix(self, docs: np.ndarray, lo: int, hi: int) -> np.ndarray:
+        """Subset of docs having at least one token in the vocab range [lo, hi)."""
+        docs = docs[self.fwd_offsets[docs + 1] > self.fwd_offsets[docs]]
+        if not len(docs):
+            return docs
+        lengths = self.fwd_offsets[docs + 1] - self.fwd_offsets[docs]
+        tokens = _gather(self.fwd_offsets, self.fwd_tokens, docs)
+        in_range = ((tokens >= lo) & (tokens < hi)).astype(np.int64)
+        hits = np.add.reduceat(in_range, np.concatenate([[0], np.cumsum(lengths)[:-1]]))
+        return docs[hits > 0]
+
+    def search(self, query: str, limit: int = 20) -> np.ndarray:
+        """Item indices of the best matches for a query, best first."""
+        query = normalize(query)
+        terms = [t[:MAX_TOKEN_LENGTH] for t in query.split()]
+        if not terms:
+            return np.empty(0, dtype=np.int32)
+        *full_terms, last = terms
+        lo, hi = self._token_range(last, prefix=True)
+
+        if full_terms:
+            base = self._docs(full_terms[0])
+            for term in full_terms[1:]:
+                base = np.intersect1d(base, self._docs(term), assume_unique=True)
+            exact = np.intersect1d(base, self._docs(last), assume_unique=True)
+            prefix = np.setdiff1d(self._docs_with_prefix(base, lo, hi), exact, assume_unique=True)
+        else:
+            exact = self._docs(last)
+            prefix = np.array([], dtype=self.postings.dtype)
+            if len(exact) < limit:
+                # Popularity-ordered postings: the best `limit` docs of the union are
+                # among the first `limit` docs of each token in the prefix range.
+                prefix = np.unique(_gather(self.offsets, self.postings, np.arange(lo, hi), limit=limit))
+                prefix = np.setdiff1d(prefix, exact, assume_unique=True)
+
+        query_hash = _hash([query])[0]
+        whole = (self.title_hash[exact] == query_hash) | (self.author_hash[exact] == query_hash)
+        ranked = np.concatenate([exact[whole], exact[~whole], prefix[:limit]])[:limit]
+        return self.doc_items[ranked]
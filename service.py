@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sqlite3
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from artifacts import ModelArtifacts
+from batch_recommend import TopNTable
+from fold_in import FoldIn
+from mips_index import MIPSIndex
+from recommender import Recommender
+from search_index import SearchIndex
+from similar_items import SimilarItems
+
+models_dir = 'models'
+DEFAULT_PORT = 8502
+MAX_K = 100
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class MicroBatcher:
+    """
+    Collects the scoring requests that arrive within window_ms of the first one
+    (at most max_batch) and scores them with a single matrix multiply against
+    item_features (Recommender.top_k_vectors). Batches run one at a time on a
+    worker thread, so requests arriving while a batch is being scored form the
+    next one. A batch stops waiting as soon as every request in flight (see
+    pending()) has joined it, so a lone request is not delayed by the window.
+    max_batch=1 scores every request on its own.
+    """
+
+    def __init__(self, recommender: Recommender, window_ms: float = 2.0, max_batch: int = 256):
+        self.recommender = recommender
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scoring')
+        self.queue = None
+        self.inflight = 0
+        self.batches = 0
+        self.requests = 0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        return asyncio.get_running_loop().create_task(self._run())
+
+    @contextlib.contextmanager
+    def pending(self):
+        """Marks a request that may call top_k, so an open batch waits for it (up to the window)."""
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+
+    async def top_k(self, vector: np.ndarray, rated_items: np.ndarray, k: int):
+        """Top k item indices and scores for one user vector, excluding rated_items."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((vector, rated_items, k, future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            if self.inflight <= len(batch):
+                break
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score(self, batch: list):
+        vectors = np.stack([vector for vector, _, _, _ in batch])
+        k = max(k for _, _, k, _ in batch)
+        return self.recommender.top_k_vectors(vectors, [rated for _, rated, _, _ in batch], k)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            try:
+                indices, scores = await loop.run_in_executor(self.executor, self._score, batch)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            for i, (_, _, k, future) in enumerate(batch):
+                if not future.done():
+                    keep = indices[i, :k] >= 0
+                    future.set_result((indices[i, :k][keep], scores[i, :k][keep]))
+
+
+class RecommendationService:
+    """
+    The app's scoring paths behind JSON endpoints:
+        GET /recommend?user_id=&k=   same sources as the Recommendations page
+        GET /similar?isbn=&k=        "Readers also liked" (similar_items.py)
+        GET /search?q=&limit=        title/author search
+        GET /health, GET /stats, GET /metrics (Prometheus text format)
+    Artifacts are loaded once, like load_models in app.py. Live scoring goes
+    through a MicroBatcher; fold-in and search run on the default executor so
+    SQLite reads never block the event loop.
+    """
+
+    def __init__(self, models_dir: str = models_dir, window_ms: float = 2.0, max_batch: int = 256,
+                 use_top_n: bool = True):
+        self.artifacts = ModelArtifacts.load_any(models_dir)
+        if self.artifacts is None:
+            raise FileNotFoundError("Model not found. Please train the model first.")
+        self.book_store = self.artifacts.book_store
+        mips_index = MIPSIndex.load_current(models_dir)
+        self.recommender = Recommender(self.artifacts.user_features, self.artifacts.item_features,
+                                       self.artifacts.user_items, self.artifacts.user_map,
+                                       candidate_mask=self.book_store.has_metadata, mips_index=mips_index)
+        self.top_n = TopNTable.load(models_dir) if use_top_n else None
+        self.similar_items = SimilarItems.load(models_dir)
+        search_path = os.path.join(models_dir, 'search_index.npz')
+        self.search_index = SearchIndex.load(search_path) if os.path.exists(search_path) else None
+        self.fold_in = FoldIn(self.artifacts.model_data, self.book_store, self.artifacts.user_items,
+                              self.artifacts.user_map, watermark=self.artifacts.watermark)
+        self.batcher = MicroBatcher(self.recommender, window_ms, max_batch)
+        self.routes = {'/recommend': self.recommend, '/similar': self.similar, '/search': self.search,
+                       '/health': self.health, '/stats': self.stats, '/metrics': self.metrics}
+        self.started = time.time()
+
+    def books(self, indices, scores=None) -> list:
+        """Metadata records of item indices (books without metadata are skipped), with their scores."""
+        indices = np.asarray(indices, dtype=np.int64)
+        frame = self.book_store.get_many_by_index(indices)
+        records = frame.astype(object).where(frame.notna(), None).to_dict('records')
+        if scores is not None:
+            by_index = dict(zip(indices.tolist(), np.asarray(scores, dtype=float).tolist()))
+            for record, idx in zip(records, frame.index):
+                record['score'] = by_index.get(int(idx))
+        return records
+
+    async def recommend(self, params: dict):
+        user_id = int(params['user_id'])
+        k = min(int(params.get('k', 10)), MAX_K)
+        with self.batcher.pending():
+            source, indices, scores = await self._recommend(user_id, k)
+        books = self.books(indices, scores) if source != 'none' else []
+        return 200, {'user_id': user_id, 'source': source, 'books': books}
+
+    async def _recommend(self, user_id: int, k: int):
+        loop = asyncio.get_running_loop()
+        try:
+            projection = await loop.run_in_executor(None, self.fold_in.project, user_id)
+        except sqlite3.Error:
+            projection = None
+
+        if projection is not None and projection.stale:
+            # Unseen user or ratings newer than the model: fold the current ratings in
+            return ('fold_in',) + await self.batcher.top_k(projection.vector, projection.item_indices, k)
+        if user_id not in self.artifacts.user_map:
+            return 'none', None, None
+        row = self.artifacts.user_map[user_id]
+        if self.top_n is not None and row < len(self.top_n) and k <= self.top_n.items.shape[1]:
+            return ('top_n',) + self.top_n.get(row, k)
+        user_items = self.recommender.user_items
+        rated = user_items.indices[user_items.indptr[row]:user_items.indptr[row + 1]]
+        return ('model',) + await self.batcher.top_k(self.recommender.user_features[row], rated, k)
+
+    async def similar(self, params: dict):
+        if self.similar_items is None:
+            return 503, {'error': "similar-items table missing or older than the model; run similar_items.py"}
+        k = min(int(params.get('k', 5)), MAX_K)
+        neighbors, scores = self.similar_items.get(self.book_store.index_of(params['isbn']), k)
+        return 200, {'isbn': params['isbn'], 'books': self.books(neighbors, scores)}
+
+    async def search(self, params: dict):
+        if self.search_index is None:
+            return 503, {'error': "search index missing; run train_model.py"}
+        limit = min(int(params.get('limit', 20)), MAX_K)
+        indices = await asyncio.get_running_loop().run_in_executor(
+            None, self.search_index.search, params['q'], limit)
+        return 200, {'q': params['q'], 'books': self.books(indices)}
+
+    async def health(self, params: dict):
+        return 200, {'status': 'ok', 'version': self.artifacts.version, 'engine': self.artifacts.manifest['engine'],
+                     'n_users': int(self.artifacts.user_features.shape[0]),
+                     'n_items': int(self.artifacts.item_features.shape[1])}
+
+    async def stats(self, params: dict):
+        batches = self.batcher.batches
+        return 200, {'uptime_s': time.time() - self.started, 'batches': batches,
+                     'scored_requests': self.batcher.requests,
+                     'mean_batch_size': self.batcher.requests / batches if batches else 0.0,
+                     'window_ms': self.batcher.window * 1000, 'max_batch': self.batcher.max_batch}
+
+    async def metrics(self, params: dict):
+        return 200, metrics.prometheus(
+            gauges={'service_uptime_seconds': time.time() - self.started},
+            counters={'service_batches': self.batcher.batches, 'service_scored_requests': self.batcher.requests})
+
+    async def dispatch(self, method: str, target: str):
+        url = urllib.parse.urlsplit(target)
+        handler = self.routes.get(url.path)
+        if handler is None:
+            return 404, {'error': f"unknown path {url.path}"}
+        if method != 'GET':
+            return 405, {'error': "only GET is supported"}
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            with metrics.timer('service_request', path=url.path):
+                return await handler(params)
+        except KeyError as e:
+            return 400, {'error': f"missing parameter {e.args[0]}"}
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP/1.1 with keep-alive: request line and headers only (GET, no bodies)."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = dict((name.strip().lower(), value.strip())
+                               for name, value in (line.split(':', 1) for line in lines[1:] if ':' in line))
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+                try:
+                    status, payload = await self.dispatch(method, target)
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+                if isinstance(payload, str):
+                    body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+                else:
+                    body, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                             f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT):
+        batching = self.batcher.start()
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        print(f"Serving on http://{host}:{port} (model {self.artifacts.version or 'legacy'}, "
+              f"batch window {self.batcher.window * 1000:g} ms, max batch {self.batcher.max_batch})", flush=True)
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                batching.cancel()
+
+
+class ServiceClient:
+    """Blocking client for RecommendationService (used by app.py when READORA_SERVICE_URL is set)."""
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def get(self, path: str, **params) -> dict:
+        """JSON response of a GET; raises OSError (urllib.error.URLError) when the service cannot answer."""
+        query = urllib.parse.urlencode(params)
+        with urllib.request.urlopen(f"{self.url}{path}?{query}", timeout=self.timeout) as response:
+            return json.load(response)
+
+    def recommend(self, user_id, k: int = 10) -> dict:
+        return self.get('/recommend', user_id=user_id, k=k)
+
+    def similar(self, isbn: str, k: int = 5) -> dict:
+        return self.get('/similar', isbn=isbn, k=k)
+
+    def search(self, query: str, limit: int = 20) -> dict:
+        return self.get('/search', q=query, limit=limit)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON recommendation/search service with micro-batched scoring.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--window-ms', type=float, default=2.0,
+                        help="how long the first request of a batch waits for others to join it")
+    parser.add_argument('--max-batch', type=int, default=256, help="users scored per matrix multiply")
+    parser.add_argument('--no-batching', action='store_true', help="score every request on its own")
+    parser.add_argument('--live', action='store_true',
+                        help="always score with the model, ignoring the precomputed top-N table")
+    args = parser.parse_args()
+
+    service = RecommendationService(window_ms=0 if args.no_batching else args.window_ms,
+                                    max_batch=1 if args.no_batching else args.max_batch,
+                                    use_top_n=not args.live)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
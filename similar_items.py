@@ -0,0 +1,186 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sparse
+
+from artifacts import ModelArtifacts
+from components import is_current, model_version, write_version
+from recommender import top_k
+
+models_dir = 'models'
+NEIGHBORS_FILE = 'similar_items.npy'
+SCORES_FILE = 'similar_scores.npy'
+
+# Entries of the dense (block x items) similarity block per task, which bounds
+# the memory of each worker: 2**25 float32 scores are 128 MB
+BLOCK_ENTRIES = 2 ** 25
+
+
+class SimilarItems:
+    """
+    Precomputed top-K most similar items (int32) and their similarity (float32)
+    per item index, memory-mapped from models/. Slots without a neighbor hold -1.
+    """
+
+    def __init__(self, neighbors: np.ndarray, scores: np.ndarray):
+        self.neighbors = neighbors
+        self.scores = scores
+
+    @classmethod
+    def load(cls, models_dir: str = models_dir):
+        """Returns None when the table is missing or was built for another model version."""
+        neighbors_path = os.path.join(models_dir, NEIGHBORS_FILE)
+        scores_path = os.path.join(models_dir, SCORES_FILE)
+        if not (is_current(neighbors_path, models_dir) and os.path.exists(scores_path)):
+            return None
+        return cls(np.load(neighbors_path, mmap_mode='r'), np.load(scores_path, mmap_mode='r'))
+
+    def __len__(self):
+        return self.neighbors.shape[0]
+
+    def get(self, item_index: int, k: int = 10):
+        if not 0 <= item_index < len(self):
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        neighbors = np.asarray(self.neighbors[item_index, :k])
+        scores = np.asarray(self.scores[item_index, :k])
+        keep = neighbors >= 0
+        return neighbors[keep], scores[keep]
+
+
+class ItemSimilarity:
+    """
+    Cosine similarity of items, blended from two sources:
+      - the item factors: cosine of the columns of item_features;
+      - co-ratings: c_ij / sqrt(n_i n_j), where c_ij counts the users who rated
+        both books and n_i the users who rated book i (any rating, including
+        implicit 0s, counts).
+    score = alpha * factor cosine + (1 - alpha) * co-rating cosine. With alpha=0
+    only books rated together with the item are candidates. Items outside
+    candidate_mask (e.g. books without metadata) are never returned.
+    """
+
+    def __init__(self, item_features, user_items: sparse.csr_matrix, alpha: float = 0.5, candidate_mask=None):
+        self.alpha = float(alpha)
+        vectors = np.ascontiguousarray(np.asarray(item_features, dtype=np.float32).T)
+        norms = np.linalg.norm(vectors, axis=1)
+        self.vectors = vectors / np.where(norms > 0, norms, 1)[:, None]
+        self.n_items = len(self.vectors)
+
+        # Binarized item x user incidence (CSR) and its transpose for the co-rating products
+        incidence = sparse.csr_matrix((np.ones(len(user_items.indices), dtype=np.float32),
+                                       np.asarray(user_items.indices), np.asarray(user_items.indptr)),
+                                      shape=user_items.shape)
+        self.item_users = incidence.T.tocsr()
+        self.user_items = incidence
+        counts = np.diff(self.item_users.indptr).astype(np.float32)
+        self.inv_sqrt_counts = 1 / np.sqrt(np.maximum(counts, 1))
+        self.item_bias = np.zeros(self.n_items, dtype=np.float32)
+        if candidate_mask is not None:
+            self.item_bias[~np.asarray(candidate_mask)] = -np.inf
+
+    def scores(self, start: int, stop: int) -> np.ndarray:
+        """Dense (stop - start, n_items) similarity block; -inf marks the item itself and non-candidates."""
+        rows = np.arange(start, stop)
+        if self.alpha > 0:
+            block = self.vectors[start:stop] @ self.vectors.T
+            block *= self.alpha
+        else:
+            block = np.full((stop - start, self.n_items), -np.inf, dtype=np.float32)
+        if self.alpha < 1:
+            co = (self.item_users[start:stop] @ self.user_items).tocoo()
+            cosine = co.data * self.inv_sqrt_counts[start + co.row] * self.inv_sqrt_counts[co.col]
+            if self.alpha > 0:
+                block[co.row, co.col] += (1 - self.alpha) * cosine
+            else:
+                block[co.row, co.col] = cosine
+        block += self.item_bias
+        block[rows - start, rows] = -np.inf
+        return block
+
+    def top_k(self, start: int, stop: int, k: int):
+        neighbors, scores = top_k(self.scores(start, stop), k)
+        valid = np.isfinite(scores)
+        return np.where(valid, neighbors, -1).astype(np.int32), np.where(valid, scores, 0.0).astype(np.float32)
+
+
+def load_similarity(alpha: float, models_dir: str = models_dir) -> ItemSimilarity:
+    artifacts = ModelArtifacts.load_any(models_dir)
+    return ItemSimilarity(artifacts.item_features, artifacts.user_items, alpha,
+                          candidate_mask=artifacts.book_store.has_metadata)
+
+
+# ---------------------------
+# Worker processes
+# ---------------------------
+_worker_similarity = None
+
+
+def _init_worker(models_dir: str, alpha: float, blas_threads: int):
+    global _worker_similarity
+    # One BLAS thread per process: the parallelism comes from the pool
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(blas_threads)
+    _worker_similarity = load_similarity(alpha, models_dir)
+
+
+def _neighbors_chunk(bounds):
+    start, stop, k = bounds
+    neighbors, scores = _worker_similarity.top_k(start, stop, k)
+    return start, neighbors, scores
+
+
+def run(k: int = 20, alpha: float = 0.5, block_size: int = None, workers: int = None,
+        models_dir: str = models_dir):
+    # Read before loading: if a new model lands meanwhile, the table is recorded as the older one's
+    version = model_version(models_dir)
+    artifacts = ModelArtifacts.load_any(models_dir)
+    n_items = artifacts.item_features.shape[1]
+    k = min(k, max(n_items - 1, 0))
+    block_size = block_size or int(np.clip(BLOCK_ENTRIES // max(n_items, 1), 1, 4096))
+    workers = workers or os.cpu_count() or 1
+    del artifacts
+
+    # Write to temporary files first so the app never maps a half-written table
+    neighbors_tmp = os.path.join(models_dir, NEIGHBORS_FILE + '.tmp')
+    scores_tmp = os.path.join(models_dir, SCORES_FILE + '.tmp')
+    neighbors_out = np.lib.format.open_memmap(neighbors_tmp, mode='w+', dtype=np.int32, shape=(n_items, k))
+    scores_out = np.lib.format.open_memmap(scores_tmp, mode='w+', dtype=np.float32, shape=(n_items, k))
+
+    chunks = [(start, min(start + block_size, n_items), k) for start in range(0, n_items, block_size)]
+    print(f"Finding {k} neighbors of {n_items} items in {len(chunks)} blocks with {workers} workers "
+          f"(alpha={alpha})...")
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(models_dir, alpha, 1)) as pool:
+        for start, neighbors, scores in pool.map(_neighbors_chunk, chunks):
+            neighbors_out[start:start + len(neighbors)] = neighbors
+            scores_out[start:start + len(scores)] = scores
+    elapsed = time.perf_counter() - t0
+
+    neighbors_out.flush()
+    scores_out.flush()
+    del neighbors_out, scores_out
+    os.replace(scores_tmp, os.path.join(models_dir, SCORES_FILE))
+    os.replace(neighbors_tmp, os.path.join(models_dir, NEIGHBORS_FILE))
+    write_version(os.path.join(models_dir, NEIGHBORS_FILE), version)
+
+    rate = n_items / elapsed if elapsed > 0 else float('inf')
+    print(f"Wrote top-{k} neighbors for {n_items} items in {elapsed:.2f}s ({rate:,.0f} items/s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the most similar books of every trained book.")
+    parser.add_argument('--k', type=int, default=20, help="neighbors kept per book")
+    parser.add_argument('--alpha', type=float, default=0.5,
+                        help="weight of the item-factor cosine against the co-rating cosine "
+                             "(1: factors only, 0: co-ratings only)")
+    parser.add_argument('--block-size', type=int, default=None,
+                        help="books per task (default: as many as fit a 2**25-entry score block)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+    if not 0 <= args.alpha <= 1:
+        parser.error("--alpha must be between 0 and 1")
+    run(k=args.k, alpha=args.alpha, block_size=args.block_size, workers=args.workers)
@@ -0,0 +1,131 @@
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Cold-start profile of app.py: what a fresh process pays to import the app's modules and to load
+# each subsystem of components.py (including the imports it defers). Measured in a child process
+# so nothing is already imported or cached. Only the standard library is imported at the top.
+
+# Imported at the top of app.py, in order; a module that is not installed is reported as missing
+APP_IMPORTS = ['streamlit', 'pandas', 'numpy', 'sqlite3', 'db', 'metrics', 'cache', 'components']
+
+# components.py loaders, in the order pages need them
+COMPONENTS = ['popular', 'database', 'models', 'search_index', 'rating_stats', 'recommender', 'top_n',
+              'fold_in', 'similar_items', 'rating_history']
+
+# What the home page needs before its first byte: the imports and the popular list
+FIRST_RENDER = ['imports', 'popular']
+
+# Seconds; checked by --budget and check_budget
+DEFAULT_BUDGET = {'imports': 5.0, 'first_render': 6.0}
+
+
+def _measure() -> dict:
+    """Runs in the child process: {name: seconds or None} for every import and component."""
+    timings = {}
+    for name in APP_IMPORTS:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            timings[f'import:{name}'] = None
+            continue
+        timings[f'import:{name}'] = time.perf_counter() - t0
+    timings['imports'] = sum(v for k, v in timings.items() if k.startswith('import:') and v is not None)
+
+    import components
+    loaders = {
+        'popular': lambda: components.load_popular(10) if os.path.exists(components.popular_path) else None,
+        'database': components.open_database,
+        'models': components.load_models,
+        'search_index': components.load_search_index,
+        'rating_stats': components.load_rating_stats,
+        'recommender': lambda: components.load_recommender(results['models']),
+        'top_n': components.load_top_n,
+        'fold_in': lambda: components.load_fold_in(results['models']),
+        'similar_items': components.load_similar_items,
+        'rating_history': components.load_rating_history,
+    }
+    results = {}
+    for name in COMPONENTS:
+        if name in ('recommender', 'fold_in') and results.get('models') is None:
+            timings[name] = None
+            continue
+        t0 = time.perf_counter()
+        try:
+            results[name] = loaders[name]()
+        except Exception as e:
+            print(f"{name}: {type(e).__name__}: {e}", file=sys.stderr)
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - t0
+    timings['first_render'] = sum(timings[k] or 0.0 for k in FIRST_RENDER)
+    timings['total'] = timings['imports'] + sum(timings[k] or 0.0 for k in COMPONENTS)
+    return timings
+
+
+def profile() -> dict:
+    """
+    Cold-start timings in seconds, measured in a fresh interpreter started
+    in the current directory: import:<module> per APP_IMPORTS entry, imports,
+    one entry per COMPONENTS loader, first_render and total. None marks a
+    module that is not installed or a component that is not available.
+    """
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'],
+                         check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def check_budget(timings: dict, budget: dict = None) -> list:
+    """Messages for every measured entry over its budget (empty when within budget)."""
+    budget = DEFAULT_BUDGET if budget is None else budget
+    return [f"{name}: {timings[name]:.3f}s > {limit:.3f}s budget" for name, limit in budget.items()
+            if timings.get(name) is not None and timings[name] > limit]
+
+
+def print_report(timings: dict, budget: dict):
+    print(f"{'stage':<24}{'seconds':>10}{'budget':>10}")
+    for name, seconds in timings.items():
+        value = "missing" if seconds is None else f"{seconds:.3f}"
+        limit = f"{budget[name]:.3f}" if name in budget else ""
+        print(f"{name:<24}{value:>10}{limit:>10}")
+
+
+def parse_budget(items: list) -> dict:
+    budget = dict(DEFAULT_BUDGET)
+    for item in items or []:
+        name, _, seconds = item.partition('=')
+        budget[name] = float(seconds)
+    return budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Profile the app's cold start: import and load time per component against a budget.")
+    parser.add_argument('--budget', nargs='*', metavar='NAME=SECONDS',
+                        help="override or add budgets, e.g. imports=2 models=1.5 (defaults: "
+                             + ", ".join(f"{k}={v:g}" for k, v in DEFAULT_BUDGET.items()) + ")")
+    parser.add_argument('--output', default=None, help="also write the timings as JSON to this path")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_measure()))
+        sys.exit(0)
+
+    budget = parse_budget(args.budget)
+    timings = profile()
+    print_report(timings, budget)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({'timings': timings, 'budget': budget}, f, indent=2)
+        print(f"Saved {args.output}")
+    violations = check_budget(timings, budget)
+    for message in violations:
+        print(f"Over budget: {message}")
+    sys.exit(1 if violations else 0)
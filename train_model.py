@@ -1,84 +1,296 @@
-import sqlite3
+import argparse
+import json
+import time
 import pandas as pd
 import numpy as np
 import scipy.sparse as sparse
 from sklearn.decomposition import NMF
 import pickle
 import os
+import db
+from als import ImplicitALS
+from artifacts import ModelArtifacts
+from book_store import BookStore
+from history_store import RatingHistory
+from id_map import save_mappings
+from ingest import RatingsData, stream_ratings, peak_memory_mb
+from rating_stats import compute_rating_stats, compute_rating_stats_from_codes, RatingStats
+from mips_index import MIPSIndex
+from search_index import SearchIndex
 
-# Connect to database
-print("Loading data for training...")
-db_path = 'database/user_rate_book.db'
-conn = sqlite3.connect(db_path)
-ratings = pd.read_sql("SELECT * FROM Ratings", conn)
-books = pd.read_sql("SELECT ISBN, `Book-Title`, `Book-Author`, `Image-URL-M` FROM Books", conn)
-conn.close()
-
-# Data Cleaning
-ratings['Book-Rating'] = pd.to_numeric(ratings['Book-Rating'], errors='coerce')
-ratings = ratings.dropna(subset=['Book-Rating'])
-ratings['ISBN'] = ratings['ISBN'].astype(str)
-books['ISBN'] = books['ISBN'].astype(str)
-
-# Filter out books and users to reduce sparsity
+# Filter out books and users to reduce sparsity: the k-core where every book and user keeps
+# at least this many ratings, and at least this many explicit (1-10) / implicit (0) ones
 min_book_ratings = 10
-book_rating_counts = ratings.groupby('ISBN')['Book-Rating'].count()
-valid_books = book_rating_counts[book_rating_counts >= min_book_ratings].index
-ratings = ratings[ratings['ISBN'].isin(valid_books)]
-
 min_user_ratings = 10
-user_rating_counts = ratings.groupby('User-ID')['Book-Rating'].count()
-valid_users = user_rating_counts[user_rating_counts >= min_user_ratings].index
-ratings = ratings[ratings['User-ID'].isin(valid_users)]
-
-print(f"Filtered dataset: {len(ratings)} ratings, {len(ratings['User-ID'].unique())} users, {len(ratings['ISBN'].unique())} books.")
-
-# Create Mappings
-users_unique = ratings['User-ID'].unique()
-user_to_index = {user_id: i for i, user_id in enumerate(users_unique)}
-index_to_user = {i: user_id for i, user_id in enumerate(users_unique)}
-
-books_unique = ratings['ISBN'].unique()
-book_to_index = {isbn: i for i, isbn in enumerate(books_unique)}
-index_to_book = {i: isbn for i, isbn in enumerate(books_unique)}
-
-# Create Sparse Matrix (Users x Books)
-row = ratings['User-ID'].map(user_to_index)
-col = ratings['ISBN'].map(book_to_index)
-data = ratings['Book-Rating'].astype(float)
-# Handle 0 ratings: Treat as small positive or keep as 0? 
-# NMF requires non-negative. 0 is fine.
-# But if we want to differentiate "rated 0" from "not rated", we might have an issue.
-# In this dataset, 0 is implicit. 1-10 is explicit.
-# Let's treat all ratings as "confidence" or "preference".
-# We'll use the raw values.
-
-user_item_matrix = sparse.csr_matrix((data, (row, col)), shape=(len(users_unique), len(books_unique)))
-
-# Train Model using NMF (Alternating Least Squares / Coordinate Descent)
-print("Training ALS (NMF) model...")
-# n_components: latent factors
-model = NMF(n_components=30, init='nndsvd', random_state=42, max_iter=200)
-user_features = model.fit_transform(user_item_matrix)
-item_features = model.components_
-
-# Save Model and Artifacts
-print("Saving model and artifacts...")
-os.makedirs('models', exist_ok=True)
-
-with open('models/nmf_model.pkl', 'wb') as f:
-    pickle.dump({'model': model, 'user_features': user_features, 'item_features': item_features}, f)
-
-with open('models/mappings.pkl', 'wb') as f:
-    pickle.dump({
-        'user_to_index': user_to_index,
-        'index_to_user': index_to_user,
-        'book_to_index': book_to_index,
-        'index_to_book': index_to_book
-    }, f)
-
-# Save book metadata
-valid_books_df = books[books['ISBN'].isin(books_unique)].drop_duplicates(subset=['ISBN'])
-valid_books_df.to_pickle('models/books_metadata.pkl')
-
-print("Model training complete.")
+min_book_explicit_ratings = 0
+min_user_explicit_ratings = 0
+min_book_implicit_ratings = 0
+min_user_implicit_ratings = 0
+
+# Latent factors and solver iterations
+n_components = 30
+nmf_max_iter = 200
+als_iterations = 15
+
+# Warm-started iterations for train_model.py --incremental
+incremental_nmf_max_iter = 20
+incremental_als_iterations = 3
+
+# Approximate MIPS index over the item factors, tuned for recall@10 >= 0.95.
+# Below mips_min_items exact BLAS scoring is faster, so no index is written.
+mips_min_items = 100000
+
+# Watermark of the ratings consumed by the current model, see incremental.py
+state_path = 'models/training_state.json'
+
+
+def load_ratings_frame(build_history: bool = True):
+    """
+    Loads the whole Ratings table into pandas (the original path).
+    Returns the filtered ratings as RatingsData, the per-book stats of all ratings,
+    the number of rows read and every user's RatingHistory (None unless build_history).
+    """
+    ratings = db.read_table('Ratings')
+    rows_read = len(ratings)
+
+    # Data Cleaning
+    ratings['Book-Rating'] = pd.to_numeric(ratings['Book-Rating'], errors='coerce')
+    ratings = ratings.dropna(subset=['Book-Rating'])
+    ratings['ISBN'] = ratings['ISBN'].astype(str)
+
+    # Per-book rating aggregates over all ratings (before filtering) for the app
+    rating_stats = compute_rating_stats(ratings)
+
+    user_codes, users_unique = pd.factorize(ratings['User-ID'])
+    book_codes, books_unique = pd.factorize(ratings['ISBN'])
+    data = RatingsData(np.asarray(users_unique), np.asarray(books_unique, dtype=object),
+                       user_codes.astype(np.int32), book_codes.astype(np.int32),
+                       ratings['Book-Rating'].to_numpy(np.float32))
+    del ratings
+    history = RatingHistory.from_data(data) if build_history else None
+    return filter_ratings(data), rating_stats, rows_read, history
+
+
+def load_ratings_streaming(chunksize: int, build_history: bool = True):
+    """
+    Streams the Ratings table in chunks into compact int32 codes; no DataFrame
+    of the whole table is ever built. Same outputs as load_ratings_frame.
+    """
+    data, rows_read = stream_ratings(chunksize)
+    rating_stats = compute_rating_stats_from_codes(data.isbns, data.book_codes, data.ratings)
+    history = RatingHistory.from_data(data) if build_history else None
+    return filter_ratings(data), rating_stats, rows_read, history
+
+
+def filter_ratings(data: RatingsData) -> RatingsData:
+    print("Filtering to the k-core of the ratings...")
+    return data.filter(**k_core_thresholds(), verbose=True)
+
+
+def k_core_thresholds() -> dict:
+    # Keyword arguments of RatingsData.filter / ingest.k_core, shared with incremental.py
+    return {'min_book_ratings': min_book_ratings, 'min_user_ratings': min_user_ratings,
+            'min_book_explicit': min_book_explicit_ratings, 'min_user_explicit': min_user_explicit_ratings,
+            'min_book_implicit': min_book_implicit_ratings, 'min_user_implicit': min_user_implicit_ratings}
+
+
+def load_books() -> pd.DataFrame:
+    books = db.read_table('Books', columns=['ISBN', 'Book-Title', 'Book-Author', 'Image-URL-M'])
+    books['ISBN'] = books['ISBN'].astype(str)
+    return books
+
+
+def build_user_item_matrix(data: RatingsData) -> sparse.csr_matrix:
+    # Handle 0 ratings: Treat as small positive or keep as 0?
+    # NMF requires non-negative. 0 is fine.
+    # But if we want to differentiate "rated 0" from "not rated", we might have an issue.
+    # In this dataset, 0 is implicit. 1-10 is explicit.
+    # Let's treat all ratings as "confidence" or "preference".
+    # We'll use the raw values.
+    return sparse.csr_matrix(
+        (data.ratings.astype(np.float64), (data.user_codes, data.book_codes)),
+        shape=(len(data.user_ids), len(data.isbns)),
+    )
+
+
+def train_nmf(user_item_matrix, warm_start=None, n_components=n_components, max_iter=None):
+    # Train Model using NMF (Coordinate Descent)
+    if warm_start is None:
+        model = NMF(n_components=n_components, init='nndsvd', random_state=42, max_iter=max_iter or nmf_max_iter)
+        user_features = model.fit_transform(user_item_matrix)
+    else:
+        # Continue from previous factors: (user_features, item_features)
+        W, H = (np.asarray(f, dtype=user_item_matrix.dtype) for f in warm_start)
+        model = NMF(n_components=W.shape[1], init='custom', random_state=42,
+                    max_iter=max_iter or incremental_nmf_max_iter)
+        user_features = model.fit_transform(user_item_matrix, W=W, H=H)
+    item_features = model.components_
+    return {'engine': 'nmf', 'model': model, 'user_features': user_features, 'item_features': item_features}
+
+
+def train_als(user_item_matrix, n_jobs=None, warm_start=None, n_components=n_components, max_iter=None,
+              verbose=True):
+    # Train Model using implicit-feedback ALS (confidence-weighted, float32)
+    if warm_start is None:
+        model = ImplicitALS(factors=n_components, iterations=max_iter or als_iterations, n_jobs=n_jobs,
+                            verbose=verbose)
+        model.fit(user_item_matrix)
+    else:
+        model = ImplicitALS(factors=warm_start[0].shape[1], iterations=max_iter or incremental_als_iterations,
+                            n_jobs=n_jobs, verbose=verbose)
+        model.fit(user_item_matrix, user_factors=warm_start[0], item_factors=warm_start[1].T)
+    return {'engine': 'als', 'params': model.get_params(),
+            'user_features': model.user_features, 'item_features': np.ascontiguousarray(model.item_features)}
+
+
+ENGINES = {'nmf': train_nmf, 'als': train_als}
+
+
+def _staged(path: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.staged{ext}"
+
+
+def save_artifacts(model_data, user_item_matrix, users_unique, books_unique, books, rating_stats, state,
+                   history=None):
+    """
+    Writes every artifact of a model version. The legacy files are staged next
+    to their targets first and only renamed into place (os.replace, atomic per
+    file) once all of them, and the versioned copy the app serves from, are
+    written, so a failed run leaves the previous version intact. The training
+    state goes last: its watermark only advances with the model. history (all
+    users' ratings for My Ratings, see history_store.py) is written with them.
+    """
+    os.makedirs('models', exist_ok=True)
+    staged = []
+
+    def stage(path):
+        staged.append(path)
+        return _staged(path)
+
+    with open(stage('models/nmf_model.pkl'), 'wb') as f:
+        pickle.dump(model_data, f)
+
+    # Training matrix, used by the app to mask books the user has already rated
+    sparse.save_npz(stage('models/user_item_matrix.npz'), user_item_matrix)
+
+    if len(books_unique) >= mips_min_items:
+        mips = MIPSIndex.build(model_data['item_features'])
+        mips.tune(model_data['user_features'], model_data['item_features'])
+        mips.save(stage('models/mips_index.npz'))
+        print(f"Built MIPS index: {mips.n_lists} lists, n_probe={mips.n_probe}")
+    else:
+        # An index (and its version) left by an earlier run would only slow serving down
+        for path in ('models/mips_index.npz', 'models/mips_index.npz.version'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # User-ID / ISBN of every row / column, loaded as IdMaps (id_map.py)
+    save_mappings(stage('models/mappings.npz'), users_unique, books_unique)
+
+    # Save book metadata
+    valid_books_df = books[books['ISBN'].isin(books_unique)].drop_duplicates(subset=['ISBN'])
+    valid_books_df.to_pickle(stage('models/books_metadata.pkl'))
+
+    # Metadata aligned to the item index for O(1) lookups in the app
+    book_store = BookStore.build(valid_books_df, books_unique)
+    book_store.save(stage('models/book_store.pkl'))
+
+    RatingStats.save(rating_stats, stage('models/rating_stats.pkl'))
+
+    # Search index over titles and authors, ranked by weighted score
+    popularity = RatingStats(**rating_stats).scores_for(book_store.frame['ISBN'])
+    SearchIndex.build(book_store.frame, popularity).save(stage('models/search_index.npz'))
+
+    # Memory-mapped copy for serving (models/artifacts/<version>, see artifacts.py), with the
+    # metadata of every book so My Ratings can list books the k-core filtered out
+    version = ModelArtifacts.save(model_data, user_item_matrix, users_unique, book_store, state,
+                                  catalogue=BookStore(books.drop_duplicates(subset=['ISBN'])))
+    state = {**state, 'artifacts_version': version}
+    if len(books_unique) >= mips_min_items:
+        # The index loads only while this is the current version (components.is_current)
+        with open(stage('models/mips_index.npz.version'), 'w') as f:
+            f.write(version)
+
+    with open(stage(state_path), 'w') as f:
+        json.dump(state, f, indent=2)
+
+    for path in staged:
+        os.replace(_staged(path), path)
+    if history is not None:
+        history.save('models')
+    if os.path.exists('models/mappings.pkl'):
+        # Dict mappings of older runs; superseded by mappings.npz
+        os.remove('models/mappings.pkl')
+
+
+def load_state() -> dict:
+    """Training state of the current model, or None before the first run that records it."""
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as f:
+        return json.load(f)
+
+
+def read_watermark() -> int:
+    """Highest rowid in Ratings: rows up to it are covered by the model being trained."""
+    return int(db.fetch_scalar('SELECT MAX(rowid) FROM Ratings', label='watermark') or 0)
+
+
+def main(args):
+    if args.incremental:
+        from incremental import train_incremental
+        return train_incremental(args)
+
+    t0 = time.perf_counter()
+    watermark = read_watermark()
+
+    # Load data
+    print("Loading data for training...")
+    if args.ingest == 'stream':
+        data, rating_stats, rows_read, history = load_ratings_streaming(args.chunk_size)
+    else:
+        data, rating_stats, rows_read, history = load_ratings_frame()
+    books = load_books()
+    load_seconds = time.perf_counter() - t0
+
+    print(f"Filtered dataset: {len(data)} ratings, {len(data.user_ids)} users, {len(data.isbns)} books.")
+
+    # Create Mappings (item i <-> books_unique[i], user u <-> users_unique[u])
+    users_unique = data.user_ids
+    books_unique = data.isbns
+
+    # Create Sparse Matrix (Users x Books)
+    user_item_matrix = build_user_item_matrix(data)
+    del data
+
+    print(f"Training {args.engine.upper()} model...")
+    t_fit = time.perf_counter()
+    model_data = ENGINES[args.engine](user_item_matrix)
+    print(f"Trained in {time.perf_counter() - t_fit:.2f}s.")
+    train_seconds = time.perf_counter() - t0
+
+    # Save Model and Artifacts
+    print("Saving model and artifacts...")
+    state = {'mode': 'full', 'engine': args.engine, 'watermark': watermark, 'rows_read': rows_read,
+             'train_seconds': train_seconds, 'full_train_seconds': train_seconds,
+             'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    save_artifacts(model_data, user_item_matrix, users_unique, books_unique, books, rating_stats, state,
+                   history=history)
+
+    print("Model training complete.")
+    print(f"Ingestion ({args.ingest}): {rows_read:,} rows in {load_seconds:.2f}s "
+          f"({rows_read / load_seconds:,.0f} rows/s). Total: {time.perf_counter() - t0:.2f}s. "
+          f"Peak memory: {peak_memory_mb():,.0f} MB.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the recommendation model and build the app artifacts.")
+    parser.add_argument('--ingest', choices=['pandas', 'stream'], default='pandas',
+                        help="'stream' reads Ratings in chunks into compact arrays (bounded memory)")
+    parser.add_argument('--chunk-size', type=int, default=500000, help="rows per chunk for --ingest stream")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='nmf',
+                        help="'nmf': sklearn NMF; 'als': implicit-feedback ALS with confidence weights")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only ingest ratings added since the last run and warm-start the current model")
+    main(parser.parse_args())